@@ -0,0 +1,189 @@
+"""
+Bounded-length digests of business context for LLM prompts.
+
+business_context.context_text is free-form account notes, some of them
+thousands of tokens long, and it used to be pasted whole into every
+explanation, next-action and pitch prompt. Before a prompt is built the text
+is reduced to a digest of at most max_tokens:
+
+- text already within the budget is used unchanged
+- otherwise sentences are ranked by how many of the note's recurring terms
+  they contain (a SumBasic-style frequency score), with a boost for concrete
+  facts (amounts, percentages, dates) and for the opening sentence
+- the best sentences are taken greedily until the budget is spent; after each
+  pick the weight of its terms is halved so the digest doesn't repeat itself
+- the chosen sentences are kept in their original order
+
+Digests are deterministic, so prompts built from them still hit the LLM
+response cache. They are cached per (account, product) together with a hash of
+the source text, and recomputed when the text changes.
+"""
+
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+from backend.history import count_tokens
+
+# Sentence ends, or line breaks (notes are often bullet lists without punctuation)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9$€£•\-*])|\s*\n+\s*")
+_BULLET_PREFIX = re.compile(r"^\s*(?:[•\-*]|\d+[.)])\s+")
+_WORD = re.compile(r"[a-z0-9][a-z0-9'&-]*")
+# "$120k", "35%", "Q3", "2024", "March": the specifics an LLM can't make up
+_FACT = re.compile(
+    r"[$€£]\s?\d|\d+(?:\.\d+)?\s?%|\bq[1-4]\b|\b(?:19|20)\d{2}\b|"
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b\.?\s*\d",
+    re.I,
+)
+_STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be been before being below between both but by can could did
+do does doing down during each few for from further had has have having he her here hers him his how i if in into is it
+its itself just me more most my no nor not now of off on once only or other our ours out over own same she should so some
+such than that the their theirs them then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours
+""".split())
+
+FACT_BOOST = 1.5
+LEAD_BOOST = 1.25
+REDUNDANCY_DECAY = 0.5
+
+
+def source_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in _SENTENCE_BOUNDARY.split(text.strip()):
+        part = " ".join(_BULLET_PREFIX.sub("", part).split())
+        if part:
+            sentences.append(part)
+    return sentences
+
+
+def _terms(sentence: str) -> List[str]:
+    return [word for word in _WORD.findall(sentence.lower()) if word not in _STOPWORDS and len(word) > 1]
+
+
+def _truncate(text: str, max_tokens: int, model: str) -> str:
+    """Cut text word by word until it fits, as digest_assistant_message does."""
+    words = text.split()[:max_tokens]
+    while words and count_tokens(" ".join(words) + " …", model) > max_tokens:
+        words.pop()
+    return " ".join(words) + " …" if words else ""
+
+
+def digest_context(text: str, max_tokens: int = 150, model: str = "gpt-4") -> str:
+    """Extractive digest of text in at most max_tokens tokens (text itself if it already fits)."""
+    text = text or ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    # Notes pasted together often repeat sentences verbatim; one copy is enough
+    sentences = list(dict.fromkeys(split_sentences(text)))
+    terms = [_terms(sentence) for sentence in sentences]
+    frequency = Counter(term for sentence_terms in terms for term in set(sentence_terms))
+    total = sum(frequency.values()) or 1
+    weight = {term: count / total for term, count in frequency.items()}
+    lengths = [count_tokens(sentence, model) for sentence in sentences]
+    boosts = [
+        (FACT_BOOST if _FACT.search(sentence) else 1.0) * (LEAD_BOOST if index == 0 else 1.0)
+        for index, sentence in enumerate(sentences)
+    ]
+
+    chosen, remaining = set(), max_tokens
+    while True:
+        best, best_score = None, 0.0
+        for index, sentence_terms in enumerate(terms):
+            if index in chosen or lengths[index] > remaining or not sentence_terms:
+                continue
+            unique = set(sentence_terms)
+            # Mean term weight, so long sentences don't win just by being long
+            score = sum(weight[term] for term in unique) / len(unique) ** 0.5 * boosts[index]
+            if score > best_score:
+                best, best_score = index, score
+        if best is None:
+            break
+        chosen.add(best)
+        remaining -= lengths[best] + 1
+        for term in set(terms[best]):
+            weight[term] *= REDUNDANCY_DECAY
+
+    if not chosen:
+        # No sentence fits on its own (one long run-on note): keep its opening instead
+        return _truncate(" ".join(sentences) or text, max_tokens, model)
+    return " ".join(sentences[index] for index in sorted(chosen))
+
+
+class ContextDigester:
+    """
+    digest_context() with an LRU of digests keyed by (account, product) and validated
+    against a hash of the source text, so a changed note is re-digested on its next use.
+    """
+
+    def __init__(self, max_tokens: int = 150, model: str = "gpt-4", max_entries: int = 50_000):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[str, str, int, int]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._prompts = 0
+        self._digested_prompts = 0
+        self._tokens_before = 0
+        self._tokens_after = 0
+
+    def digest(self, text: str, key: Optional[Hashable] = None) -> Tuple[str, dict]:
+        """
+        (digest, report) for one prompt's context; report has tokens_before, tokens_after
+        and tokens_saved. key identifies the note (e.g. (account_id, product_id)); without
+        one the source hash is the key.
+        """
+        text = text or ""
+        text_hash = source_hash(text)
+        key = text_hash if key is None else key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == text_hash:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            else:
+                if entry is not None:
+                    self._invalidations += 1
+                entry = None
+        if entry is None:
+            digest = digest_context(text, self.max_tokens, self.model)
+            entry = (text_hash, digest, count_tokens(text, self.model), count_tokens(digest, self.model))
+            with self._lock:
+                self._misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        _, digest, tokens_before, tokens_after = entry
+        with self._lock:
+            self._prompts += 1
+            self._digested_prompts += tokens_after < tokens_before
+            self._tokens_before += tokens_before
+            self._tokens_after += tokens_after
+        return digest, {"tokens_before": tokens_before, "tokens_after": tokens_after, "tokens_saved": tokens_before - tokens_after}
+
+    def stats(self):
+        with self._lock:
+            saved = self._tokens_before - self._tokens_after
+            return {
+                "max_tokens": self.max_tokens,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "prompts": self._prompts,
+                "digested_prompts": self._digested_prompts,
+                "tokens_before": self._tokens_before,
+                "tokens_after": self._tokens_after,
+                "tokens_saved": saved,
+                "avg_tokens_saved_per_prompt": saved / self._prompts if self._prompts else 0.0,
+            }
@@ -0,0 +1,267 @@
+"""
+Snowflake connection pooling for the backend.
+
+Connections are expensive to open (a full login handshake each time), so the
+backend keeps a small pool of authenticated sessions and hands them out to the
+query helpers in main.py.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+def arrow_unavailable(error: BaseException) -> bool:
+    """True if a fetch_arrow_batches() error means the connector can't produce Arrow (so fall back to fetchmany())."""
+    # The connector raises when the pandas/pyarrow extras aren't installed
+    return isinstance(error, (ImportError, NotImplementedError, AttributeError)) or "pyarrow" in str(error).lower()
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+class SnowflakePool:
+    """
+    Thread-safe pool of Snowflake connections.
+
+    - min_size connections are opened eagerly by open() and never evicted for idleness
+    - up to max_size connections are opened on demand
+    - connections idle longer than idle_timeout (above min_size) are closed
+    - connections idle longer than health_check_interval are pinged before reuse
+    """
+
+    def __init__(
+        self,
+        connect: Callable,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        acquire_timeout: float = 30.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._in_use = 0
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._created = 0
+        self._evicted = 0
+        self._failed_health_checks = 0
+        self._acquire_count = 0
+        self._acquire_total_seconds = 0.0
+        self._acquire_max_seconds = 0.0
+
+    @property
+    def size(self):
+        return len(self._idle) + self._in_use + self._opening
+
+    def open(self):
+        """Open min_size connections up front so the first requests skip the login."""
+        with self._lock:
+            self._closed = False
+            missing = self.min_size - self.size
+            self._opening += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                entry = _PooledConnection(self._connect())
+            except Exception:
+                with self._lock:
+                    self._opening -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._opening -= 1
+                self._created += 1
+                self._idle.append(entry)
+                self._lock.notify()
+
+    def close(self):
+        """Close every idle connection; in-use connections are closed when released."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+        for entry in idle:
+            self._close_quietly(entry)
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Borrow a connection, opening a new one if the pool has room."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            entry = None
+            must_open = False
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                stale = self._evict_idle_locked()
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use += 1
+                elif self.size < self.max_size:
+                    self._opening += 1
+                    must_open = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"Timed out after {timeout:.1f}s waiting for a Snowflake connection")
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                    continue
+
+            for old in stale:
+                self._close_quietly(old)
+            if must_open:
+                try:
+                    entry = _PooledConnection(self._connect())
+                except Exception:
+                    with self._lock:
+                        self._opening -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use += 1
+                    self._created += 1
+            elif not self._is_healthy(entry):
+                with self._lock:
+                    self._in_use -= 1
+                    self._failed_health_checks += 1
+                    self._lock.notify()
+                self._close_quietly(entry)
+                continue
+
+            self._record_acquire(time.monotonic() - started)
+            return entry
+
+    def release(self, entry: _PooledConnection, discard: bool = False):
+        """Return a borrowed connection; discarded connections are closed instead of reused."""
+        entry.last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            keep = not (discard or self._closed)
+            if keep:
+                self._idle.append(entry)
+            self._lock.notify()
+        if not keep:
+            self._close_quietly(entry)
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a raw Snowflake connection from the pool."""
+        entry = self.acquire()
+        discard = False
+        try:
+            yield entry.conn
+        except Exception:
+            discard = self._looks_broken(entry.conn)
+            raise
+        finally:
+            self.release(entry, discard=discard)
+
+    def evict_idle(self):
+        """Close idle connections that have outlived idle_timeout."""
+        with self._lock:
+            stale = self._evict_idle_locked()
+        for entry in stale:
+            self._close_quietly(entry)
+
+    def metrics(self):
+        with self._lock:
+            count = self._acquire_count
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self._created,
+                "evicted": self._evicted,
+                "failed_health_checks": self._failed_health_checks,
+                "acquire_count": count,
+                "acquire_latency_avg_ms": (self._acquire_total_seconds / count * 1000) if count else 0.0,
+                "acquire_latency_max_ms": self._acquire_max_seconds * 1000,
+            }
+
+    def _evict_idle_locked(self):
+        if self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        keep = deque()
+        stale = []
+        # Idle deque is LIFO from the right, so the oldest connections sit on the left
+        while self._idle:
+            entry = self._idle.popleft()
+            total = len(self._idle) + len(keep) + self._in_use + self._opening + 1
+            if now - entry.last_used > self.idle_timeout and total > self.min_size:
+                stale.append(entry)
+            else:
+                keep.append(entry)
+        self._idle = keep
+        self._evicted += len(stale)
+        return stale
+
+    def _is_healthy(self, entry: _PooledConnection):
+        now = time.monotonic()
+        try:
+            if entry.conn.is_closed():
+                return False
+            if now - entry.last_checked < self.health_check_interval:
+                return True
+            cur = entry.conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            entry.last_checked = now
+            return True
+        except Exception:
+            return False
+
+    def _looks_broken(self, conn):
+        try:
+            return conn.is_closed()
+        except Exception:
+            return True
+
+    def _record_acquire(self, seconds):
+        with self._lock:
+            self._acquire_count += 1
+            self._acquire_total_seconds += seconds
+            self._acquire_max_seconds = max(self._acquire_max_seconds, seconds)
+
+    @staticmethod
+    def _close_quietly(entry: _PooledConnection):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,225 @@
+"""
+Streaming bulk export of model_scores.
+
+Rows are read from Snowflake in Arrow batches (fetch_arrow_batches) and each
+batch is encoded and sent before the next one is fetched, so a worker holds
+one batch at a time whatever the size of the export. Without pyarrow the
+connector's fetchmany() is used instead and only NDJSON and CSV are
+available.
+
+The optional top-3 SHAP columns are joined in the export query itself, so
+Snowflake does the pivot and no per-row lookups are made.
+"""
+
+import csv
+import io
+import itertools
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from backend.db import arrow_unavailable
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; NDJSON and CSV fall back to fetchmany()
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+SCORE_COLUMNS = ["user_id", "account_id", "account_name", "product_id", "product_name", "opportunity_type", "segment", "territory", "score"]
+SHAP_COLUMNS = [f"shap_{rank}_{part}" for rank in (1, 2, 3) for part in ("feature", "value")]
+FILTER_COLUMNS = ("user_id", "opportunity_type", "product_id", "segment", "territory")
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def export_columns(include_shap: bool) -> List[str]:
+    return SCORE_COLUMNS + (SHAP_COLUMNS if include_shap else [])
+
+
+def format_available(fmt: str) -> bool:
+    return fmt != "parquet" or pq is not None
+
+
+def build_export_query(filters: Dict[str, Optional[str]], include_shap: bool):
+    """(query, params) selecting export_columns(include_shap) for the model_scores rows matching filters."""
+    conditions, params = [], []
+    for column in FILTER_COLUMNS:
+        value = filters.get(column)
+        if value:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    select = ", ".join(f"s.{column}" for column in SCORE_COLUMNS)
+    if not include_shap:
+        query = f"""
+            SELECT {select}
+            FROM model_scores s
+            {where}
+            ORDER BY s.user_id, s.opportunity_type, s.score DESC
+        """
+        return query, tuple(params)
+    shap_select = ", ".join(
+        f"h{rank}.feature_name AS shap_{rank}_feature, h{rank}.shap_value AS shap_{rank}_value" for rank in (1, 2, 3)
+    )
+    shap_joins = "\n".join(
+        f"LEFT JOIN top_shap h{rank} ON h{rank}.account_id = s.account_id AND h{rank}.product_id = s.product_id AND h{rank}.shap_rank = {rank}"
+        for rank in (1, 2, 3)
+    )
+    query = f"""
+        WITH scores AS (
+            SELECT {", ".join(SCORE_COLUMNS)}
+            FROM model_scores
+            {where}
+        ),
+        top_shap AS (
+            SELECT v.account_id, v.product_id, v.feature_name, v.shap_value,
+                   ROW_NUMBER() OVER (PARTITION BY v.account_id, v.product_id ORDER BY ABS(v.shap_value) DESC) AS shap_rank
+            FROM shap_values v
+            WHERE (v.account_id, v.product_id) IN (SELECT account_id, product_id FROM scores)
+            QUALIFY shap_rank <= 3
+        )
+        SELECT {select}, {shap_select}
+        FROM scores s
+        {shap_joins}
+        ORDER BY s.user_id, s.opportunity_type, s.score DESC
+    """
+    return query, tuple(params)
+
+
+def _arrow_schema(columns):
+    numeric = {"score"} | {column for column in columns if column.endswith("_value")}
+    return pa.schema([(column, pa.float64() if column in numeric else pa.string()) for column in columns])
+
+
+def iter_batches(cursor, query, params, columns, batch_rows: int = 50_000) -> Iterator:
+    """
+    Execute the export query and yield it in batches: pyarrow Tables (named columns, fixed schema)
+    when the connector supports Arrow, otherwise lists of row tuples.
+    """
+    cursor.execute(query, params)
+    if pa is not None:
+        try:
+            batches = iter(cursor.fetch_arrow_batches())
+            first = next(batches, None)
+        except Exception as e:
+            if not arrow_unavailable(e):
+                raise
+        else:
+            schema = _arrow_schema(columns)
+            # Snowflake names Arrow columns in upper case and may pick a different numeric type per batch
+            for table in itertools.chain([first] if first is not None else [], batches):
+                yield table.rename_columns(columns).cast(schema)
+            return
+        cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def _row_tuples(batch):
+    if pa is not None and isinstance(batch, pa.Table):
+        return zip(*(column.to_pylist() for column in batch.columns))
+    return batch
+
+
+def encode_ndjson(batches, columns) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in _row_tuples(batch)]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def encode_csv(batches, columns) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(_row_tuples(batch))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes to the response instead of keeping them."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def encode_parquet(batches, columns) -> Iterator[bytes]:
+    """One Parquet row group per batch, streamed as it is written; the footer comes last."""
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for batch in batches:
+            if not isinstance(batch, pa.Table):
+                batch = pa.Table.from_pylist([dict(zip(columns, row)) for row in batch], schema=schema)
+            writer.write_table(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS: Dict[str, Callable] = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+
+
+def stream_export(connect: Callable[[], object], fmt: str, filters: Dict[str, Optional[str]], include_shap: bool = False,
+                  batch_rows: int = 50_000) -> Iterator[bytes]:
+    """
+    Encoded export, chunk by chunk. Uses its own connection (closed at the end) so a
+    long export doesn't hold one of the pool's connections.
+    """
+    columns = export_columns(include_shap)
+    query, params = build_export_query(filters, include_shap)
+    started = time.monotonic()
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows if pa is not None and isinstance(batch, pa.Table) else len(batch)
+            yield batch
+
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        try:
+            yield from ENCODERS[fmt](counted(iter_batches(cursor, query, params, columns, batch_rows)), columns)
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+        logger.info("export format=%s filters=%s shap=%s rows=%d in %.1fs", fmt, filters, include_shap, rows, time.monotonic() - started)
@@ -0,0 +1,147 @@
+"""
+Token-budgeted compaction of chat history.
+
+The frontend sends the last messages of the conversation with every chat
+request, and assistant replies can be long bullet lists. Before the history is
+sent to the intent classifier it is compacted: user turns are kept verbatim,
+assistant turns are reduced to a short digest (the accounts and products they
+listed), and the oldest turns are dropped once the token budget is spent.
+
+Tokens are counted locally with tiktoken when it is installed, otherwise with
+a word/punctuation approximation of the GPT tokenizer.
+"""
+
+import re
+import threading
+from typing import List, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional; the approximation is close enough for budgeting
+    tiktoken = None
+
+# Per-message overhead of the chat format (role and separators), as documented for gpt-4
+MESSAGE_OVERHEAD_TOKENS = 4
+_APPROX_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+# "• Account A (Product P, Score: ...": the name and product of each listed row
+_BULLET_PATTERN = re.compile(r"^\s*•\s*(?P<account>[^(\n]+?)\s*\((?P<product>[^,)\n]+)", re.M)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding(model):
+    global _encoding
+    if tiktoken is None:
+        return None
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Number of tokens in text for the given model's tokenizer (approximate without tiktoken)."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(_APPROX_TOKEN_PATTERN.findall(text))
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-4") -> int:
+    return sum(count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def digest_assistant_message(content: str, max_tokens: int = 40, model: str = "gpt-4") -> str:
+    """
+    Short stand-in for an assistant reply: the accounts and products it listed, or
+    its opening words. Follow-ups like "what about those?" only need to know what was shown.
+    """
+    content = (content or "").strip()
+    rows = [f"{match.group('account').strip()} ({match.group('product').strip()})" for match in _BULLET_PATTERN.finditer(content)]
+    if rows:
+        digest = f"[Listed {len(rows)}: " + ", ".join(rows) + "]"
+    else:
+        digest = " ".join(content.split())
+    if count_tokens(digest, model) <= max_tokens:
+        return digest
+    # Trim word by word from a generous cut until it fits
+    words = digest.split()[:max_tokens]
+    while words and count_tokens(" ".join(words) + " …", model) > max_tokens:
+        words.pop()
+    return " ".join(words) + " …"
+
+
+def compact_history(
+    history: List[dict],
+    budget_tokens: int = 500,
+    assistant_digest_tokens: int = 40,
+    model: str = "gpt-4",
+) -> Tuple[List[dict], dict]:
+    """
+    Compact chat history to fit budget_tokens.
+
+    Returns (messages, report). messages keeps the newest turns that fit, in
+    order, with assistant turns digested. report has the token counts before
+    and after and the number of prompt tokens saved.
+    """
+    original = [
+        {"role": message["role"], "content": message.get("content") or ""}
+        for message in history or []
+        if message.get("role") in ("user", "assistant")
+    ]
+    compacted = []
+    used = 0
+    for message in reversed(original):
+        content = message["content"]
+        if message["role"] == "assistant":
+            content = digest_assistant_message(content, assistant_digest_tokens, model)
+        tokens = count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget_tokens:
+            break
+        compacted.append({"role": message["role"], "content": content})
+        used += tokens
+    compacted.reverse()
+
+    original_tokens = count_message_tokens(original, model)
+    report = {
+        "messages_in": len(original),
+        "messages_kept": len(compacted),
+        "tokens_before": original_tokens,
+        "tokens_after": used,
+        "tokens_saved": original_tokens - used,
+    }
+    return compacted, report
+
+
+class HistoryStats:
+    """Running totals of history compaction, exposed on the admin endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, report: dict):
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += report["tokens_before"]
+            self.tokens_after += report["tokens_after"]
+
+    def snapshot(self):
+        with self._lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                "requests": self.requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": saved,
+                "avg_tokens_saved": saved / self.requests if self.requests else 0.0,
+                "tokenizer": "tiktoken" if tiktoken is not None else "approximate",
+            }
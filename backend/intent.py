@@ -0,0 +1,197 @@
+"""
+Local intent and entity extraction for /api/chat.
+
+A keyword/pattern classifier that runs before the LLM classifier. When it is
+confident, the chat endpoint skips the LLM call. Every decision is recorded
+with its confidence so the fast-path hit rate and its agreement with the LLM
+can be measured.
+"""
+
+import re
+import threading
+from typing import Optional, Tuple
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+}
+MAX_TOP_N = 20
+
+OPPORTUNITY_TYPE_PATTERNS = [
+    ("cross_sell", re.compile(r"\bcross[\s-]?sell", re.I)),
+    ("upsell", re.compile(r"\bup[\s-]?sell", re.I)),
+    ("prospect", re.compile(r"\bprospect", re.I)),
+]
+PITCH_PATTERN = re.compile(r"\b(pitch|sales email|outreach email)\b", re.I)
+SUMMARY_PATTERN = re.compile(r"\b(summar\w*|overview|recap)\b", re.I)
+CHURN_PATTERN = re.compile(r"\b(churn\w*|at[\s-]risk|attrition)\b", re.I)
+GENERIC_OPPORTUNITY_PATTERN = re.compile(r"\b(opportunit\w*|opps?|likely to (buy|purchase))\b", re.I)
+# Messages that lean on earlier turns ("what about those?") need the LLM, which sees the history
+FOLLOW_UP_PATTERN = re.compile(r"\b(those|these|them|it|that one|same|what about|how about|instead|more)\b", re.I)
+
+TOP_N_PATTERN = re.compile(r"\b(?:top|best|first|show(?: me)?)\s+(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")\b", re.I)
+LEADING_N_PATTERN = re.compile(r"\b(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")\s+(?:cross|up|prospect|churn|account|opp|opportunit)", re.I)
+PITCH_ENTITIES_PATTERN = re.compile(
+    r"\bpitch(?:\s+email)?\s+(?:for|to)\s+(?P<account>.+?)\s+(?:for|about|on)\s+(?P<product>.+?)\s*[.?!]*$", re.I
+)
+# Entity names are written with a capital or digit ("Account Y", "Product 12"), which keeps "accounts with" out
+ACCOUNT_PATTERN = re.compile(r"\b[Aa]ccount\s+([A-Z0-9][\w&.-]*)")
+PRODUCT_PATTERN = re.compile(r"\b[Pp]roduct\s+([A-Z0-9][\w&.-]*)")
+SEGMENT_PATTERN = re.compile(r"\b(?:in|for) (?:the )?([\w-]+) (?:segment|industry|vertical)\b", re.I)
+TERRITORY_PATTERN = re.compile(r"\b(?:in|for) (?:the )?([\w-]+) (?:territory|region)\b", re.I)
+
+
+def _parse_number(text):
+    text = text.lower()
+    value = NUMBER_WORDS.get(text) or int(text)
+    return max(1, min(value, MAX_TOP_N))
+
+
+def _extract_entities(message):
+    entities = {}
+    match = TOP_N_PATTERN.search(message) or LEADING_N_PATTERN.search(message)
+    if match:
+        entities["top_n"] = _parse_number(match.group(1))
+    match = ACCOUNT_PATTERN.search(message)
+    if match:
+        entities["account"] = f"Account {match.group(1).rstrip('.?!,')}"
+    match = PRODUCT_PATTERN.search(message)
+    if match:
+        entities["product"] = f"Product {match.group(1).rstrip('.?!,')}"
+    match = SEGMENT_PATTERN.search(message)
+    if match:
+        entities["segment"] = match.group(1).lower()
+    match = TERRITORY_PATTERN.search(message)
+    if match and match.group(1).lower() not in ("my", "our"):
+        entities["territory"] = match.group(1)
+    return entities
+
+
+def extract_intent(message: str) -> Tuple[Optional[dict], float]:
+    """
+    Classify a chat message locally.
+
+    Returns (intent_data, confidence). intent_data has the same shape as the
+    LLM classifier's JSON (intent, opportunity_type, product, segment, ...),
+    with only the fields that were found. Confidence is in [0, 1].
+    """
+    message = (message or "").strip()
+    if not message:
+        return None, 0.0
+
+    opportunity_types = [name for name, pattern in OPPORTUNITY_TYPE_PATTERNS if pattern.search(message)]
+    is_pitch = bool(PITCH_PATTERN.search(message))
+    is_summary = bool(SUMMARY_PATTERN.search(message))
+    is_churn = bool(CHURN_PATTERN.search(message))
+    entities = _extract_entities(message)
+
+    if is_pitch:
+        intent_data = {"intent": "personalized_pitch"}
+        match = PITCH_ENTITIES_PATTERN.search(message)
+        if match:
+            intent_data["account"] = match.group("account").strip()
+            intent_data["product"] = match.group("product").strip()
+        else:
+            intent_data.update({k: entities[k] for k in ("account", "product") if k in entities})
+        confidence = 0.95 if "account" in intent_data and "product" in intent_data else 0.6
+    elif is_summary:
+        intent_data = {"intent": "summary"}
+        confidence = 0.9
+    elif is_churn and not opportunity_types:
+        intent_data = {"intent": "churn_risk"}
+        intent_data.update({k: entities[k] for k in ("top_n", "segment", "territory") if k in entities})
+        confidence = 0.9
+    elif len(opportunity_types) == 1 and not is_churn:
+        intent_data = {"intent": "top_opportunities", "opportunity_type": opportunity_types[0], **entities}
+        confidence = 0.9
+    elif GENERIC_OPPORTUNITY_PATTERN.search(message) and not is_churn and not opportunity_types:
+        # "top opportunities" without a type: cross-sell is the usual reading, but let the LLM decide
+        intent_data = {"intent": "top_opportunities", "opportunity_type": "cross_sell", **entities}
+        confidence = 0.6
+    elif opportunity_types or is_churn:
+        # Several intents mentioned at once
+        return None, 0.3
+    else:
+        return None, 0.0
+
+    if FOLLOW_UP_PATTERN.search(message):
+        confidence = min(confidence, 0.5)
+    return intent_data, confidence
+
+
+PROPER_NOUN_PATTERN = re.compile(r"\b[A-Z0-9][\w&.-]*")
+
+
+def message_signature(message: str) -> tuple:
+    """
+    The parts of a message that change what a classifier should return: detected
+    intent keywords, extracted entities, and capitalized names or numbers.
+    Two messages with different signatures must not share a cached parse.
+    """
+    message = (message or "").strip()
+    intent_data, _ = extract_intent(message)
+    keywords = tuple(name for name, pattern in OPPORTUNITY_TYPE_PATTERNS if pattern.search(message)) + tuple(
+        flag for flag, pattern in (("pitch", PITCH_PATTERN), ("summary", SUMMARY_PATTERN), ("churn", CHURN_PATTERN))
+        if pattern.search(message)
+    )
+    entities = dict(_extract_entities(message))
+    if intent_data:
+        entities.update({k: v for k, v in intent_data.items() if k in ("account", "product")})
+    # The first word is capitalized anyway; later capitalized words are likely account/product names
+    names = tuple(sorted({match.group().rstrip(".?!,").lower() for match in PROPER_NOUN_PATTERN.finditer(message)
+                          if match.start() > 0 and not match.group().isdigit()}))
+    return keywords, tuple(sorted(entities.items())), names
+
+
+def intents_agree(local: Optional[dict], llm: Optional[dict]) -> bool:
+    """Whether the local and LLM classifications route to the same place."""
+    if not local or not llm:
+        return False
+    if local.get("intent") != llm.get("intent"):
+        return False
+    if local.get("intent") == "top_opportunities":
+        return local.get("opportunity_type") == llm.get("opportunity_type", "cross_sell")
+    return True
+
+
+class IntentStats:
+    """Counters for intent classification decisions, exposed on the admin endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.similarity_cache = 0
+        self.llm = 0
+        self.compared = 0
+        self.agreed = 0
+
+    def record(self, source: str, agreed: Optional[bool] = None):
+        with self._lock:
+            if source == "fast_path":
+                self.fast_path += 1
+            elif source == "similarity_cache":
+                self.similarity_cache += 1
+            else:
+                self.llm += 1
+            if agreed is not None:
+                self.compared += 1
+                self.agreed += int(agreed)
+
+    def record_comparison(self, agreed: bool):
+        with self._lock:
+            self.compared += 1
+            self.agreed += int(agreed)
+
+    def snapshot(self):
+        with self._lock:
+            total = self.fast_path + self.similarity_cache + self.llm
+            return {
+                "messages": total,
+                "fast_path": self.fast_path,
+                "similarity_cache": self.similarity_cache,
+                "llm": self.llm,
+                "fast_path_rate": self.fast_path / total if total else 0.0,
+                "similarity_cache_rate": self.similarity_cache / total if total else 0.0,
+                "compared_with_llm": self.compared,
+                "agreement_rate": self.agreed / self.compared if self.compared else None,
+            }
@@ -0,0 +1,214 @@
+"""
+Near-duplicate cache for chat intent classification.
+
+Reps send many almost-identical questions ("top 5 cross sell", "show my top
+five cross-sell opps"). This cache stores normalized message -> parsed
+intent_data and returns the stored parse for a new message whose character
+n-gram TF-IDF cosine similarity to a cached message clears a threshold.
+
+Everything runs offline with NumPy. Candidates are found with MinHash
+locality-sensitive hashing, so a lookup only scores a handful of entries even
+with hundreds of thousands cached. A message signature (intent keywords,
+entities, names) must also match exactly, so "top 5" never answers "top 10".
+"""
+
+import math
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from backend.intent import FOLLOW_UP_PATTERN, NUMBER_WORDS, message_signature
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+# Intent keywords and entities are checked through the message signature, so filler
+# words can be dropped aggressively to make paraphrases look alike
+_STOPWORDS = {
+    "a", "an", "the", "me", "my", "our", "i", "please", "can", "could", "you", "show", "give", "list",
+    "what", "which", "are", "is", "of", "and", "to", "for", "all", "opportunities", "accounts",
+}
+_SYNONYMS = {"opps": "opportunities", "opp": "opportunities", "opportunity": "opportunities", "crosssell": "cross sell"}
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, unify number words, hyphenation and common synonyms, and drop filler words."""
+    text = re.sub(r"[-_/]", " ", (message or "").lower())
+    words = []
+    for word in re.findall(r"[a-z0-9&.]+", text):
+        word = word.strip(".")
+        word = str(NUMBER_WORDS.get(word, word))
+        word = _SYNONYMS.get(word, word)
+        if word and word not in _STOPWORDS:
+            words.append(word)
+    return " ".join(words)
+
+
+class _CacheEntry:
+    __slots__ = ("normalized", "grams", "weights", "intent_data", "band_keys")
+
+    def __init__(self, normalized, grams, weights, intent_data, band_keys):
+        self.normalized = normalized
+        self.grams = grams
+        self.weights = weights
+        self.intent_data = intent_data
+        self.band_keys = band_keys
+
+
+class IntentSimilarityCache:
+    """
+    Bounded LRU of classified messages with approximate nearest-neighbour lookup.
+
+    - threshold: minimum TF-IDF cosine similarity for a hit
+    - ngram: character n-gram size used for both MinHash and TF-IDF
+    - bands x rows: MinHash LSH layout; more rows per band makes buckets more selective
+    - max_candidates: most-colliding candidates scored exactly per lookup
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 100_000,
+        ngram: int = 3,
+        bands: int = 20,
+        rows: int = 5,
+        max_candidates: int = 64,
+        seed: int = 7,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = rows
+        self.max_candidates = max_candidates
+        rng = np.random.RandomState(seed)
+        num_perm = bands * rows
+        self._perm_a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._perm_b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_normalized = {}
+        self._buckets = defaultdict(set)
+        self._doc_freq = defaultdict(int)
+        self._next_id = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def lookup(self, message: str) -> Optional[Tuple[dict, float]]:
+        """Return (intent_data, similarity) for the closest cached message above the threshold, else None."""
+        if not self._cacheable(message):
+            return None
+        normalized = normalize_message(message)
+        grams = self._ngrams(normalized)
+        if grams is None:
+            return None
+        band_keys = self._band_keys(message_signature(message), grams[0])
+        with self._lock:
+            collisions = Counter()
+            for key in band_keys:
+                collisions.update(self._buckets.get(key, ()))
+            exact = self._by_normalized.get(normalized)
+            best_id, best_score = None, 0.0
+            if exact is not None and self._entries[exact].band_keys == band_keys:
+                best_id, best_score = exact, 1.0
+            else:
+                query_grams, query_weights = self._weigh(*grams)
+                for entry_id, _ in collisions.most_common(self.max_candidates):
+                    entry = self._entries[entry_id]
+                    _, idx_q, idx_e = np.intersect1d(query_grams, entry.grams, assume_unique=True, return_indices=True)
+                    score = float(np.dot(query_weights[idx_q], entry.weights[idx_e]))
+                    if score > best_score:
+                        best_id, best_score = entry_id, score
+            if best_id is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_id)
+                self._hits += 1
+                return dict(self._entries[best_id].intent_data), best_score
+            self._misses += 1
+            return None
+
+    def add(self, message: str, intent_data: dict):
+        """Store a classified message; messages that depend on conversation history are skipped."""
+        if not intent_data or not self._cacheable(message):
+            return
+        normalized = normalize_message(message)
+        grams = self._ngrams(normalized)
+        if grams is None:
+            return
+        band_keys = self._band_keys(message_signature(message), grams[0])
+        with self._lock:
+            existing = self._by_normalized.get(normalized)
+            if existing is not None:
+                self._remove_locked(existing)
+            for gram in grams[0].tolist():
+                self._doc_freq[gram] += 1
+            # Weights use the IDF at insert time; drift as the cache grows is small and keeps lookups cheap
+            entry = _CacheEntry(normalized, *self._weigh(*grams), dict(intent_data), band_keys)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_normalized[normalized] = entry_id
+            for key in band_keys:
+                self._buckets[key].add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+    @staticmethod
+    def _cacheable(message):
+        return bool(message and message.strip()) and not FOLLOW_UP_PATTERN.search(message)
+
+    def _ngrams(self, normalized):
+        """(sorted unique n-gram hashes, counts) for a normalized message, or None if it is empty."""
+        if not normalized:
+            return None
+        padded = f" {normalized} "
+        hashes = [zlib.crc32(padded[i:i + self.ngram].encode("utf-8")) for i in range(len(padded) - self.ngram + 1)]
+        grams, counts = np.unique(np.array(hashes, dtype=np.uint64), return_counts=True)
+        return grams, counts.astype(np.float64)
+
+    def _band_keys(self, signature, grams):
+        # MinHash: for each hash function (a*x + b) mod p, keep the minimum over the message's n-grams.
+        # Buckets are scoped to the message signature, since entries with another signature can never match.
+        minhash = ((self._perm_a[:, None] * grams[None, :] + self._perm_b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+        scope = hash(signature)
+        return [(scope, band, minhash[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _weigh(self, grams, counts):
+        """Unit-length TF-IDF vector over the message's n-grams."""
+        total = len(self._entries) + 1
+        idf = np.array([math.log(total / (1 + self._doc_freq.get(gram, 0))) + 1.0 for gram in grams.tolist()])
+        weights = counts * idf
+        norm = np.linalg.norm(weights)
+        return grams, (weights / norm if norm else weights)
+
+    def _remove_locked(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        if self._by_normalized.get(entry.normalized) == entry_id:
+            del self._by_normalized[entry.normalized]
+        for key in entry.band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        for gram in entry.grams.tolist():
+            self._doc_freq[gram] -= 1
+            if self._doc_freq[gram] <= 0:
+                del self._doc_freq[gram]
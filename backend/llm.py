@@ -0,0 +1,128 @@
+"""
+Concurrent execution of LLM calls.
+
+The OpenAI client calls in main.py are blocking, so they are run on a shared
+thread pool and awaited from asyncio. A batch of per-row generations runs at
+once (up to a concurrency limit) and results come back in input order, which
+keeps them aligned with the score-ordered rows they belong to.
+"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+from backend.llm_provider import LLMProviderError
+from backend.metrics import LLM_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+_NO_FALLBACK = object()
+
+
+class LLMExecutor:
+    """
+    Runs blocking LLM calls concurrently.
+
+    - max_workers bounds in-flight calls across the whole process
+    - max_concurrency bounds in-flight calls within a single batch (one request)
+    - timeout is applied to every call individually
+    """
+
+    def __init__(self, max_concurrency: int = 8, timeout: float = 30.0, max_workers: int = 32):
+        if max_concurrency < 1 or max_workers < 1:
+            raise ValueError("max_concurrency and max_workers must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    async def run(self, call: Callable[[], Any], timeout: Optional[float] = None):
+        """Run one blocking call on the LLM thread pool; raises asyncio.TimeoutError on timeout."""
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout if timeout is None else timeout
+        # Run in a copy of the caller's context so per-request state (stage timings) follows the call
+        context = contextvars.copy_context()
+        return await asyncio.wait_for(loop.run_in_executor(self._threads, context.run, call), timeout)
+
+    async def gather(
+        self,
+        calls: Sequence[Callable[[], Any]],
+        timeout: Optional[float] = None,
+        on_timeout: Any = _NO_FALLBACK,
+        on_error: Any = _NO_FALLBACK,
+    ) -> List[Any]:
+        """
+        Run all calls concurrently and return their results in input order.
+
+        If on_timeout is given, calls that exceed the timeout yield that value
+        instead of failing the whole batch; on_error does the same for calls whose
+        model request failed (LLMProviderError, after the scheduler's retries).
+        Other exceptions propagate.
+        """
+        run_one = self._batch_runner(timeout, on_timeout, on_error)
+        return list(await asyncio.gather(*(run_one(call) for call in calls)))
+
+    async def as_completed(
+        self,
+        calls: Sequence[Callable[[], Any]],
+        timeout: Optional[float] = None,
+        on_timeout: Any = _NO_FALLBACK,
+        on_error: Any = _NO_FALLBACK,
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Run all calls concurrently and yield (index, result) pairs as each one finishes.
+        Used for streaming responses, where rows are sent as soon as they are ready.
+        """
+        run_one = self._batch_runner(timeout, on_timeout, on_error)
+
+        async def indexed(index, call):
+            return index, await run_one(call)
+
+        tasks = [asyncio.ensure_future(indexed(i, call)) for i, call in enumerate(calls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _batch_runner(self, timeout, on_timeout, on_error):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(call):
+            async with semaphore:
+                try:
+                    return await self.run(call, timeout)
+                except asyncio.TimeoutError:
+                    if on_timeout is _NO_FALLBACK:
+                        raise
+                    LLM_FALLBACKS.inc(reason="timeout")
+                    return on_timeout
+                except LLMProviderError as e:
+                    if on_error is _NO_FALLBACK:
+                        raise
+                    LLM_FALLBACKS.inc(reason="error")
+                    logger.warning("LLM call failed (status %s), answering its row with a placeholder: %s", e.status, e)
+                    return on_error
+
+        return run_one
+
+    def map(
+        self,
+        calls: Sequence[Callable[[], Any]],
+        timeout: Optional[float] = None,
+        on_timeout: Any = _NO_FALLBACK,
+    ) -> List[Any]:
+        """
+        Blocking version of gather() for sync endpoints.
+
+        Must not be called from a thread that is already running an event loop;
+        async callers should await gather() instead.
+        """
+        if not calls:
+            return []
+        return asyncio.run(self.gather(calls, timeout=timeout, on_timeout=on_timeout))
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,225 @@
+"""
+Two-tier cache for LLM responses.
+
+Identical prompts (same model, prompt text and generation parameters) return
+the stored completion instead of calling the model again. A bounded in-process
+LRU sits in front of a SQLite file, so hit rates survive restarts and are
+shared between uvicorn workers on the same host.
+
+Purges are recorded in the SQLite file as well. Every worker polls that log
+(at most once per purge_check_interval) and drops matching entries from its
+own in-memory tier, so a purge takes effect across all workers within that
+interval rather than when their memory entries expire.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_cache_key(model: str, prompt: str, params: dict) -> str:
+    """Stable hash of (model, prompt, params); whitespace differences in the prompt are ignored."""
+    normalized = {
+        "model": model,
+        "prompt": " ".join(prompt.split()),
+        "params": {k: params[k] for k in sorted(params)},
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "account_id", "product_id")
+
+    def __init__(self, value, expires_at, account_id, product_id):
+        self.value = value
+        self.expires_at = expires_at
+        self.account_id = account_id
+        self.product_id = product_id
+
+
+class LLMResponseCache:
+    """
+    In-memory LRU with TTL in front of a persistent SQLite store.
+
+    Entries can be tagged with the account/product they were generated for so
+    they can be purged when that account's data changes.
+    """
+
+    def __init__(self, path: str, max_entries: int = 2048, ttl: float = 86400.0, purge_check_interval: float = 1.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_check_interval = purge_check_interval
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._local = threading.local()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._purges_applied = 0
+        self._purge_checked = 0.0
+        self._init_db()
+        # Purges logged before this process started don't concern its (empty) memory tier
+        self._purge_seen = self._db().execute("SELECT COALESCE(MAX(id), 0) FROM llm_cache_purges").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        self._apply_logged_purges(now)
+        with self._lock:
+            purge_seen = self._purge_seen
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    return entry.value
+                del self._memory[key]
+                self._expirations += 1
+
+        row = self._db().execute(
+            "SELECT value, expires_at, account_id, product_id FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and row[1] > now:
+            with self._lock:
+                self._disk_hits += 1
+                # A purge applied while the row was being read may cover it; don't keep it in memory
+                if self._purge_seen == purge_seen:
+                    self._remember(key, _Entry(*row))
+            return row[0]
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key: str, value: str, account_id: Optional[str] = None, product_id: Optional[str] = None):
+        entry = _Entry(value, time.time() + self.ttl, account_id, product_id)
+        with self._lock:
+            self._remember(key, entry)
+        conn = self._db()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, account_id, product_id) VALUES (?, ?, ?, ?, ?)",
+            (key, value, entry.expires_at, account_id, product_id),
+        )
+        conn.commit()
+
+    def purge(self, account_id: Optional[str] = None, product_id: Optional[str] = None) -> int:
+        """
+        Delete entries for an account and/or product from both tiers; returns the number of stored rows removed.
+        Other workers drop their in-memory copies on their next purge-log check.
+        """
+        if account_id is None and product_id is None:
+            raise ValueError("purge requires account_id and/or product_id")
+        self._forget(account_id, product_id)
+
+        clauses, params = [], []
+        if account_id is not None:
+            clauses.append("account_id = ?")
+            params.append(account_id)
+        if product_id is not None:
+            clauses.append("product_id = ?")
+            params.append(product_id)
+        conn = self._db()
+        with conn:
+            cur = conn.execute(f"DELETE FROM llm_cache WHERE {' AND '.join(clauses)}", params)
+            conn.execute(
+                "INSERT INTO llm_cache_purges (account_id, product_id, purged_at) VALUES (?, ?, ?)",
+                (account_id, product_id, time.time()),
+            )
+        return cur.rowcount
+
+    def prune_expired(self) -> int:
+        now = time.time()
+        conn = self._db()
+        with conn:
+            cur = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            # Memory entries never outlive the TTL, so older purge records can't match anything
+            conn.execute("DELETE FROM llm_cache_purges WHERE purged_at <= ?", (now - self.ttl,))
+        return cur.rowcount
+
+    def _forget(self, account_id, product_id):
+        def matches(entry):
+            return ((account_id is None or entry.account_id == account_id)
+                    and (product_id is None or entry.product_id == product_id))
+
+        with self._lock:
+            for key in [k for k, entry in self._memory.items() if matches(entry)]:
+                del self._memory[key]
+
+    def _apply_logged_purges(self, now):
+        """Apply purges made by any worker since the last check, at most once per purge_check_interval."""
+        with self._lock:
+            if now - self._purge_checked < self.purge_check_interval:
+                return
+            self._purge_checked = now
+            seen = self._purge_seen
+        purges = self._db().execute(
+            "SELECT id, account_id, product_id FROM llm_cache_purges WHERE id > ? ORDER BY id", (seen,)
+        ).fetchall()
+        for purge_id, account_id, product_id in purges:
+            self._forget(account_id, product_id)
+            with self._lock:
+                self._purge_seen = max(self._purge_seen, purge_id)
+                self._purges_applied += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "purges_applied": self._purges_applied,
+            }
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def _db(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._db()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                account_id TEXT,
+                product_id TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_account ON llm_cache (account_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_product ON llm_cache (product_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_purges (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id TEXT,
+                product_id TEXT,
+                purged_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        self.prune_expired()
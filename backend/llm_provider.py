@@ -0,0 +1,257 @@
+"""
+LLM provider backends.
+
+main.py talks to the model only through an LLMProvider: a blocking
+completion, a streaming completion and an async completion over chat
+messages. OpenAIProvider calls the OpenAI API. StubProvider runs locally and
+never touches the network. Its latency, output speed and error rate are
+configurable and its text is deterministic, so the backend can be
+load-tested and benchmarked offline.
+
+Select the backend with LLM_PROVIDER=openai (default) or LLM_PROVIDER=stub.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional
+
+import openai
+
+from backend.history import count_message_tokens, count_tokens
+from backend.intent import extract_intent
+
+
+class Completion(NamedTuple):
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class LLMProviderError(Exception):
+    """A failed model call; status is the HTTP status when there was one (429, 500, ...)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMProvider:
+    """Interface for chat-completion backends."""
+
+    name = "base"
+
+    def complete(self, messages: List[dict], model: str, max_tokens: int, temperature: float) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, messages: List[dict], model: str, max_tokens: int, temperature: float) -> Iterator[str]:
+        """Yield text chunks as they are generated."""
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[dict], model: str, max_tokens: int, temperature: float) -> Completion:
+        raise NotImplementedError
+
+
+def _status_of(error):
+    # openai 1.x: APIStatusError has status_code; connection errors and timeouts have none
+    return getattr(error, "status_code", None)
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    The OpenAI chat completions API (openai>=1.0 client). The SDK's own retries are
+    disabled because LLMScheduler retries 429/5xx responses against the shared quota.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, max_retries: int = 0):
+        # None lets the clients read OPENAI_API_KEY
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(api_key=self.api_key, max_retries=self.max_retries)
+            return self._client
+
+    def _aclient(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=self.max_retries)
+            return self._async_client
+
+    def complete(self, messages, model, max_tokens, temperature):
+        try:
+            response = self._sync_client().chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, temperature=temperature
+            )
+        except Exception as e:
+            raise LLMProviderError(str(e), _status_of(e)) from e
+        return self._completion(response, messages, model)
+
+    def stream(self, messages, model, max_tokens, temperature):
+        try:
+            response = self._sync_client().chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+            )
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+        except Exception as e:
+            raise LLMProviderError(str(e), _status_of(e)) from e
+
+    async def acomplete(self, messages, model, max_tokens, temperature):
+        try:
+            response = await self._aclient().chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, temperature=temperature
+            )
+        except Exception as e:
+            raise LLMProviderError(str(e), _status_of(e)) from e
+        return self._completion(response, messages, model)
+
+    @staticmethod
+    def _completion(response, messages, model):
+        text = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            return Completion(text, usage.prompt_tokens, usage.completion_tokens)
+        return Completion(text, count_message_tokens(messages, model), count_tokens(text, model))
+
+
+_STUB_WORDS = (
+    "account", "usage", "growth", "renewal", "adoption", "team", "expansion", "budget", "signals", "strong",
+    "fit", "recent", "engagement", "support", "tickets", "pipeline", "quarter", "stakeholders", "value", "roi",
+    "schedule", "demo", "review", "integration", "workflow", "contract", "pricing", "champion", "executive", "risk",
+)
+_DEFAULT_INTENT = {"intent": "top_opportunities", "opportunity_type": "cross_sell", "top_n": 5}
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic local stand-in for the model.
+
+    - latency_ms / latency_distribution / latency_sigma: time to the first token,
+      drawn from a "fixed", "uniform" (±sigma fraction), "normal" or "lognormal" distribution
+    - tokens_per_second: output speed after the first token (0 for instant)
+    - error_rate / error_status: fraction of calls that fail with LLMProviderError(status)
+    - seed: makes latencies and injected errors reproducible across runs
+
+    Text depends only on the prompt, so the same prompt always gets the same answer.
+    Prompts asking for the intent JSON or the explanation/next_action JSON get valid JSON.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: float = 300.0,
+        latency_distribution: str = "lognormal",
+        latency_sigma: float = 0.5,
+        tokens_per_second: float = 50.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: int = 0,
+    ):
+        if latency_distribution not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+
+    def complete(self, messages, model, max_tokens, temperature):
+        first_token, per_token, fail, completion = self._plan(messages, model, max_tokens)
+        time.sleep(first_token + per_token * completion.completion_tokens)
+        if fail:
+            raise LLMProviderError(f"Injected stub error ({self.error_status})", self.error_status)
+        return completion
+
+    def stream(self, messages, model, max_tokens, temperature):
+        first_token, per_token, fail, completion = self._plan(messages, model, max_tokens)
+        time.sleep(first_token)
+        if fail:
+            raise LLMProviderError(f"Injected stub error ({self.error_status})", self.error_status)
+        for i, word in enumerate(completion.text.split(" ")):
+            time.sleep(per_token * count_tokens(word, model))
+            yield word if i == 0 else f" {word}"
+
+    async def acomplete(self, messages, model, max_tokens, temperature):
+        first_token, per_token, fail, completion = self._plan(messages, model, max_tokens)
+        await asyncio.sleep(first_token + per_token * completion.completion_tokens)
+        if fail:
+            raise LLMProviderError(f"Injected stub error ({self.error_status})", self.error_status)
+        return completion
+
+    def _plan(self, messages, model, max_tokens):
+        """(first-token delay, per-token delay, whether to fail, completion) for one call."""
+        with self._rng_lock:
+            self.calls += 1
+            first_token = self._sample_latency() / 1000.0
+            fail = self._rng.random() < self.error_rate
+        text = self._respond(messages, max_tokens)
+        completion = Completion(text, count_message_tokens(messages, model), count_tokens(text, model))
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return first_token, per_token, fail, completion
+
+    def _sample_latency(self):
+        mean, sigma = self.latency_ms, self.latency_sigma
+        if self.latency_distribution == "fixed":
+            value = mean
+        elif self.latency_distribution == "uniform":
+            value = self._rng.uniform(mean * (1 - sigma), mean * (1 + sigma))
+        elif self.latency_distribution == "normal":
+            value = self._rng.gauss(mean, mean * sigma)
+        else:
+            # Median latency_ms with a long right tail, like real API latencies
+            value = self._rng.lognormvariate(math.log(mean) if mean > 0 else 0.0, sigma) if mean > 0 else 0.0
+        return max(0.0, value)
+
+    def _respond(self, messages, max_tokens):
+        system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+        prompt = (messages[-1].get("content") or "") if messages else ""
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+        rng = random.Random(digest)
+
+        if '"intent"' in system:
+            message = prompt.split("User message:", 1)[-1].strip()
+            intent_data, _ = extract_intent(message)
+            return json.dumps(intent_data or _DEFAULT_INTENT)
+        if '"explanation"' in prompt and '"next_action"' in prompt:
+            budget = max(4, (max_tokens - 12) // 2)
+            return json.dumps({
+                "explanation": self._sentence(rng, budget),
+                "next_action": self._sentence(rng, budget),
+            })
+        return self._sentence(rng, max_tokens)
+
+    @staticmethod
+    def _sentence(rng, max_tokens):
+        # About three quarters of the token budget, as a real completion rarely hits max_tokens
+        target = max(1, int(max_tokens * 0.75))
+        words = [rng.choice(_STUB_WORDS).capitalize()]
+        used = count_tokens(words[0])
+        while True:
+            word = rng.choice(_STUB_WORDS)
+            tokens = count_tokens(word)
+            if used + tokens > target:
+                break
+            words.append(word)
+            used += tokens
+        return " ".join(words) + "."
@@ -0,0 +1,319 @@
+"""
+Rate-limit-aware scheduling of LLM calls.
+
+Every model call goes through one LLMScheduler per process. It:
+
+- keeps two token buckets, requests/minute and tokens/minute, sized to the
+  OpenAI quota, so calls are spread out instead of tripping 429s
+- grants capacity by priority class: chat, then pitch, then other API
+  requests, then bulk precompute. Within a class calls are served in arrival order
+- retries 429 and 5xx responses with jittered exponential backoff; a 429 also
+  pauses all callers for the backoff, since the quota is shared
+- enforces deadlines: a call that can't start or finish its retries in time
+  raises DeadlineExceeded (a TimeoutError) instead of occupying the quota
+
+The priority and the deadline of the current request are carried in context
+variables, so nested helpers don't need extra parameters. Time spent queued
+is recorded as the "llm_queue" stage.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from backend.llm_provider import LLMProviderError
+from backend.metrics import LLM_RETRIES, record_stage
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"chat": 0, "pitch": 1, "api": 2, "bulk": 3}
+
+current_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="api")
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+def more_urgent(priority: str, other: Optional[str] = None) -> str:
+    """The higher of a priority class and the current request's (or another) class."""
+    other = other or current_priority.get()
+    return priority if PRIORITIES[priority] <= PRIORITIES[other] else other
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call could not be scheduled or completed before its deadline."""
+
+
+def is_retryable(error: Exception) -> bool:
+    if not isinstance(error, LLMProviderError):
+        return False
+    # No status means the request never got an HTTP response (connection reset, timeout)
+    return error.status is None or error.status == 429 or error.status >= 500
+
+
+class TokenBucket:
+    """Continuously refilled bucket; rate_per_minute <= 0 means unlimited."""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds) if self.rate > 0 else 0.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _refill(self, now):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # A request larger than the bucket only needs a full bucket, or it would never run
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.level -= amount
+
+    def refund(self, amount: float):
+        """Give back (or, if negative, charge) the difference between an estimate and actual usage."""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class LLMScheduler:
+    """
+    Central admission control for LLM calls.
+
+    - requests_per_minute / tokens_per_minute: the quota (<= 0 disables that limit)
+    - burst_seconds: how much unused quota may be spent at once
+    - max_retries, backoff_base, backoff_max: retry policy for 429/5xx responses
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        burst_seconds: float = 10.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        poll_interval: float = 0.05,
+    ):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._stats = {"granted": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "deadline_exceeded": 0, "failed": 0}
+        self._granted_by_priority = {name: 0 for name in PRIORITIES}
+        self._wait_seconds = 0.0
+
+    # Admission
+
+    def _enqueue(self, priority):
+        entry = (PRIORITIES[priority], next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _try_grant(self, entry, tokens, priority):
+        """Under the lock: grant if entry is first in line and both buckets allow it; else seconds to wait."""
+        now = time.monotonic()
+        if self._waiters[0] != entry:
+            return self.poll_interval
+        wait = max(self._paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._waiters)
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+        self._stats["granted"] += 1
+        self._granted_by_priority[priority] += 1
+        self._cond.notify_all()
+        return 0.0
+
+    def _granted(self, started):
+        # Called under the lock
+        now = time.perf_counter()
+        self._wait_seconds += now - started
+        record_stage("llm_queue", started, now)
+
+    def _abandon(self, entry):
+        with self._cond:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            self._stats["deadline_exceeded"] += 1
+            self._cond.notify_all()
+
+    def acquire(self, tokens: float, priority: str = "api", deadline: Optional[float] = None):
+        """Block until one request and `tokens` tokens are granted; raises DeadlineExceeded."""
+        started = time.perf_counter()
+        entry = self._enqueue(priority)
+        with self._cond:
+            while True:
+                wait = self._try_grant(entry, tokens, priority)
+                if wait <= 0:
+                    self._granted(started)
+                    return
+                if deadline is not None and time.monotonic() + min(wait, self.poll_interval) > deadline:
+                    break
+                self._cond.wait(min(wait, self.poll_interval))
+        self._abandon(entry)
+        raise DeadlineExceeded("LLM call could not be scheduled before its deadline")
+
+    async def acquire_async(self, tokens: float, priority: str = "api", deadline: Optional[float] = None):
+        """acquire() for coroutines: polls instead of blocking the event loop."""
+        started = time.perf_counter()
+        entry = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_grant(entry, tokens, priority)
+                    if wait <= 0:
+                        self._granted(started)
+                        return
+                if deadline is not None and time.monotonic() + min(wait, self.poll_interval) > deadline:
+                    break
+                await asyncio.sleep(min(wait, self.poll_interval))
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        self._abandon(entry)
+        raise DeadlineExceeded("LLM call could not be scheduled before its deadline")
+
+    def settle(self, estimated_tokens: float, actual_tokens: Optional[float]):
+        """Correct the token bucket once a call's real usage is known."""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    # Retries
+
+    def _backoff(self, attempt, error, deadline):
+        """Sleep duration before retry `attempt`, or None if the error isn't worth retrying."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        LLM_RETRIES.inc(status=error.status or "connection")
+        with self._cond:
+            self._stats["retries"] += 1
+            if error.status == 429:
+                self._stats["rate_limited"] += 1
+                # The quota is shared, so everyone waits out a 429 rather than piling on
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            else:
+                self._stats["server_errors"] += 1
+        if deadline is not None and time.monotonic() + delay > deadline:
+            return None
+        logger.warning("LLM call failed (%s); retry %d in %.2fs", error, attempt + 1, delay)
+        return delay
+
+    def _give_up(self, error):
+        with self._cond:
+            self._stats["failed"] += 1
+
+    def call(self, fn: Callable[[], Any], tokens: float, priority: Optional[str] = None, deadline: Optional[float] = None,
+             usage: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+        """
+        Run fn() once capacity is granted, retrying retryable failures.
+        usage(result) returns the call's actual token count to settle the estimate.
+        """
+        priority = priority or current_priority.get()
+        deadline = _earliest(deadline, current_deadline.get())
+        for attempt in itertools.count():
+            self.acquire(tokens, priority, deadline)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._backoff(attempt, e, deadline)
+                if delay is None:
+                    self._give_up(e)
+                    raise
+                time.sleep(delay)
+                continue
+            self.settle(tokens, usage(result) if usage else None)
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], tokens: float, priority: Optional[str] = None,
+                         deadline: Optional[float] = None, usage: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+        priority = priority or current_priority.get()
+        deadline = _earliest(deadline, current_deadline.get())
+        for attempt in itertools.count():
+            await self.acquire_async(tokens, priority, deadline)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._backoff(attempt, e, deadline)
+                if delay is None:
+                    self._give_up(e)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.settle(tokens, usage(result) if usage else None)
+            return result
+
+    def stream(self, fn: Callable[[], Iterator[str]], tokens: float, priority: Optional[str] = None,
+               deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        Scheduled streaming call. Failures before the first chunk are retried; once text
+        has been sent to the client a failure is raised, since the stream can't be restarted.
+        """
+        priority = priority or current_priority.get()
+        deadline = _earliest(deadline, current_deadline.get())
+        for attempt in itertools.count():
+            self.acquire(tokens, priority, deadline)
+            started = False
+            try:
+                for chunk in fn():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                delay = None if started else self._backoff(attempt, e, deadline)
+                if delay is None:
+                    self._give_up(e)
+                    raise
+                time.sleep(delay)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            waiting = {name: 0 for name in PRIORITIES}
+            names = {rank: name for name, rank in PRIORITIES.items()}
+            for rank, _ in self._waiters:
+                waiting[names[rank]] += 1
+            granted = self._stats["granted"]
+            return {
+                **self._stats,
+                "granted_by_priority": dict(self._granted_by_priority),
+                "waiting_by_priority": waiting,
+                "avg_wait_ms": self._wait_seconds / granted * 1000 if granted else 0.0,
+                "paused_for_s": max(0.0, self._paused_until - now),
+                "requests_bucket": None if self.requests.unlimited else round(self.requests.level, 2),
+                "tokens_bucket": None if self.tokens.unlimited else round(self.tokens.level, 1),
+            }
+
+
+def _earliest(*deadlines):
+    values = [deadline for deadline in deadlines if deadline is not None]
+    return min(values) if values else None
@@ -1,12 +1,43 @@
 from fastapi import FastAPI, Query, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial, wraps
 from typing import List, Optional
 import snowflake.connector
 import openai
+import asyncio
+import base64
+import binascii
+import contextvars
+import inspect
+import logging
 import os
+import random
 import json
+import time
 
-app = FastAPI()
+from backend.db import SnowflakePool
+from backend.export import FORMATS as EXPORT_FORMATS, format_available as export_format_available, stream_export
+from backend.llm import LLMExecutor
+from backend.llm_cache import LLMResponseCache, make_cache_key
+from backend.llm_provider import Completion, LLMProvider, OpenAIProvider, StubProvider
+from backend.llm_scheduler import LLMScheduler, current_deadline, current_priority, more_urgent
+from backend.metrics import (
+    COALESCED_REQUESTS, CONTEXT_TOKENS_SAVED, HISTORY_TOKENS_SAVED, HTTP_REQUEST_DURATION, RequestTimings, current_timings, record_llm_completion, record_stage, registry, stage_timer, timed,
+)
+from backend.result_cache import VersionedResultCache
+from backend.context_digest import ContextDigester
+from backend.history import HistoryStats, compact_history, count_message_tokens, count_tokens
+from backend.intent import IntentStats, extract_intent, intents_agree
+from backend.intent_cache import IntentSimilarityCache
+from backend.precompute import InsightStore
+from backend.scores_snapshot import SnapshotManager, load_snapshot
+from backend.shap_store import ShapStore, ShapStoreFile
+from backend.singleflight import AsyncSingleFlight, SingleFlight, freeze
+
+logger = logging.getLogger(__name__)
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -17,6 +48,100 @@ SNOWFLAKE_DATABASE = os.getenv("SNOWFLAKE_DATABASE")
 SNOWFLAKE_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA")
 SNOWFLAKE_WAREHOUSE = os.getenv("SNOWFLAKE_WAREHOUSE")
 
+SNOWFLAKE_POOL_MIN_SIZE = int(os.getenv("SNOWFLAKE_POOL_MIN_SIZE", "1"))
+SNOWFLAKE_POOL_MAX_SIZE = int(os.getenv("SNOWFLAKE_POOL_MAX_SIZE", "10"))
+SNOWFLAKE_POOL_IDLE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", "300"))
+SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL", "30"))
+SNOWFLAKE_POOL_ACQUIRE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_ACQUIRE_TIMEOUT", "30"))
+# Seconds between background sweeps that close connections idle past SNOWFLAKE_POOL_IDLE_TIMEOUT
+SNOWFLAKE_POOL_EVICT_INTERVAL = float(os.getenv("SNOWFLAKE_POOL_EVICT_INTERVAL", "60"))
+# Threads that run blocking Snowflake/SQLite calls for async endpoints; more than the pool size would only queue on it
+DB_EXECUTOR_MAX_WORKERS = int(os.getenv("DB_EXECUTOR_MAX_WORKERS", str(SNOWFLAKE_POOL_MAX_SIZE)))
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "32"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))
+LLM_TIMEOUT_MESSAGE = "Not available right now (the AI model took too long to respond)."
+LLM_ERROR_MESSAGE = "Not available right now (the AI model request failed)."
+# Client-side OpenAI quota (0 disables a limit); calls queue by priority instead of tripping 429s
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+LLM_RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+LLM_RATE_LIMIT_BURST_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BURST_SECONDS", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# LLM calls made while serving one HTTP request (queueing and retries included) must finish within this
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "60"))
+
+LLM_MODEL = "gpt-4"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "stub" runs a local fake model for load tests
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "300"))
+STUB_LLM_LATENCY_DISTRIBUTION = os.getenv("STUB_LLM_LATENCY_DISTRIBUTION", "lognormal")
+STUB_LLM_LATENCY_SIGMA = float(os.getenv("STUB_LLM_LATENCY_SIGMA", "0.5"))
+STUB_LLM_TOKENS_PER_SECOND = float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "50"))
+STUB_LLM_ERROR_RATE = float(os.getenv("STUB_LLM_ERROR_RATE", "0"))
+STUB_LLM_ERROR_STATUS = int(os.getenv("STUB_LLM_ERROR_STATUS", "500"))
+STUB_LLM_SEED = int(os.getenv("STUB_LLM_SEED", "0"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+# How often each worker checks the shared purge log, i.e. how long a purge can lag in other workers' memory
+LLM_CACHE_PURGE_CHECK_INTERVAL = float(os.getenv("LLM_CACHE_PURGE_CHECK_INTERVAL", "1"))
+
+OPPORTUNITY_CACHE_ENABLED = os.getenv("OPPORTUNITY_CACHE_ENABLED", "1") == "1"
+OPPORTUNITY_CACHE_MAX_ENTRIES = int(os.getenv("OPPORTUNITY_CACHE_MAX_ENTRIES", "1024"))
+OPPORTUNITY_CACHE_PREFETCH_N = int(os.getenv("OPPORTUNITY_CACHE_PREFETCH_N", "20"))
+# Cheap query whose result changes whenever the scoring job reloads model_scores; Snowflake
+# updates LAST_ALTERED on every DML or DDL change to the table, so no extra column is needed
+SCORES_VERSION_QUERY = os.getenv(
+    "SCORES_VERSION_QUERY",
+    "SELECT last_altered FROM information_schema.tables WHERE table_schema = CURRENT_SCHEMA() AND table_name = 'MODEL_SCORES'",
+)
+SCORES_VERSION_PROBE_INTERVAL = float(os.getenv("SCORES_VERSION_PROBE_INTERVAL", "30"))
+
+# Chat messages classified locally with at least this confidence skip the LLM classifier
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.85"))
+# Fraction of fast-path messages also sent to the LLM in the background to measure agreement
+INTENT_SHADOW_SAMPLE_RATE = float(os.getenv("INTENT_SHADOW_SAMPLE_RATE", "0"))
+# Near-duplicate cache of LLM intent classifications
+INTENT_CACHE_ENABLED = os.getenv("INTENT_CACHE_ENABLED", "1") == "1"
+INTENT_CACHE_THRESHOLD = float(os.getenv("INTENT_CACHE_THRESHOLD", "0.8"))
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "100000"))
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "1") == "1"
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "500"))
+HISTORY_ASSISTANT_DIGEST_TOKENS = int(os.getenv("HISTORY_ASSISTANT_DIGEST_TOKENS", "40"))
+# Business context longer than this many tokens is replaced by an extractive digest in prompts
+CONTEXT_DIGEST_ENABLED = os.getenv("CONTEXT_DIGEST_ENABLED", "1") == "1"
+CONTEXT_DIGEST_MAX_TOKENS = int(os.getenv("CONTEXT_DIGEST_MAX_TOKENS", "150"))
+CONTEXT_DIGEST_MAX_ENTRIES = int(os.getenv("CONTEXT_DIGEST_MAX_ENTRIES", "50000"))
+
+# Lists written by the nightly precompute job (python -m backend.precompute)
+PRECOMPUTE_SERVING_ENABLED = os.getenv("PRECOMPUTE_SERVING_ENABLED", "1") == "1"
+PRECOMPUTE_STORE_PATH = os.getenv("PRECOMPUTE_STORE_PATH", "precomputed_insights.sqlite3")
+
+# Cursor-paginated browsing (/api/opportunities/browse); explanations are limited to the usual top_n cap per page
+BROWSE_MAX_PAGE_SIZE = int(os.getenv("BROWSE_MAX_PAGE_SIZE", "200"))
+BROWSE_MAX_EXPLAINED_ROWS = 20
+
+# Manager dashboards: reps per /api/opportunities/batch request, and a cap on rows explained per request
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", "50"))
+BATCH_MAX_EXPLAINED_ROWS = int(os.getenv("BATCH_MAX_EXPLAINED_ROWS", "100"))
+
+# Rows per fetchmany() batch for exports when the connector can't fetch Arrow batches
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+# Precomputed top-k SHAP features per pair, written by the precompute job (or python -m backend.shap_store)
+SHAP_STORE_ENABLED = os.getenv("SHAP_STORE_ENABLED", "1") == "1"
+SHAP_STORE_PATH = os.getenv("SHAP_STORE_PATH", "shap_store.bin")
+SHAP_STORE_TOP_K = int(os.getenv("SHAP_STORE_TOP_K", "3"))
+SHAP_STORE_CHECK_INTERVAL = float(os.getenv("SHAP_STORE_CHECK_INTERVAL", "30"))
+
+# Optional in-memory columnar copy of model_scores that answers fetch_opportunities without Snowflake
+SCORES_SNAPSHOT_ENABLED = os.getenv("SCORES_SNAPSHOT_ENABLED", "0") == "1"
+SCORES_SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SCORES_SNAPSHOT_REFRESH_INTERVAL", "300"))
+
+@timed("db_connect")
 def get_snowflake_connection():
     return snowflake.connector.connect(
         user=SNOWFLAKE_USER,
@@ -24,12 +149,349 @@ def get_snowflake_connection():
         account=SNOWFLAKE_ACCOUNT,
         database=SNOWFLAKE_DATABASE,
         schema=SNOWFLAKE_SCHEMA,
-        warehouse=SNOWFLAKE_WAREHOUSE
+        warehouse=SNOWFLAKE_WAREHOUSE,
+        # Pooled sessions can sit idle for a while; keep them authenticated
+        client_session_keep_alive=True
     )
 
+db_pool: Optional[SnowflakePool] = None
+
+def get_db_pool() -> SnowflakePool:
+    """Return the shared connection pool, creating it if the lifespan hook has not run (e.g. scripts)."""
+    global db_pool
+    if db_pool is None:
+        db_pool = SnowflakePool(
+            get_snowflake_connection,
+            min_size=SNOWFLAKE_POOL_MIN_SIZE,
+            max_size=SNOWFLAKE_POOL_MAX_SIZE,
+            idle_timeout=SNOWFLAKE_POOL_IDLE_TIMEOUT,
+            health_check_interval=SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL,
+            acquire_timeout=SNOWFLAKE_POOL_ACQUIRE_TIMEOUT,
+        )
+    return db_pool
+
+db_executor: Optional[ThreadPoolExecutor] = None
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the bounded thread pool that async endpoints use for blocking database calls."""
+    global db_executor
+    if db_executor is None:
+        db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_MAX_WORKERS, thread_name_prefix="db")
+    return db_executor
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database call on the DB executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_db_executor(), context.run, partial(func, *args, **kwargs))
+
+llm_executor: Optional[LLMExecutor] = None
+
+def get_llm_executor() -> LLMExecutor:
+    """Return the shared LLM executor used to fan out per-row generations."""
+    global llm_executor
+    if llm_executor is None:
+        llm_executor = LLMExecutor(
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            timeout=LLM_CALL_TIMEOUT,
+            max_workers=LLM_MAX_WORKERS,
+        )
+    return llm_executor
+
+llm_provider: Optional[LLMProvider] = None
+
+def get_llm_provider() -> LLMProvider:
+    """Return the model backend selected by LLM_PROVIDER."""
+    global llm_provider
+    if llm_provider is None:
+        if LLM_PROVIDER == "stub":
+            llm_provider = StubProvider(
+                latency_ms=STUB_LLM_LATENCY_MS,
+                latency_distribution=STUB_LLM_LATENCY_DISTRIBUTION,
+                latency_sigma=STUB_LLM_LATENCY_SIGMA,
+                tokens_per_second=STUB_LLM_TOKENS_PER_SECOND,
+                error_rate=STUB_LLM_ERROR_RATE,
+                error_status=STUB_LLM_ERROR_STATUS,
+                seed=STUB_LLM_SEED,
+            )
+        elif LLM_PROVIDER == "openai":
+            llm_provider = OpenAIProvider()
+        else:
+            raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+    return llm_provider
+
+llm_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler every LLM call is admitted through."""
+    global llm_scheduler
+    if llm_scheduler is None:
+        llm_scheduler = LLMScheduler(
+            requests_per_minute=LLM_RATE_LIMIT_RPM,
+            tokens_per_minute=LLM_RATE_LIMIT_TPM,
+            burst_seconds=LLM_RATE_LIMIT_BURST_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+            backoff_base=LLM_BACKOFF_BASE,
+            backoff_max=LLM_BACKOFF_MAX,
+        )
+    return llm_scheduler
+
+def _completion_tokens_used(completion):
+    return completion.prompt_tokens + completion.completion_tokens
+
+def llm_cache_model():
+    """Model name used in LLM cache keys; stub responses never share entries with real ones."""
+    provider = get_llm_provider()
+    return LLM_MODEL if provider.name == "openai" else f"{provider.name}:{LLM_MODEL}"
+
+# Identical concurrent requests and generations share one in-flight computation
+request_flight = AsyncSingleFlight(on_coalesced=lambda name: COALESCED_REQUESTS.inc(layer="endpoint", name=name))
+generation_flight = SingleFlight(on_coalesced=lambda name: COALESCED_REQUESTS.inc(layer="generate", name=name))
+
+def _normalize_param(value):
+    # Endpoints treat an empty filter like a missing one
+    return None if value == "" else value
+
+def coalesce_requests(endpoint):
+    """Endpoint decorator: concurrent calls with the same (normalized) parameters share one execution."""
+    if not COALESCING_ENABLED:
+        return endpoint
+    signature = inspect.signature(endpoint)
+
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        params = signature.bind_partial(*args, **kwargs).arguments
+        # The shared call runs with the leader's priority and deadline, so only callers of the
+        # same priority class share one (a chat lookup never waits behind a bulk-priority leader)
+        key = (endpoint.__name__, current_priority.get(), freeze({name: _normalize_param(value) for name, value in params.items()}))
+        return await request_flight.do(key, lambda: endpoint(*args, **kwargs), endpoint.__name__)
+
+    return wrapper
+
+def coalesce_generation(func):
+    """generate_* decorator: concurrent calls with equal arguments and priority class share one LLM call."""
+    if not COALESCING_ENABLED:
+        return func
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, current_priority.get(), freeze(args), freeze(kwargs))
+        return generation_flight.do(key, lambda: func(*args, **kwargs), name)
+
+    return wrapper
+
+llm_cache: Optional[LLMResponseCache] = None
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Return the shared LLM response cache, or None when caching is disabled."""
+    global llm_cache
+    if llm_cache is None and LLM_CACHE_ENABLED:
+        llm_cache = LLMResponseCache(
+            LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL, purge_check_interval=LLM_CACHE_PURGE_CHECK_INTERVAL
+        )
+    return llm_cache
+
+opportunity_cache: Optional[VersionedResultCache] = None
+
+def get_opportunity_cache() -> Optional[VersionedResultCache]:
+    """Return the shared fetch_opportunities result cache, or None when it is disabled."""
+    global opportunity_cache
+    if opportunity_cache is None and OPPORTUNITY_CACHE_ENABLED:
+        opportunity_cache = VersionedResultCache(
+            fetch_scores_version,
+            probe_interval=SCORES_VERSION_PROBE_INTERVAL,
+            max_entries=OPPORTUNITY_CACHE_MAX_ENTRIES,
+        )
+    return opportunity_cache
+
+scores_snapshot: Optional[SnapshotManager] = None
+
+def get_scores_snapshot() -> Optional[SnapshotManager]:
+    """Return the model_scores snapshot manager, or None when snapshot mode is disabled."""
+    global scores_snapshot
+    if scores_snapshot is None and SCORES_SNAPSHOT_ENABLED:
+        def loader(version):
+            with get_db_pool().connection() as conn:
+                return load_snapshot(conn, version=version)
+        scores_snapshot = SnapshotManager(loader, current_scores_version, refresh_interval=SCORES_SNAPSHOT_REFRESH_INTERVAL)
+    return scores_snapshot
+
+insight_store: Optional[InsightStore] = None
+
+def get_insight_store() -> Optional[InsightStore]:
+    """Return the precomputed insight store, or None if serving is disabled or the job hasn't run yet."""
+    global insight_store
+    if insight_store is None and PRECOMPUTE_SERVING_ENABLED and os.path.exists(PRECOMPUTE_STORE_PATH):
+        insight_store = InsightStore(PRECOMPUTE_STORE_PATH)
+    return insight_store
+
+shap_store_file: Optional[ShapStoreFile] = None
+
+def get_shap_store() -> Optional[ShapStore]:
+    """The memory-mapped SHAP store if it was built for the current scores version, else None."""
+    global shap_store_file
+    if not SHAP_STORE_ENABLED:
+        return None
+    if shap_store_file is None:
+        shap_store_file = ShapStoreFile(SHAP_STORE_PATH, check_interval=SHAP_STORE_CHECK_INTERVAL)
+    store = shap_store_file.current()
+    if store is None or store.version != str(current_scores_version()):
+        return None
+    return store
+
+context_digester: Optional[ContextDigester] = None
+
+def get_context_digester() -> Optional[ContextDigester]:
+    """Shared business-context digester; None when digesting is disabled."""
+    global context_digester
+    if context_digester is None and CONTEXT_DIGEST_ENABLED:
+        context_digester = ContextDigester(CONTEXT_DIGEST_MAX_TOKENS, model=LLM_MODEL, max_entries=CONTEXT_DIGEST_MAX_ENTRIES)
+    return context_digester
+
+intent_stats = IntentStats()
+history_stats = HistoryStats()
+intent_cache: Optional[IntentSimilarityCache] = None
+
+def get_intent_cache() -> Optional[IntentSimilarityCache]:
+    """Return the shared near-duplicate intent cache, or None when it is disabled."""
+    global intent_cache
+    if intent_cache is None and INTENT_CACHE_ENABLED:
+        intent_cache = IntentSimilarityCache(threshold=INTENT_CACHE_THRESHOLD, max_entries=INTENT_CACHE_MAX_ENTRIES)
+    return intent_cache
+
+async def evict_idle_connections(pool: SnowflakePool):
+    """Close idle pooled connections periodically, so a burst's extra sessions don't stay open until the next request."""
+    while True:
+        await asyncio.sleep(SNOWFLAKE_POOL_EVICT_INTERVAL)
+        try:
+            await run_in_threadpool(pool.evict_idle)
+        except Exception as e:
+            logger.warning("Idle Snowflake connection sweep failed: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool = get_db_pool()
+    try:
+        pool.open()
+    except Exception as e:
+        # Don't block startup on Snowflake; connections are opened lazily on first use
+        logger.warning("Could not pre-open Snowflake connections: %s", e)
+    sweeper = asyncio.create_task(evict_idle_connections(pool))
+    get_llm_executor()
+    get_llm_cache()
+    snapshot = get_scores_snapshot()
+    if snapshot is not None:
+        # Loads in the background; queries go to Snowflake until the first snapshot is ready
+        snapshot.start()
+    yield
+    global db_pool, db_executor, llm_executor
+    sweeper.cancel()
+    if snapshot is not None:
+        snapshot.stop()
+    pool.close()
+    get_llm_executor().shutdown()
+    get_db_executor().shutdown(wait=False, cancel_futures=True)
+    db_pool = None
+    db_executor = None
+    llm_executor = None
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Collect per-stage timings for the request, observe its latency and add a Server-Timing header."""
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    deadline_token = current_deadline.set(time.monotonic() + LLM_REQUEST_DEADLINE)
+    try:
+        response = await call_next(request)
+    finally:
+        current_deadline.reset(deadline_token)
+        current_timings.reset(token)
+    route = request.scope.get("route")
+    HTTP_REQUEST_DURATION.observe(
+        time.perf_counter() - timings.started,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+def _pool_gauges():
+    pool = db_pool
+    if pool is None:
+        return []
+    stats = pool.metrics()
+    return [
+        ("salesintel_db_pool_connections", "Snowflake pool connections by state.", {"state": state}, stats[state])
+        for state in ("idle", "in_use")
+    ] + [("salesintel_db_pool_waiting", "Threads waiting for a Snowflake connection.", {}, stats["waiting"])]
+
+registry.register_collector(_pool_gauges)
+
+def _scheduler_gauges():
+    if llm_scheduler is None:
+        return []
+    stats = llm_scheduler.stats()
+    return [
+        ("salesintel_llm_queue_waiting", "LLM calls waiting for rate-limit capacity, by priority.", {"priority": priority}, count)
+        for priority, count in stats["waiting_by_priority"].items()
+    ]
+
+registry.register_collector(_scheduler_gauges)
+
+@timed()
+def fetch_scores_version():
+    """Current version of model_scores, used to invalidate cached opportunity results."""
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SCORES_VERSION_QUERY)
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+def current_scores_version():
+    """model_scores version, via the result cache's throttled probe when it is enabled."""
+    cache = get_opportunity_cache()
+    if cache is not None:
+        return cache.current_version()
+    try:
+        return fetch_scores_version()
+    except Exception as e:
+        logger.warning("Could not read the model_scores version: %s", e)
+        return None
+
+@timed()
+def fetch_precomputed(user_id, opportunity_type, top_n):
+    """Precomputed rows with explanations for an unfiltered top-N list, or None if it must be generated live."""
+    store = get_insight_store()
+    if store is None:
+        return None
+    return store.get(user_id, opportunity_type, top_n, current_scores_version())
+
+@timed()
 def fetch_opportunities(user_id: str, opportunity_type: str, top_n: int, product_id: Optional[str]=None, segment: Optional[str]=None, territory: Optional[str]=None, account_id: Optional[str]=None):
-    conn = get_snowflake_connection()
-    cur = conn.cursor()
+    manager = get_scores_snapshot()
+    snapshot = manager.snapshot if manager is not None else None
+    if snapshot is not None:
+        return snapshot.query(user_id, opportunity_type, top_n, product_id, segment, territory, account_id)
+    cache = get_opportunity_cache()
+    if cache is None:
+        return _query_opportunities(user_id, opportunity_type, top_n, product_id, segment, territory, account_id)
+    key = (user_id, opportunity_type, product_id, segment, territory, account_id)
+    version = cache.current_version()
+    results = cache.get(key, top_n, version)
+    if results is not None:
+        return results
+    # Fetch a little more than asked so later requests for up to PREFETCH_N rows hit the cache
+    fetch_n = max(top_n, OPPORTUNITY_CACHE_PREFETCH_N)
+    results = _query_opportunities(user_id, opportunity_type, fetch_n, product_id, segment, territory, account_id)
+    cache.put(key, fetch_n, results, version)
+    return results[:top_n]
+
+def _query_opportunities(user_id, opportunity_type, top_n, product_id=None, segment=None, territory=None, account_id=None):
     query = """
         SELECT account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory
         FROM model_scores
@@ -50,42 +512,385 @@ def fetch_opportunities(user_id: str, opportunity_type: str, top_n: int, product
         params.append(account_id)
     query += " ORDER BY score DESC LIMIT %s"
     params.append(top_n)
-    cur.execute(query, tuple(params))
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, tuple(params))
+        results = cur.fetchall()
+        cur.close()
     return results
 
+@timed()
+def fetch_opportunities_batch(user_ids, opportunity_type: str, top_n: int, product_id=None, segment=None, territory=None, account_id=None):
+    """
+    fetch_opportunities for several users at once: {user_id: rows}, with one query for all users
+    not answered by the snapshot or the opportunity cache.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    manager = get_scores_snapshot()
+    snapshot = manager.snapshot if manager is not None else None
+    if snapshot is not None:
+        return {user_id: snapshot.query(user_id, opportunity_type, top_n, product_id, segment, territory, account_id) for user_id in user_ids}
+    cache = get_opportunity_cache()
+    results, misses = {}, user_ids
+    if cache is not None:
+        version = cache.current_version()
+        misses = []
+        for user_id in user_ids:
+            cached = cache.get((user_id, opportunity_type, product_id, segment, territory, account_id), top_n, version)
+            if cached is None:
+                misses.append(user_id)
+            else:
+                results[user_id] = cached
+    if not misses:
+        return results
+    fetch_n = max(top_n, OPPORTUNITY_CACHE_PREFETCH_N) if cache is not None else top_n
+    fetched = _query_opportunities_batch(misses, opportunity_type, fetch_n, product_id, segment, territory, account_id)
+    for user_id in misses:
+        rows = fetched.get(user_id, [])
+        if cache is not None:
+            cache.put((user_id, opportunity_type, product_id, segment, territory, account_id), fetch_n, rows, version)
+        results[user_id] = rows[:top_n]
+    return results
+
+def _query_opportunities_batch(user_ids, opportunity_type, top_n, product_id=None, segment=None, territory=None, account_id=None):
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"""
+        SELECT user_id, account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory
+        FROM model_scores
+        WHERE user_id IN ({placeholders}) AND opportunity_type = %s
+    """
+    params = [*user_ids, opportunity_type]
+    for column, value in (("product_id", product_id), ("segment", segment), ("territory", territory), ("account_id", account_id)):
+        if value:
+            query += f" AND {column} = %s"
+            params.append(value)
+    query += """
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY score DESC) <= %s
+        ORDER BY user_id, score DESC
+    """
+    params.append(top_n)
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, tuple(params))
+        rows = cur.fetchall()
+        cur.close()
+    results = {}
+    for user_id, *row in rows:
+        results.setdefault(user_id, []).append(tuple(row))
+    return results
+
+@timed()
+def fetch_opportunity_page(user_id, opportunity_type, limit, after=None, product_id=None, segment=None, territory=None, account_id=None):
+    """
+    Up to limit rows of a ranked list in (score DESC, account_id, product_id) order, starting after the
+    `after` (score, account_id, product_id) key. Seeks on the key instead of using OFFSET, so deep pages
+    read no more rows than the first one.
+    """
+    manager = get_scores_snapshot()
+    snapshot = manager.snapshot if manager is not None else None
+    if snapshot is not None:
+        return snapshot.page(user_id, opportunity_type, limit, after, product_id, segment, territory, account_id)
+    query = """
+        SELECT account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory
+        FROM model_scores
+        WHERE user_id = %s AND opportunity_type = %s
+    """
+    params = [user_id, opportunity_type]
+    for column, value in (("product_id", product_id), ("segment", segment), ("territory", territory), ("account_id", account_id)):
+        if value:
+            query += f" AND {column} = %s"
+            params.append(value)
+    if after is not None:
+        score, after_account, after_product = after
+        query += " AND (score < %s OR (score = %s AND (account_id > %s OR (account_id = %s AND product_id > %s))))"
+        params.extend([score, score, after_account, after_account, after_product])
+    query += " ORDER BY score DESC, account_id, product_id LIMIT %s"
+    params.append(limit)
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, tuple(params))
+        results = cur.fetchall()
+        cur.close()
+    return results
+
+def encode_cursor(row):
+    """Opaque page cursor: the (score, account_id, product_id) key of the last row served."""
+    key = json.dumps([float(row[4]), row[0], row[2]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        score, account_id, product_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), str(account_id), str(product_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@timed()
 def fetch_shap_values(account_id, product_id):
-    conn = get_snowflake_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT feature_name, shap_value
-        FROM shap_values
-        WHERE account_id = %s AND product_id = %s
-        ORDER BY ABS(shap_value) DESC
-        LIMIT 3
-    """, (account_id, product_id))
-    features = cur.fetchall()
-    cur.close()
-    conn.close()
+    store = get_shap_store()
+    if store is not None:
+        features = store.get_many([(account_id, product_id)])[(account_id, product_id)]
+        if features is not None:
+            return features[:3]
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT feature_name, shap_value
+            FROM shap_values
+            WHERE account_id = %s AND product_id = %s
+            ORDER BY ABS(shap_value) DESC
+            LIMIT 3
+        """, (account_id, product_id))
+        features = cur.fetchall()
+        cur.close()
     return features
 
+@timed()
 def fetch_business_context(account_id, product_id):
-    conn = get_snowflake_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT context_text
-        FROM business_context
-        WHERE account_id = %s AND product_id = %s
-        LIMIT 1
-    """, (account_id, product_id))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT context_text
+            FROM business_context
+            WHERE account_id = %s AND product_id = %s
+            LIMIT 1
+        """, (account_id, product_id))
+        row = cur.fetchone()
+        cur.close()
     return row[0] if row else ""
 
-def generate_llm_explanation(account_name, product_name, opportunity_type, top_features, business_context):
+def _pair_filter(pairs):
+    """Build a `(account_id, product_id) IN (...)` clause and its params for a list of pairs."""
+    placeholders = ", ".join(["(%s, %s)"] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+    return f"(account_id, product_id) IN ({placeholders})", params
+
+@timed()
+def fetch_shap_values_batch(pairs):
+    """
+    Top-3 SHAP features for every (account_id, product_id) pair: from the SHAP store when it is
+    current, with one query for any pairs it doesn't have.
+    Returns {(account_id, product_id): [(feature_name, shap_value), ...]}.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    store = get_shap_store()
+    stored = {}
+    if store is not None:
+        stored = {pair: features[:3] for pair, features in store.get_many(pairs).items() if features is not None}
+        pairs = [pair for pair in pairs if pair not in stored]
+        if not pairs:
+            return stored
+    where, params = _pair_filter(pairs)
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT account_id, product_id, feature_name, shap_value
+            FROM shap_values
+            WHERE {where}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY account_id, product_id ORDER BY ABS(shap_value) DESC) <= 3
+            ORDER BY account_id, product_id, ABS(shap_value) DESC
+        """, tuple(params))
+        rows = cur.fetchall()
+        cur.close()
+    features = {**stored, **{pair: [] for pair in pairs}}
+    for account_id, product_id, feature_name, shap_value in rows:
+        features.setdefault((account_id, product_id), []).append((feature_name, shap_value))
+    return features
+
+@timed()
+def fetch_business_context_batch(pairs):
+    """
+    Business context for every (account_id, product_id) pair in one query.
+    Returns {(account_id, product_id): context_text}, with "" for pairs without context.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    where, params = _pair_filter(pairs)
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT account_id, product_id, context_text
+            FROM business_context
+            WHERE {where}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY account_id, product_id ORDER BY account_id) = 1
+        """, tuple(params))
+        rows = cur.fetchall()
+        cur.close()
+    contexts = {pair: "" for pair in pairs}
+    for account_id, product_id, context_text in rows:
+        contexts[(account_id, product_id)] = context_text or ""
+    return contexts
+
+SUMMARY_SECTIONS = (("top_opportunities", "cross_sell", 3), ("top_risks", "churn_risk", 2))
+
+@timed()
+def fetch_summary_inputs(user_id):
+    """
+    Everything /api/summary needs from Snowflake in one round trip: the top rows of each
+    summary section (UNION ALL), plus their top-3 SHAP features and business context.
+    Returns ({section: [score rows]}, {(account_id, product_id): shap features}, {(account_id, product_id): context}).
+    """
+    branches, params = [], []
+    for index, (_, opportunity_type, top_n) in enumerate(SUMMARY_SECTIONS):
+        branches.append(f"""
+            SELECT {index} AS section, account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory,
+                   ROW_NUMBER() OVER (ORDER BY score DESC) AS position
+            FROM model_scores
+            WHERE user_id = %s AND opportunity_type = %s
+            QUALIFY position <= %s
+        """)
+        params.extend([user_id, opportunity_type, top_n])
+    query = f"""
+        WITH ranked AS ({" UNION ALL ".join(branches)}),
+        pairs AS (SELECT DISTINCT account_id, product_id FROM ranked),
+        shap AS (
+            SELECT s.account_id, s.product_id, s.feature_name, s.shap_value
+            FROM shap_values s JOIN pairs p ON s.account_id = p.account_id AND s.product_id = p.product_id
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY s.account_id, s.product_id ORDER BY ABS(s.shap_value) DESC) <= 3
+        ),
+        context AS (
+            SELECT c.account_id, c.product_id, c.context_text
+            FROM business_context c JOIN pairs p ON c.account_id = p.account_id AND c.product_id = p.product_id
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY c.account_id, c.product_id ORDER BY c.account_id) = 1
+        )
+        SELECT r.section, r.position, r.account_id, r.account_name, r.product_id, r.product_name, r.score,
+               r.opportunity_type, r.segment, r.territory, c.context_text, s.feature_name, s.shap_value
+        FROM ranked r
+        LEFT JOIN context c ON c.account_id = r.account_id AND c.product_id = r.product_id
+        LEFT JOIN shap s ON s.account_id = r.account_id AND s.product_id = r.product_id
+        ORDER BY r.section, r.position, ABS(s.shap_value) DESC
+    """
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, tuple(params))
+        rows = cur.fetchall()
+        cur.close()
+
+    # One output row per (score row, SHAP feature); fold them back together
+    sections = {name: [] for name, _, _ in SUMMARY_SECTIONS}
+    shap_by_pair, context_by_pair, seen = {}, {}, set()
+    for section, position, *score_row, context_text, feature_name, shap_value in rows:
+        pair = (score_row[0], score_row[2])
+        if (section, position) not in seen:
+            seen.add((section, position))
+            sections[SUMMARY_SECTIONS[section][0]].append(tuple(score_row))
+            shap_by_pair.setdefault(pair, [])
+            context_by_pair[pair] = context_text or ""
+        # A pair can appear in both sections; its features are only kept once
+        if feature_name is not None and (feature_name, shap_value) not in shap_by_pair[pair]:
+            shap_by_pair[pair].append((feature_name, shap_value))
+    return sections, shap_by_pair, context_by_pair
+
+@timed()
+def fetch_account_product_names(account_id, product_id):
+    """(account_name, product_name) for an account/product pair, or None if it isn't scored."""
+    with get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT account_name, product_name
+            FROM model_scores
+            WHERE account_id = %s AND product_id = %s
+            LIMIT 1
+        """, (account_id, product_id))
+        row = cur.fetchone()
+        cur.close()
+    return row
+
+def complete_prompt(prompt, max_tokens, temperature, account_id=None, product_id=None, cache_if=None, purpose="completion", priority=None):
+    """
+    Run a single-prompt completion through the LLM response cache and the scheduler.
+    account_id/product_id tag the cached entry for purging; cache_if can reject responses that shouldn't be stored.
+    purpose labels the call in the LLM request and token metrics; priority overrides the request's scheduling class.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(llm_cache_model(), prompt, {"max_tokens": max_tokens, "temperature": temperature})
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_completion(purpose, outcome="cache_hit")
+            return cached
+    messages = [{"role": "user", "content": prompt}]
+    try:
+        with stage_timer("llm_call"):
+            completion = get_llm_scheduler().call(
+                partial(get_llm_provider().complete, messages, model=LLM_MODEL, max_tokens=max_tokens, temperature=temperature),
+                tokens=count_message_tokens(messages, LLM_MODEL) + max_tokens,
+                priority=priority,
+                # The executor stops waiting after LLM_CALL_TIMEOUT; don't keep queueing or retrying past it
+                deadline=time.monotonic() + LLM_CALL_TIMEOUT,
+                usage=_completion_tokens_used,
+            )
+    except Exception:
+        record_llm_completion(purpose, outcome="error")
+        raise
+    record_llm_completion(purpose, completion)
+    content = completion.text.strip()
+    if cache is not None and (cache_if is None or cache_if(content)):
+        cache.set(key, content, account_id=account_id, product_id=product_id)
+    return content
+
+def stream_prompt(prompt, max_tokens, temperature, account_id=None, product_id=None, purpose="completion", priority=None):
+    """
+    Streaming counterpart of complete_prompt: yields text chunks as the model produces them.
+    A cache hit is yielded as a single chunk; a fully streamed response is written to the cache.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(llm_cache_model(), prompt, {"max_tokens": max_tokens, "temperature": temperature})
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_completion(purpose, outcome="cache_hit")
+            yield cached
+            return
+    messages = [{"role": "user", "content": prompt}]
+    tokens = get_llm_scheduler().stream(
+        partial(get_llm_provider().stream, messages, model=LLM_MODEL, max_tokens=max_tokens, temperature=temperature),
+        tokens=count_message_tokens(messages, LLM_MODEL) + max_tokens,
+        priority=priority,
+        deadline=time.monotonic() + LLM_CALL_TIMEOUT,
+    )
+    parts = []
+    started = time.perf_counter()
+    try:
+        for token in tokens:
+            if not parts:
+                # Match complete_prompt's .strip() on the leading side
+                token = token.lstrip()
+            if token:
+                parts.append(token)
+                yield token
+    except Exception:
+        record_llm_completion(purpose, outcome="error")
+        raise
+    finally:
+        record_stage("llm_stream", started, time.perf_counter())
+    content = "".join(parts).strip()
+    # Streamed responses carry no usage block, so tokens are counted locally
+    record_llm_completion(purpose, Completion(content, count_message_tokens(messages, LLM_MODEL), count_tokens(content, LLM_MODEL)))
+    if cache is not None and content:
+        cache.set(key, content, account_id=account_id, product_id=product_id)
+
+def digest_business_context(business_context, account_id=None, product_id=None, purpose="completion"):
+    """Business context as it goes into a prompt: digested to CONTEXT_DIGEST_MAX_TOKENS, with the tokens saved recorded."""
+    digester = get_context_digester()
+    if digester is None or not business_context:
+        return business_context
+    key = (account_id, product_id) if account_id is not None else None
+    digest, report = digester.digest(business_context, key=key)
+    CONTEXT_TOKENS_SAVED.observe(report["tokens_saved"], purpose=purpose)
+    return digest
+
+@timed()
+@coalesce_generation
+def generate_llm_explanation(account_name, product_name, opportunity_type, top_features, business_context, account_id=None, product_id=None):
+    business_context = digest_business_context(business_context, account_id, product_id, purpose="explanation")
+    return _complete_explanation(account_name, product_name, opportunity_type, top_features, business_context, account_id, product_id)
+
+def _complete_explanation(account_name, product_name, opportunity_type, top_features, context_digest, account_id=None, product_id=None):
+    # generate_llm_explanation for business context that has already been digested
     features_str = ", ".join([f"{name} ({value:+.2f})" for name, value in top_features])
     prompt = f"""
 Given the following:
@@ -93,55 +898,180 @@ Given the following:
 - Product: {product_name}
 - Opportunity type: {opportunity_type}
 - Top features driving the score: {features_str}
-- Business context: {business_context}
+- Business context: {context_digest}
 
 Generate a concise, business-friendly explanation of why this account is a good {opportunity_type.replace('_', ' ')} opportunity for this product.
 """
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=100,
-        temperature=0.7
-    )
-    return response.choices[0].message['content'].strip()
+    return complete_prompt(prompt, max_tokens=100, temperature=0.7, account_id=account_id, product_id=product_id, purpose="explanation")
 
-def generate_next_action(top_features, business_context, opportunity_type):
+@timed()
+@coalesce_generation
+def generate_next_action(top_features, business_context, opportunity_type, account_id=None, product_id=None):
+    business_context = digest_business_context(business_context, account_id, product_id, purpose="next_action")
+    return _complete_next_action(top_features, business_context, opportunity_type, account_id, product_id)
+
+def _complete_next_action(top_features, context_digest, opportunity_type, account_id=None, product_id=None):
+    # generate_next_action for business context that has already been digested
     features_str = ", ".join([f"{name} ({value:+.2f})" for name, value in top_features])
     prompt = f"""
 Given the following:
 - Opportunity type: {opportunity_type}
 - Top features: {features_str}
-- Business context: {business_context}
+- Business context: {context_digest}
 
 Suggest the next best sales action for the sales rep to take with this account and product. Be specific and actionable.
 """
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=60,
-        temperature=0.7
-    )
-    return response.choices[0].message['content'].strip()
+    return complete_prompt(prompt, max_tokens=60, temperature=0.7, account_id=account_id, product_id=product_id, purpose="next_action")
+
+INSIGHT_FIELDS = ("explanation", "next_action")
 
-def generate_personalized_pitch(account_name, product_name, business_context):
+def parse_insight_response(text):
+    """
+    Validate a combined-generation response: a JSON object with non-empty string
+    `explanation` and `next_action` fields. Returns the dict, or None if invalid.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        # Tolerate ```json fenced output
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    insight = {}
+    for field in INSIGHT_FIELDS:
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        insight[field] = value.strip()
+    return insight
+
+@timed()
+@coalesce_generation
+def generate_explanation_and_next_action(account_name, product_name, opportunity_type, top_features, business_context, account_id=None, product_id=None):
+    """
+    Generate the explanation and next best action in a single LLM call.
+    Falls back to the two separate generators if the structured response can't be parsed.
+    """
+    features_str = ", ".join([f"{name} ({value:+.2f})" for name, value in top_features])
+    context_digest = digest_business_context(business_context, account_id, product_id, purpose="insight")
     prompt = f"""
 Given the following:
 - Account: {account_name}
 - Product: {product_name}
+- Opportunity type: {opportunity_type}
+- Top features driving the score: {features_str}
+- Business context: {context_digest}
+
+Respond with only a JSON object with two string fields:
+- "explanation": a concise, business-friendly explanation of why this account is a good {opportunity_type.replace('_', ' ')} opportunity for this product.
+- "next_action": the next best sales action for the sales rep to take with this account and product. Be specific and actionable.
+"""
+    content = complete_prompt(
+        prompt, max_tokens=160, temperature=0.7, account_id=account_id, product_id=product_id,
+        cache_if=lambda text: parse_insight_response(text) is not None, purpose="insight",
+    )
+    insight = parse_insight_response(content)
+    if insight is None:
+        logger.warning("Combined generation returned invalid JSON for %s/%s, falling back to separate calls", account_name, product_name)
+        # The context is already digested (and its tokens saved recorded) for this row
+        insight = {
+            "explanation": _complete_explanation(account_name, product_name, opportunity_type, top_features, context_digest, account_id, product_id),
+            "next_action": _complete_next_action(top_features, context_digest, opportunity_type, account_id, product_id),
+        }
+    return insight
+
+def build_pitch_prompt(account_name, product_name, business_context, account_id=None, product_id=None):
+    business_context = digest_business_context(business_context, account_id, product_id, purpose="pitch")
+    return f"""
+Given the following:
+- Account: {account_name}
+- Product: {product_name}
 - Business context: {business_context}
 
 Generate a personalized sales pitch email for this account and product. Make it relevant, concise, and actionable.
 """
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=120,
-        temperature=0.7
+
+@timed()
+@coalesce_generation
+def generate_personalized_pitch(account_name, product_name, business_context, account_id=None, product_id=None):
+    prompt = build_pitch_prompt(account_name, product_name, business_context, account_id, product_id)
+    return complete_prompt(
+        prompt, max_tokens=120, temperature=0.7, account_id=account_id, product_id=product_id, purpose="pitch", priority=more_urgent("pitch")
+    )
+
+def stream_personalized_pitch(account_name, product_name, business_context, account_id=None, product_id=None):
+    """Yield the pitch text as it is generated; shares cache entries with generate_personalized_pitch."""
+    prompt = build_pitch_prompt(account_name, product_name, business_context, account_id, product_id)
+    # The generator body runs later on another thread, so resolve the priority now
+    return stream_prompt(
+        prompt, max_tokens=120, temperature=0.7, account_id=account_id, product_id=product_id, purpose="pitch", priority=more_urgent("pitch")
     )
-    return response.choices[0].message['content'].strip()
+
+INSIGHT_TIMED_OUT = {"explanation": LLM_TIMEOUT_MESSAGE, "next_action": LLM_TIMEOUT_MESSAGE}
+INSIGHT_FAILED = {"explanation": LLM_ERROR_MESSAGE, "next_action": LLM_ERROR_MESSAGE}
+
+def build_insight_calls(results, with_next_action):
+    """
+    Look up SHAP features and business context for scored rows (one batched query each)
+    and return one LLM call per row: explanation plus next action, or explanation only.
+    """
+    pairs = [(row[0], row[2]) for row in results]
+    shap_by_pair = fetch_shap_values_batch(pairs)
+    context_by_pair = fetch_business_context_batch(pairs)
+    calls = []
+    for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in results:
+        top_features = shap_by_pair.get((account_id, product_id), [])
+        business_context = context_by_pair.get((account_id, product_id), "")
+        if with_next_action:
+            calls.append(partial(generate_explanation_and_next_action, account_name, product_name, opp_type, top_features, business_context, account_id, product_id))
+        else:
+            calls.append(partial(generate_llm_explanation, account_name, product_name, opp_type, top_features, business_context, account_id, product_id))
+    return calls
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def stream_insights(results, with_next_action):
+    """
+    SSE stream for scored rows: a `rows` event with the scores straight away, then one
+    `insight` event per row as its LLM output completes, then `done`.
+    """
+    rows = []
+    for index, (account_id, account_name, product_id, product_name, score, opp_type, seg, terr) in enumerate(results):
+        rows.append({
+            "index": index,
+            "account": account_name,
+            "product": product_name,
+            "score": float(score),
+            "opportunity_type": opp_type,
+            "segment": seg,
+            "territory": terr,
+        })
+    yield sse_event("rows", rows)
+    try:
+        calls = await run_db(build_insight_calls, results, with_next_action)
+        on_timeout = INSIGHT_TIMED_OUT if with_next_action else LLM_TIMEOUT_MESSAGE
+        on_error = INSIGHT_FAILED if with_next_action else LLM_ERROR_MESSAGE
+        async for index, generated in get_llm_executor().as_completed(calls, on_timeout=on_timeout, on_error=on_error):
+            insight = generated if with_next_action else {"explanation": generated}
+            yield sse_event("insight", {"index": index, **insight})
+    except Exception as e:
+        logger.exception("Streaming insights failed")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    yield sse_event("done", {"count": len(rows)})
 
 @app.get("/api/opportunities")
-def opportunities(
+@coalesce_requests
+async def opportunities(
     user_id: str,
     opportunity_type: str = Query(..., regex="^(cross_sell|upsell|prospect)$"),
     top_n: int = Query(5, ge=1, le=20),
@@ -153,15 +1083,21 @@ def opportunities(
     """
     Get top N opportunities for a user, with optional filtering by product, segment, territory, or account.
     """
-    results = fetch_opportunities(user_id, opportunity_type, top_n, product_id, segment, territory, account_id)
+    if not any((product_id, segment, territory, account_id)):
+        stored = await run_db(fetch_precomputed, user_id, opportunity_type, top_n)
+        if stored:
+            return [
+                {key: item[key] for key in ("account", "product", "score", "opportunity_type", "segment", "territory", "explanation", "next_action")}
+                for item in stored
+            ]
+    results = await run_db(fetch_opportunities, user_id, opportunity_type, top_n, product_id, segment, territory, account_id)
     if not results:
         raise HTTPException(status_code=404, detail="No opportunities found.")
+    calls = await run_db(build_insight_calls, results, with_next_action=True)
+    insights = await get_llm_executor().gather(calls, on_timeout=INSIGHT_TIMED_OUT, on_error=INSIGHT_FAILED)
     response = []
-    for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in results:
-        top_features = fetch_shap_values(account_id, product_id)
-        business_context = fetch_business_context(account_id, product_id)
-        explanation = generate_llm_explanation(account_name, product_name, opp_type, top_features, business_context)
-        next_action = generate_next_action(top_features, business_context, opp_type)
+    for (account_id, account_name, product_id, product_name, score, opp_type, seg, terr), insight in zip(results, insights):
+        explanation, next_action = insight["explanation"], insight["next_action"]
         response.append({
             "account": account_name,
             "product": product_name,
@@ -175,7 +1111,8 @@ def opportunities(
     return response
 
 @app.get("/api/churn_risk")
-def churn_risk(
+@coalesce_requests
+async def churn_risk(
     user_id: str,
     top_n: int = Query(5, ge=1, le=20),
     segment: Optional[str] = None,
@@ -184,14 +1121,17 @@ def churn_risk(
     """
     Get top N accounts at risk of churn for a user, with optional filtering by segment or territory.
     """
-    results = fetch_opportunities(user_id, 'churn_risk', top_n, None, segment, territory)
+    if not segment and not territory:
+        stored = await run_db(fetch_precomputed, user_id, 'churn_risk', top_n)
+        if stored:
+            return [{key: item[key] for key in ("account", "product", "score", "segment", "territory", "explanation")} for item in stored]
+    results = await run_db(fetch_opportunities, user_id, 'churn_risk', top_n, None, segment, territory)
     if not results:
         raise HTTPException(status_code=404, detail="No churn risk accounts found.")
+    calls = await run_db(build_insight_calls, results, with_next_action=False)
+    explanations = await get_llm_executor().gather(calls, on_timeout=LLM_TIMEOUT_MESSAGE, on_error=LLM_ERROR_MESSAGE)
     response = []
-    for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in results:
-        top_features = fetch_shap_values(account_id, product_id)
-        business_context = fetch_business_context(account_id, product_id)
-        explanation = generate_llm_explanation(account_name, product_name, opp_type, top_features, business_context)
+    for (account_id, account_name, product_id, product_name, score, opp_type, seg, terr), explanation in zip(results, explanations):
         response.append({
             "account": account_name,
             "product": product_name,
@@ -202,81 +1142,368 @@ def churn_risk(
         })
     return response
 
-@app.get("/api/summary")
-def summary(
-    user_id: str
+@app.get("/api/opportunities/stream")
+async def opportunities_stream(
+    user_id: str,
+    opportunity_type: str = Query(..., regex="^(cross_sell|upsell|prospect)$"),
+    top_n: int = Query(5, ge=1, le=20),
+    product_id: Optional[str] = None,
+    segment: Optional[str] = None,
+    territory: Optional[str] = None,
+    account_id: Optional[str] = None
 ):
     """
-    Get a summary of top 3 opportunities and top 2 risks for a user.
+    Streaming version of /api/opportunities (Server-Sent Events): scored rows are sent immediately,
+    followed by each row's explanation and next action as they are generated.
+    """
+    results = await run_db(fetch_opportunities, user_id, opportunity_type, top_n, product_id, segment, territory, account_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="No opportunities found.")
+    return StreamingResponse(stream_insights(results, with_next_action=True), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/churn_risk/stream")
+async def churn_risk_stream(
+    user_id: str,
+    top_n: int = Query(5, ge=1, le=20),
+    segment: Optional[str] = None,
+    territory: Optional[str] = None
+):
+    """
+    Streaming version of /api/churn_risk (Server-Sent Events): scored rows are sent immediately,
+    followed by each row's explanation as it is generated.
     """
-    top_opps = fetch_opportunities(user_id, 'cross_sell', 3)
-    top_risks = fetch_opportunities(user_id, 'churn_risk', 2)
-    opps_response = []
-    for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in top_opps:
-        top_features = fetch_shap_values(account_id, product_id)
-        business_context = fetch_business_context(account_id, product_id)
-        explanation = generate_llm_explanation(account_name, product_name, opp_type, top_features, business_context)
-        opps_response.append({
+    results = await run_db(fetch_opportunities, user_id, 'churn_risk', top_n, None, segment, territory)
+    if not results:
+        raise HTTPException(status_code=404, detail="No churn risk accounts found.")
+    return StreamingResponse(stream_insights(results, with_next_action=False), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/opportunities/browse")
+async def browse_opportunities(
+    user_id: str,
+    opportunity_type: str = Query(..., regex="^(cross_sell|upsell|prospect|churn_risk)$"),
+    page_size: int = Query(50, ge=1, le=BROWSE_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    explain: bool = False,
+    product_id: Optional[str] = None,
+    segment: Optional[str] = None,
+    territory: Optional[str] = None,
+    account_id: Optional[str] = None
+):
+    """
+    Page through a user's full ranked list, beyond the top_n cap of /api/opportunities and /api/churn_risk.
+    Rows come without LLM text; pass explain=true (page_size <= 20) to generate explanations for that page,
+    e.g. by re-requesting the same cursor. next_cursor is null on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if explain and page_size > BROWSE_MAX_EXPLAINED_ROWS:
+        raise HTTPException(status_code=400, detail=f"explain=true supports page_size up to {BROWSE_MAX_EXPLAINED_ROWS}.")
+    # One extra row tells us whether there is a next page
+    results = await run_db(fetch_opportunity_page, user_id, opportunity_type, page_size + 1, after, product_id, segment, territory, account_id)
+    results, has_more = results[:page_size], len(results) > page_size
+    items = [
+        {
+            "account_id": account_id,
             "account": account_name,
+            "product_id": product_id,
             "product": product_name,
             "score": float(score),
+            "opportunity_type": opp_type,
             "segment": seg,
             "territory": terr,
-            "explanation": explanation
-        })
-    risks_response = []
-    for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in top_risks:
-        top_features = fetch_shap_values(account_id, product_id)
-        business_context = fetch_business_context(account_id, product_id)
-        explanation = generate_llm_explanation(account_name, product_name, opp_type, top_features, business_context)
-        risks_response.append({
+        }
+        for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in results
+    ]
+    if explain and results:
+        with_next_action = opportunity_type != "churn_risk"
+        calls = await run_db(build_insight_calls, results, with_next_action)
+        insights = await get_llm_executor().gather(
+            calls,
+            on_timeout=INSIGHT_TIMED_OUT if with_next_action else LLM_TIMEOUT_MESSAGE,
+            on_error=INSIGHT_FAILED if with_next_action else LLM_ERROR_MESSAGE,
+        )
+        for item, insight in zip(items, insights):
+            item.update(insight if with_next_action else {"explanation": insight})
+    return {"items": items, "next_cursor": encode_cursor(results[-1]) if has_more else None}
+
+@app.get("/api/opportunities/batch")
+@coalesce_requests
+async def opportunities_batch(
+    user_ids: List[str] = Query(...),
+    opportunity_type: str = Query(..., regex="^(cross_sell|upsell|prospect|churn_risk)$"),
+    top_n: int = Query(5, ge=1, le=20),
+    explain: bool = False,
+    product_id: Optional[str] = None,
+    segment: Optional[str] = None,
+    territory: Optional[str] = None,
+    account_id: Optional[str] = None
+):
+    """
+    Top N opportunities for several users (e.g. a manager's reps, ?user_ids=u1&user_ids=u2) in one request,
+    grouped by user. Rows for all users come from one windowed query; explain=true adds explanations
+    (and next actions, except for churn_risk), generated concurrently across all users.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_USERS} user_ids per request.")
+    if explain and len(user_ids) * top_n > BATCH_MAX_EXPLAINED_ROWS:
+        raise HTTPException(status_code=400, detail=f"explain=true supports at most {BATCH_MAX_EXPLAINED_ROWS} rows (user_ids x top_n) per request.")
+    with_next_action = opportunity_type != "churn_risk"
+    fields = ("account", "product", "score", "opportunity_type", "segment", "territory")
+    if explain:
+        fields += ("explanation", "next_action") if with_next_action else ("explanation",)
+
+    grouped = {}
+    if explain and not any((product_id, segment, territory, account_id)):
+        stored = await run_db(lambda: {user_id: fetch_precomputed(user_id, opportunity_type, top_n) for user_id in user_ids})
+        for user_id, items in stored.items():
+            if items:
+                grouped[user_id] = [{key: item[key] for key in fields} for item in items]
+    pending = [user_id for user_id in user_ids if user_id not in grouped]
+    results = await run_db(fetch_opportunities_batch, pending, opportunity_type, top_n, product_id, segment, territory, account_id) if pending else {}
+    rows = [(user_id, row) for user_id in pending for row in results.get(user_id, [])]
+    insights = [None] * len(rows)
+    if explain and rows:
+        calls = await run_db(build_insight_calls, [row for _, row in rows], with_next_action)
+        insights = await get_llm_executor().gather(
+            calls,
+            on_timeout=INSIGHT_TIMED_OUT if with_next_action else LLM_TIMEOUT_MESSAGE,
+            on_error=INSIGHT_FAILED if with_next_action else LLM_ERROR_MESSAGE,
+        )
+    for user_id in pending:
+        grouped[user_id] = []
+    for (user_id, (_, account_name, _, product_name, score, opp_type, seg, terr)), insight in zip(rows, insights):
+        item = {
             "account": account_name,
             "product": product_name,
             "score": float(score),
+            "opportunity_type": opp_type,
             "segment": seg,
             "territory": terr,
-            "explanation": explanation
-        })
-    return {"top_opportunities": opps_response, "top_risks": risks_response}
+        }
+        if insight is not None:
+            item.update(insight if with_next_action else {"explanation": insight})
+        grouped[user_id].append(item)
+    return {"users": {user_id: grouped[user_id] for user_id in user_ids}}
+
+@app.get("/api/export/opportunities")
+def export_opportunities(
+    format: str = Query("ndjson", regex="^(ndjson|csv|parquet)$"),
+    include_shap: bool = False,
+    user_id: Optional[str] = None,
+    opportunity_type: Optional[str] = Query(None, regex="^(cross_sell|upsell|prospect|churn_risk)$"),
+    product_id: Optional[str] = None,
+    segment: Optional[str] = None,
+    territory: Optional[str] = None
+):
+    """
+    Stream every matching model_scores row as NDJSON, CSV or Parquet, without LLM text.
+    include_shap adds the top-3 SHAP features and values as columns, joined in Snowflake.
+    Rows are fetched and sent batch by batch, so memory use doesn't grow with the export.
+    """
+    if not export_format_available(format):
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server.")
+    media_type, extension = EXPORT_FORMATS[format]
+    filters = {
+        "user_id": user_id, "opportunity_type": opportunity_type, "product_id": product_id, "segment": segment, "territory": territory,
+    }
+    name = "_".join(["opportunities"] + [value for value in filters.values() if value])
+    name = "".join(c if c.isalnum() or c in "_-" else "_" for c in name)
+    chunks = stream_export(get_snowflake_connection, format, filters, include_shap, batch_rows=EXPORT_BATCH_ROWS)
+    # StreamingResponse iterates sync generators in a worker thread, so the blocking fetches are fine here
+    return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'})
+
+@app.get("/api/summary")
+@coalesce_requests
+async def summary(
+    user_id: str
+):
+    """
+    Get a summary of top 3 opportunities and top 2 risks for a user.
+    """
+    stored = {name: await run_db(fetch_precomputed, user_id, opportunity_type, top_n) for name, opportunity_type, top_n in SUMMARY_SECTIONS}
+    if all(items is not None for items in stored.values()):
+        keys = ("account", "product", "score", "segment", "territory", "explanation")
+        return {name: [{key: item[key] for key in keys} for item in items] for name, items in stored.items()}
+    sections, shap_by_pair, context_by_pair = await run_db(fetch_summary_inputs, user_id)
+    rows = [row for name, _, _ in SUMMARY_SECTIONS for row in sections[name]]
+    explanations = await get_llm_executor().gather([
+        partial(
+            generate_llm_explanation, account_name, product_name, opp_type,
+            shap_by_pair.get((account_id, product_id), []),
+            context_by_pair.get((account_id, product_id), ""),
+            account_id, product_id,
+        )
+        for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in rows
+    ], on_timeout=LLM_TIMEOUT_MESSAGE, on_error=LLM_ERROR_MESSAGE)
+    explanations = iter(explanations)
+    response = {}
+    for name, _, _ in SUMMARY_SECTIONS:
+        response[name] = [
+            {
+                "account": account_name,
+                "product": product_name,
+                "score": float(score),
+                "segment": seg,
+                "territory": terr,
+                "explanation": next(explanations)
+            }
+            for account_id, account_name, product_id, product_name, score, opp_type, seg, terr in sections[name]
+        ]
+    return response
 
 @app.get("/api/pitch")
-def personalized_pitch(
+@coalesce_requests
+async def personalized_pitch(
     account_id: str,
     product_id: str
 ):
     """
     Generate a personalized sales pitch for a given account and product.
     """
-    conn = get_snowflake_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT account_name, product_name
-        FROM model_scores
-        WHERE account_id = %s AND product_id = %s
-        LIMIT 1
-    """, (account_id, product_id))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = await run_db(fetch_account_product_names, account_id, product_id)
     if not row:
         raise HTTPException(status_code=404, detail="Account/Product not found.")
     account_name, product_name = row
-    business_context = fetch_business_context(account_id, product_id)
-    pitch = generate_personalized_pitch(account_name, product_name, business_context)
+    business_context = await run_db(fetch_business_context, account_id, product_id)
+    pitch = await get_llm_executor().run(
+        partial(generate_personalized_pitch, account_name, product_name, business_context, account_id, product_id)
+    )
     return {"account": account_name, "product": product_name, "pitch": pitch}
 
-@app.post("/api/chat")
-async def chat(request: Request):
+@app.get("/api/pitch/stream")
+def personalized_pitch_stream(
+    account_id: str,
+    product_id: str
+):
     """
-    Conversational endpoint: accepts a user message, uses OpenAI to extract intent and entities,
-    routes to the correct backend logic, and returns a conversational response.
+    Streaming version of /api/pitch (Server-Sent Events): a `meta` event with the account and product,
+    one `token` event per chunk of generated text, then `done` with the full pitch.
     """
-    data = await request.json()
-    user_message = data.get("message")
-    user_id = data.get("user_id")
-    history = data.get("history", [])
+    row = fetch_account_product_names(account_id, product_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Account/Product not found.")
+    account_name, product_name = row
+    business_context = fetch_business_context(account_id, product_id)
+
+    def events():
+        yield sse_event("meta", {"account": account_name, "product": product_name})
+        parts = []
+        try:
+            for token in stream_personalized_pitch(account_name, product_name, business_context, account_id, product_id):
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            logger.exception("Streaming pitch failed")
+            yield sse_event("error", {"detail": str(e)})
+            return
+        yield sse_event("done", {"pitch": "".join(parts).strip()})
+
+    # StreamingResponse iterates sync generators in a worker thread, so the blocking LLM stream is fine here
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage durations, HTTP latency, LLM requests and tokens, pool gauges."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/pool")
+def pool_metrics():
+    """
+    Snowflake connection pool metrics: connections in use, waiting callers, and acquire latency.
+    """
+    return get_db_pool().metrics()
+
+@app.get("/api/admin/llm_cache")
+def llm_cache_stats():
+    """
+    LLM response cache counters: hits (memory and disk), misses, evictions.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/api/admin/opportunity_cache")
+def opportunity_cache_stats():
+    """
+    Scored-opportunity result cache counters and the model_scores version it is serving.
+    """
+    cache = get_opportunity_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/api/admin/intent")
+def intent_fast_path_stats():
+    """
+    Chat intent classification counters: fast-path and similarity-cache hit rates, agreement with the LLM classifier,
+    and prompt tokens saved by history compaction.
+    """
+    cache = get_intent_cache()
+    return {
+        **intent_stats.snapshot(),
+        "similarity_cache_index": cache.stats() if cache is not None else None,
+        "history_compaction": history_stats.snapshot(),
+    }
+
+@app.get("/api/admin/coalescing")
+def coalescing_stats():
+    """How many endpoint requests and generate_* calls joined an identical in-flight computation."""
+    return {"enabled": COALESCING_ENABLED, "endpoint": request_flight.stats(), "generate": generation_flight.stats()}
 
-    system_prompt = '''
+@app.get("/api/admin/llm_scheduler")
+def llm_scheduler_stats():
+    """LLM rate limiter state: grants and queue depth by priority, retries, 429s and deadline misses."""
+    return {
+        "requests_per_minute": LLM_RATE_LIMIT_RPM or None,
+        "tokens_per_minute": LLM_RATE_LIMIT_TPM or None,
+        **get_llm_scheduler().stats(),
+    }
+
+@app.get("/api/admin/context_digest")
+def context_digest_stats():
+    """Business-context digesting: digest cache hits/misses/invalidations and prompt tokens saved."""
+    digester = get_context_digester()
+    if digester is None:
+        return {"enabled": False}
+    return {"enabled": True, **digester.stats()}
+
+@app.get("/api/admin/shap_store")
+def shap_store_stats():
+    """Precomputed SHAP store: version, pairs, footprint by section and bytes per pair, lookup hits/misses."""
+    if not SHAP_STORE_ENABLED:
+        return {"enabled": False}
+    get_shap_store()
+    store = shap_store_file.current() if shap_store_file is not None else None
+    if store is None:
+        return {"enabled": True, "loaded": False}
+    return {"enabled": True, "loaded": True, "current": store.version == str(current_scores_version()), **store.stats()}
+
+@app.get("/api/admin/scores_snapshot")
+def scores_snapshot_stats():
+    """
+    In-memory model_scores snapshot status and memory footprint (with a projection for sizing worker RAM).
+    """
+    manager = get_scores_snapshot()
+    if manager is None:
+        return {"enabled": False}
+    return {"enabled": True, **manager.stats()}
+
+@app.delete("/api/admin/llm_cache")
+def purge_llm_cache(
+    account_id: Optional[str] = None,
+    product_id: Optional[str] = None
+):
+    """
+    Purge cached LLM responses for an account, a product, or an account/product pair.
+    """
+    if account_id is None and product_id is None:
+        raise HTTPException(status_code=400, detail="Provide account_id and/or product_id.")
+    cache = get_llm_cache()
+    purged = cache.purge(account_id=account_id, product_id=product_id) if cache is not None else 0
+    return {"purged": purged}
+
+INTENT_SYSTEM_PROMPT = '''
 You are a helpful sales and customer success assistant.
 Given a user message, classify which of the following intents it matches, and extract any relevant parameters:
 - top_opportunities (cross_sell, upsell, prospect)
@@ -300,28 +1527,110 @@ If the user asks for churn risk, set intent to "churn_risk".
 If the user asks for a summary, set intent to "summary".
 '''
 
-    # Build OpenAI messages array with context
-    messages = [{"role": "system", "content": system_prompt}]
-    for msg in history:
-        if msg.get("role") in ("user", "assistant"):
-            messages.append({"role": msg["role"], "content": msg["content"]})
+@timed("intent_llm")
+async def classify_intent_with_llm(user_message, history):
+    """
+    Classify a chat message with the LLM, using the conversation history for context.
+    Returns the parsed intent JSON, or None if the response isn't valid JSON.
+    """
+    # Build OpenAI messages array with context, compacted to the history token budget
+    compacted, report = compact_history(history, HISTORY_TOKEN_BUDGET, HISTORY_ASSISTANT_DIGEST_TOKENS, LLM_MODEL)
+    history_stats.record(report)
+    HISTORY_TOKENS_SAVED.observe(report["tokens_saved"])
+    logger.info(
+        "history compaction messages=%d->%d tokens=%d->%d saved=%d",
+        report["messages_in"], report["messages_kept"], report["tokens_before"], report["tokens_after"], report["tokens_saved"],
+    )
+    messages = [{"role": "system", "content": INTENT_SYSTEM_PROMPT}, *compacted]
     messages.append({"role": "user", "content": f"User message: {user_message}"})
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=300,
-        temperature=0
-    )
     try:
-        import json
-        intent_data = json.loads(response.choices[0].message['content'])
+        completion = await asyncio.wait_for(get_llm_scheduler().call_async(
+            partial(get_llm_provider().acomplete, messages, model=LLM_MODEL, max_tokens=300, temperature=0),
+            tokens=count_message_tokens(messages, LLM_MODEL) + 300,
+            usage=_completion_tokens_used,
+        ), LLM_CALL_TIMEOUT)
     except Exception:
-        return JSONResponse({"response": "Sorry, I couldn't understand your request."})
+        record_llm_completion("intent", outcome="error")
+        raise
+    record_llm_completion("intent", completion)
+    try:
+        intent_data = json.loads(completion.text)
+    except Exception:
+        return None
+    return intent_data if isinstance(intent_data, dict) else None
+
+_shadow_tasks = set()
+
+async def shadow_compare_intent(user_message, history, local_intent):
+    """Re-classify a fast-path message with the LLM in the background to measure agreement."""
+    # Measurement only: never take quota from real requests
+    current_priority.set("bulk")
+    try:
+        llm_intent = await classify_intent_with_llm(user_message, history)
+    except Exception as e:
+        logger.warning("Shadow intent classification failed: %s", e)
+        return
+    agreed = intents_agree(local_intent, llm_intent)
+    intent_stats.record_comparison(agreed)
+    logger.info(
+        "intent shadow local_intent=%s llm_intent=%s agreed=%s",
+        local_intent.get("intent"), (llm_intent or {}).get("intent"), agreed,
+    )
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    """
+    Conversational endpoint: accepts a user message, extracts intent and entities (locally when
+    confident, otherwise with OpenAI), routes to the correct backend logic, and returns a conversational response.
+    """
+    # Everything chat triggers (classification, lists, pitches) is scheduled ahead of other LLM work
+    current_priority.set("chat")
+    data = await request.json()
+    user_message = data.get("message")
+    user_id = data.get("user_id")
+    history = data.get("history", [])
+
+    # 1. Classify intent: the local fast path first, then cached LLM parses of near-identical
+    #    messages, and the LLM classifier only when neither applies
+    with stage_timer("intent_local"):
+        local_intent, confidence = extract_intent(user_message)
+    cache = get_intent_cache()
+    cached = None
+    if cache is not None and not (local_intent is not None and confidence >= INTENT_FAST_PATH_THRESHOLD):
+        with stage_timer("intent_cache"):
+            cached = await run_in_threadpool(cache.lookup, user_message)
+    if local_intent is not None and confidence >= INTENT_FAST_PATH_THRESHOLD:
+        intent_data = local_intent
+        intent_stats.record("fast_path")
+        logger.info("intent source=fast_path intent=%s confidence=%.2f", intent_data.get("intent"), confidence)
+        if INTENT_SHADOW_SAMPLE_RATE > 0 and random.random() < INTENT_SHADOW_SAMPLE_RATE:
+            task = asyncio.create_task(shadow_compare_intent(user_message, history, local_intent))
+            _shadow_tasks.add(task)
+            task.add_done_callback(_shadow_tasks.discard)
+    elif cached is not None:
+        intent_data, similarity = cached
+        intent_stats.record("similarity_cache")
+        logger.info("intent source=similarity_cache intent=%s similarity=%.2f", intent_data.get("intent"), similarity)
+    else:
+        try:
+            intent_data = await classify_intent_with_llm(user_message, history)
+        except asyncio.TimeoutError:
+            return JSONResponse({"response": "Sorry, the assistant took too long to respond. Please try again."})
+        if intent_data is None:
+            return JSONResponse({"response": "Sorry, I couldn't understand your request."})
+        if cache is not None:
+            await run_in_threadpool(cache.add, user_message, intent_data)
+        agreed = intents_agree(local_intent, intent_data) if local_intent is not None else None
+        intent_stats.record("llm", agreed)
+        logger.info(
+            "intent source=llm intent=%s local_intent=%s local_confidence=%.2f agreed=%s",
+            intent_data.get("intent"), (local_intent or {}).get("intent"), confidence, agreed,
+        )
 
     # 2. Route to the correct backend logic
     if intent_data.get("intent") == "top_opportunities":
-        result = opportunities(
+        result = await opportunities(
             user_id=user_id,
             opportunity_type=intent_data.get("opportunity_type", "cross_sell"),
             top_n=intent_data.get("top_n", 5),
@@ -341,7 +1650,7 @@ If the user asks for a summary, set intent to "summary".
         return JSONResponse({"response": "\n".join(lines)})
 
     elif intent_data.get("intent") == "churn_risk":
-        result = churn_risk(
+        result = await churn_risk(
             user_id=user_id,
             top_n=intent_data.get("top_n", 5),
             segment=intent_data.get("segment"),
@@ -357,7 +1666,7 @@ If the user asks for a summary, set intent to "summary".
         return JSONResponse({"response": "\n".join(lines)})
 
     elif intent_data.get("intent") == "summary":
-        result = summary(user_id=user_id)
+        result = await summary(user_id=user_id)
         if not result:
             return JSONResponse({"response": "No summary available."})
         opps = result.get("top_opportunities", [])
@@ -371,7 +1680,7 @@ If the user asks for a summary, set intent to "summary".
         return JSONResponse({"response": "\n".join(lines)})
 
     elif intent_data.get("intent") == "personalized_pitch":
-        result = personalized_pitch(
+        result = await personalized_pitch(
             account_id=intent_data.get("account"),
             product_id=intent_data.get("product"),
         )
@@ -0,0 +1,286 @@
+"""
+Stage timing and Prometheus metrics.
+
+Counters and histograms are kept in-process and rendered in the Prometheus
+text exposition format for GET /metrics, so no client library is needed.
+
+Stages (a Snowflake connection, each fetch_* helper, each generate_* call,
+intent classification) are timed with stage_timer() or the @timed decorator.
+Each timing goes into the stage duration histogram and, when a request is in
+progress, into that request's RequestTimings, which the HTTP middleware turns
+into a Server-Timing response header.
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_value(bound) if bound == math.inf else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collector callbacks for gauges read at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """collector() returns (name, documentation, labels, value) gauge samples."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        gauges: Dict[str, Tuple[str, List[str]]] = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                continue
+            for name, documentation, labels, value in samples:
+                _, sample_lines = gauges.setdefault(name, (documentation, []))
+                sample_lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        for name, (documentation, sample_lines) in gauges.items():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"] + sample_lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_DURATION = registry.histogram(
+    "salesintel_stage_duration_seconds", "Time spent in each backend stage (DB connection, fetch_*, generate_*, intent).", ["stage"]
+)
+STAGE_ERRORS = registry.counter("salesintel_stage_errors_total", "Stages that raised an exception.", ["stage"])
+HTTP_REQUEST_DURATION = registry.histogram(
+    "salesintel_http_request_duration_seconds", "HTTP request latency by route.", ["method", "route", "status"]
+)
+LLM_REQUESTS = registry.counter(
+    "salesintel_llm_requests_total", "LLM completions by outcome (ok, error, cache_hit).", ["purpose", "outcome"]
+)
+LLM_TOKENS = registry.counter("salesintel_llm_tokens_total", "LLM tokens used, by prompt/completion.", ["purpose", "type"])
+LLM_RETRIES = registry.counter("salesintel_llm_retries_total", "LLM calls retried after a 429, 5xx or connection error.", ["status"])
+CONTEXT_TOKENS_SAVED = registry.histogram(
+    "salesintel_context_digest_tokens_saved", "Business-context tokens removed from each prompt by digesting.", ["purpose"],
+    buckets=(0, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+HISTORY_TOKENS_SAVED = registry.histogram(
+    "salesintel_history_tokens_saved", "Chat history tokens removed from each classifier prompt by compaction.",
+    buckets=(0, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+LLM_FALLBACKS = registry.counter(
+    "salesintel_llm_fallbacks_total", "Rows answered with a placeholder because their LLM call timed out or failed.", ["reason"]
+)
+COALESCED_REQUESTS = registry.counter(
+    "salesintel_coalesced_requests_total", "Calls that joined an identical in-flight computation instead of running their own.", ["layer", "name"]
+)
+
+
+class RequestTimings:
+    """Stage intervals recorded while serving one request (from any thread it fans out to)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._intervals: Dict[str, List[Tuple[float, float]]] = {}
+
+    def add(self, stage: str, start: float, end: float):
+        with self._lock:
+            self._intervals.setdefault(stage, []).append((start, end))
+
+    def breakdown(self) -> List[Tuple[str, float, int]]:
+        """
+        (stage, wall-clock ms, count) per stage. Overlapping intervals (concurrent LLM
+        calls) are merged, so a stage's duration is the time at least one call was running.
+        """
+        with self._lock:
+            stages = {stage: sorted(intervals) for stage, intervals in self._intervals.items()}
+        result = []
+        for stage, intervals in stages.items():
+            total, current_start, current_end = 0.0, None, None
+            for start, end in intervals:
+                if current_end is None or start > current_end:
+                    if current_end is not None:
+                        total += current_end - current_start
+                    current_start, current_end = start, end
+                else:
+                    current_end = max(current_end, end)
+            if current_end is not None:
+                total += current_end - current_start
+            result.append((stage, total * 1000, len(intervals)))
+        result.sort(key=lambda item: min(start for start, _ in stages[item[0]]))
+        return result
+
+    def server_timing(self) -> str:
+        parts = [f'{_server_timing_name(stage)};dur={ms:.1f};desc="x{count}"' for stage, ms, count in self.breakdown()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def _server_timing_name(stage):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", stage)
+
+
+current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("current_timings", default=None)
+
+
+def record_stage(stage: str, start: float, end: float, failed: bool = False):
+    STAGE_DURATION.observe(end - start, stage=stage)
+    if failed:
+        STAGE_ERRORS.inc(stage=stage)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, start, end)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record_stage(stage, start, time.perf_counter(), failed)
+
+
+def timed(stage: Optional[str] = None):
+    """Decorator timing a function (sync or async) as a stage named after it by default."""
+
+    def decorator(func):
+        name = stage or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_llm_completion(purpose: str, completion=None, outcome: str = "ok"):
+    """Count an LLM completion and, for real ones, its prompt/completion tokens."""
+    LLM_REQUESTS.inc(purpose=purpose, outcome=outcome)
+    if completion is not None:
+        LLM_TOKENS.inc(completion.prompt_tokens, purpose=purpose, type="prompt")
+        LLM_TOKENS.inc(completion.completion_tokens, purpose=purpose, type="completion")
@@ -0,0 +1,303 @@
+"""
+Nightly precompute job for top-N explanations.
+
+Walks every (user, opportunity type) in model_scores, runs the same logic as
+the API (fetch_opportunities, batched SHAP/context lookups, LLM generation)
+and writes the results to a local materialized store. The API serves
+unfiltered top-N requests from that store and only generates live for cold or
+filtered queries.
+
+Usage:
+    python -m backend.precompute [--workers 4] [--top-n 20] [--restart]
+
+The job is resumable: finished (user, opportunity type) units are recorded in
+a checkpoint file and skipped on the next run against the same scores version.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+from backend.llm_scheduler import current_priority
+
+logger = logging.getLogger(__name__)
+
+OPPORTUNITY_TYPES = ("cross_sell", "upsell", "prospect", "churn_risk")
+
+
+class InsightStore:
+    """SQLite table of precomputed top-N rows with their explanation and next action."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._db()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS precomputed_insights (
+                scores_version TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                opportunity_type TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                account_id TEXT,
+                account_name TEXT,
+                product_id TEXT,
+                product_name TEXT,
+                score REAL,
+                segment TEXT,
+                territory TEXT,
+                explanation TEXT,
+                next_action TEXT,
+                PRIMARY KEY (scores_version, user_id, opportunity_type, rank)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS precomputed_lists (
+                scores_version TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                opportunity_type TEXT NOT NULL,
+                top_n INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (scores_version, user_id, opportunity_type)
+            )
+        """)
+        conn.commit()
+
+    def get(self, user_id: str, opportunity_type: str, top_n: int, scores_version) -> Optional[List[dict]]:
+        """
+        Stored rows for a user's list, or None if the list wasn't precomputed for this
+        scores version with at least top_n rows requested.
+        """
+        if scores_version is None:
+            return None
+        version = str(scores_version)
+        conn = self._db()
+        row = conn.execute(
+            "SELECT top_n FROM precomputed_lists WHERE scores_version = ? AND user_id = ? AND opportunity_type = ?",
+            (version, user_id, opportunity_type),
+        ).fetchone()
+        if row is None or row[0] < top_n:
+            return None
+        rows = conn.execute("""
+            SELECT account_id, account_name, product_id, product_name, score, segment, territory, explanation, next_action
+            FROM precomputed_insights
+            WHERE scores_version = ? AND user_id = ? AND opportunity_type = ?
+            ORDER BY rank
+            LIMIT ?
+        """, (version, user_id, opportunity_type, top_n)).fetchall()
+        return [
+            {
+                "account_id": account_id,
+                "account": account_name,
+                "product_id": product_id,
+                "product": product_name,
+                "score": score,
+                "opportunity_type": opportunity_type,
+                "segment": segment,
+                "territory": territory,
+                "explanation": explanation,
+                "next_action": next_action,
+            }
+            for account_id, account_name, product_id, product_name, score, segment, territory, explanation, next_action in rows
+        ]
+
+    def put(self, user_id: str, opportunity_type: str, top_n: int, scores_version, items: List[dict]):
+        """Replace a user's stored list for this scores version."""
+        version = str(scores_version)
+        conn = self._db()
+        with conn:
+            conn.execute(
+                "DELETE FROM precomputed_insights WHERE scores_version = ? AND user_id = ? AND opportunity_type = ?",
+                (version, user_id, opportunity_type),
+            )
+            conn.executemany("""
+                INSERT INTO precomputed_insights
+                (scores_version, user_id, opportunity_type, rank, account_id, account_name, product_id, product_name,
+                 score, segment, territory, explanation, next_action)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (version, user_id, opportunity_type, rank, item["account_id"], item["account"], item["product_id"],
+                 item["product"], item["score"], item["segment"], item["territory"], item["explanation"], item["next_action"])
+                for rank, item in enumerate(items)
+            ])
+            conn.execute(
+                "INSERT OR REPLACE INTO precomputed_lists (scores_version, user_id, opportunity_type, top_n, created_at) VALUES (?, ?, ?, ?, ?)",
+                (version, user_id, opportunity_type, top_n, time.time()),
+            )
+
+    def prune(self, keep_version):
+        """Drop lists computed against any other scores version."""
+        version = str(keep_version)
+        conn = self._db()
+        with conn:
+            conn.execute("DELETE FROM precomputed_insights WHERE scores_version != ?", (version,))
+            conn.execute("DELETE FROM precomputed_lists WHERE scores_version != ?", (version,))
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+class Checkpoint:
+    """JSON file recording which (user, opportunity type) units are done for a scores version."""
+
+    def __init__(self, path: str, scores_version, restart: bool = False):
+        self.path = path
+        self.scores_version = str(scores_version)
+        self._lock = threading.Lock()
+        self.done = set()
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("scores_version") == self.scores_version:
+                self.done = set(data.get("done", []))
+
+    @staticmethod
+    def key(user_id, opportunity_type):
+        return f"{user_id}|{opportunity_type}"
+
+    def is_done(self, user_id, opportunity_type):
+        return self.key(user_id, opportunity_type) in self.done
+
+    def mark_done(self, user_id, opportunity_type):
+        with self._lock:
+            self.done.add(self.key(user_id, opportunity_type))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"scores_version": self.scores_version, "done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+
+def fetch_work_units(opportunity_types):
+    """Every (user_id, opportunity_type) pair present in model_scores."""
+    from backend import main
+
+    placeholders = ", ".join(["%s"] * len(opportunity_types))
+    with main.get_db_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT DISTINCT user_id, opportunity_type
+            FROM model_scores
+            WHERE opportunity_type IN ({placeholders})
+            ORDER BY user_id, opportunity_type
+        """, tuple(opportunity_types))
+        units = cur.fetchall()
+        cur.close()
+    return units
+
+
+def precompute_list(user_id: str, opportunity_type: str, top_n: int):
+    """Score rows plus explanation and next action for one user's list, exactly as the API builds them."""
+    from backend import main
+
+    results = main.fetch_opportunities(user_id, opportunity_type, top_n)
+    if not results:
+        return []
+    # churn_risk is explained with the explanation-only prompt and has no next action, as in /api/churn_risk
+    with_next_action = opportunity_type != "churn_risk"
+    calls = main.build_insight_calls(results, with_next_action=with_next_action)
+    insights = main.get_llm_executor().map(calls)
+    items = []
+    for (account_id, account_name, product_id, product_name, score, opp_type, seg, terr), insight in zip(results, insights):
+        if not with_next_action:
+            insight = {"explanation": insight, "next_action": None}
+        items.append({
+            "account_id": account_id,
+            "account": account_name,
+            "product_id": product_id,
+            "product": product_name,
+            "score": float(score),
+            "segment": seg,
+            "territory": terr,
+            "explanation": insight["explanation"],
+            "next_action": insight["next_action"],
+        })
+    return items
+
+
+def refresh_shap_store(scores_version):
+    """Rebuild the SHAP feature store unless it already matches this scores version."""
+    from backend import main
+    from backend.shap_store import ShapStore, build_shap_store
+
+    try:
+        current = ShapStore(main.SHAP_STORE_PATH).version
+    except (FileNotFoundError, ValueError):
+        current = None
+    if current == str(scores_version):
+        logger.info("SHAP store is already at scores version %s", scores_version)
+        return
+    with main.get_db_pool().connection() as conn:
+        build_shap_store(conn, main.SHAP_STORE_PATH, scores_version, k=main.SHAP_STORE_TOP_K)
+
+
+def run(store_path: str, checkpoint_path: str, top_n: int = 20, workers: int = 4, opportunity_types=OPPORTUNITY_TYPES, restart: bool = False):
+    from backend import main
+
+    scores_version = main.fetch_scores_version()
+    if scores_version is None:
+        raise RuntimeError("Could not determine the model_scores version; check SCORES_VERSION_QUERY")
+    if main.SHAP_STORE_ENABLED:
+        # Built first so the explanations below read SHAP features from it
+        refresh_shap_store(scores_version)
+    store = InsightStore(store_path)
+    checkpoint = Checkpoint(checkpoint_path, scores_version, restart=restart)
+    units = [unit for unit in fetch_work_units(opportunity_types) if not checkpoint.is_done(*unit)]
+    logger.info("Precomputing %d lists for scores version %s (%d already done)", len(units), scores_version, len(checkpoint.done))
+
+    failed = 0
+
+    def work(user_id, opportunity_type):
+        # Bulk work only gets LLM quota that chat and the API aren't using
+        current_priority.set("bulk")
+        items = precompute_list(user_id, opportunity_type, top_n)
+        store.put(user_id, opportunity_type, top_n, scores_version, items)
+        checkpoint.mark_done(user_id, opportunity_type)
+        return len(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, user_id, opportunity_type): (user_id, opportunity_type) for user_id, opportunity_type in units}
+        for i, future in enumerate(as_completed(futures), 1):
+            user_id, opportunity_type = futures[future]
+            try:
+                count = future.result()
+                logger.info("[%d/%d] %s %s: %d rows", i, len(units), user_id, opportunity_type, count)
+            except Exception:
+                failed += 1
+                logger.exception("[%d/%d] %s %s failed; it will be retried on the next run", i, len(units), user_id, opportunity_type)
+
+    if failed == 0:
+        store.prune(scores_version)
+    logger.info("Precompute finished: %d lists, %d failed", len(units) - failed, failed)
+    return failed
+
+
+def main_cli():
+    from backend import main
+
+    parser = argparse.ArgumentParser(description="Precompute top-N explanations for every user and opportunity type.")
+    parser.add_argument("--store", default=main.PRECOMPUTE_STORE_PATH, help="SQLite file the API serves precomputed lists from")
+    parser.add_argument("--checkpoint", default="precompute_checkpoint.json", help="checkpoint file used to resume an interrupted run")
+    parser.add_argument("--top-n", type=int, default=20, help="rows to precompute per list")
+    parser.add_argument("--workers", type=int, default=4, help="lists processed in parallel")
+    parser.add_argument("--opportunity-types", nargs="+", default=list(OPPORTUNITY_TYPES), choices=OPPORTUNITY_TYPES)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and recompute everything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    failed = run(args.store, args.checkpoint, top_n=args.top_n, workers=args.workers,
+                 opportunity_types=args.opportunity_types, restart=args.restart)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
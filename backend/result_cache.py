@@ -0,0 +1,129 @@
+"""
+Versioned cache for scored-opportunity query results.
+
+model_scores only changes when the scoring job reloads it, so results are kept
+until a cheap version probe (e.g. the latest load timestamp) reports a new
+version, rather than expiring on a blind TTL. A cached top-N list also answers
+any smaller top_n for the same filters.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedResultCache:
+    """
+    LRU of query results tagged with the data version they were read at.
+
+    probe() returns the current data version; it is called at most once per
+    probe_interval seconds. When the version changes every entry is dropped.
+    A failing probe is retried with exponential backoff (up to max_failure_backoff
+    seconds) and the version is reported as unknown (None) until it succeeds.
+    """
+
+    def __init__(self, probe: Callable[[], Any], probe_interval: float = 30.0, max_entries: int = 1024,
+                 max_failure_backoff: float = 600.0):
+        self._probe = probe
+        self.probe_interval = probe_interval
+        self.max_entries = max_entries
+        self.max_failure_backoff = max(max_failure_backoff, probe_interval)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._probed_at = None
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._probe_failures = 0
+        self._consecutive_failures = 0
+        self._next_probe_in = probe_interval
+
+    def current_version(self):
+        """Latest known data version, re-probed when the last probe is older than probe_interval."""
+        now = time.monotonic()
+        with self._lock:
+            if self._probed_at is not None and now - self._probed_at < self._next_probe_in:
+                return None if self._consecutive_failures else self._version
+        try:
+            version = self._probe()
+        except Exception as e:
+            with self._lock:
+                self._probe_failures += 1
+                self._consecutive_failures += 1
+                # Throttled like successful probes, so a broken probe isn't a failing round trip per request
+                self._probed_at = now
+                self._next_probe_in = min(self.probe_interval * 2 ** (self._consecutive_failures - 1), self.max_failure_backoff)
+                failures, retry_in = self._consecutive_failures, self._next_probe_in
+            if failures == 1:
+                logger.warning("Data version probe failed (%s); versioned caching is off until it succeeds, retrying in %.0fs", e, retry_in)
+            else:
+                logger.debug("Data version probe failed %d times in a row (%s); retrying in %.0fs", failures, e, retry_in)
+            return None
+        with self._lock:
+            if self._consecutive_failures:
+                logger.info("Data version probe succeeded after %d failures", self._consecutive_failures)
+            self._consecutive_failures = 0
+            self._next_probe_in = self.probe_interval
+            self._probed_at = now
+            if version != self._version:
+                if self._entries:
+                    self._invalidations += 1
+                self._entries.clear()
+                self._version = version
+        return version
+
+    def get(self, key: Hashable, top_n: int, version) -> Optional[list]:
+        """Return the first top_n rows for key if a result at this version covers them."""
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, fetched_n, rows = entry
+                # A short result means the filters matched fewer rows than requested, so it answers any top_n
+                covers = top_n <= fetched_n or len(rows) < fetched_n
+                if entry_version == version and covers:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return rows[:top_n]
+            self._misses += 1
+            return None
+
+    def put(self, key: Hashable, top_n: int, rows: list, version):
+        if version is None:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            existing = self._entries.get(key)
+            if existing is not None and existing[0] == version and existing[1] > top_n:
+                return
+            self._entries[key] = (version, top_n, list(rows))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._probed_at = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "version": None if self._version is None else str(self._version),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "invalidations": self._invalidations,
+                "probe_failures": self._probe_failures,
+                "probe_failing": self._consecutive_failures > 0,
+            }
@@ -0,0 +1,319 @@
+"""
+In-process columnar snapshot of model_scores.
+
+For the busiest filters the backend can answer fetch_opportunities-style
+queries without Snowflake. model_scores is loaded into NumPy arrays with
+dictionary-encoded string columns, sorted by (user, opportunity type, score
+descending), with a per-user offset index. A query is a slice lookup plus
+boolean masks for the optional filters; because each slice is already in
+score order, the top N are simply the first N rows that pass the masks.
+
+A background thread reloads the snapshot when the scores version changes and
+swaps it in atomically, so queries always see one complete snapshot.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from backend.db import arrow_unavailable
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_QUERY = """
+    SELECT user_id, opportunity_type, account_id, account_name, product_id, product_name, segment, territory, score
+    FROM model_scores
+"""
+ENCODED_COLUMNS = ("user_id", "opportunity_type", "account_id", "product_id", "segment", "territory")
+
+
+def _code_dtype(cardinality):
+    for dtype in (np.int8, np.int16, np.int32):
+        if cardinality < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class _Dictionary:
+    """String <-> integer code mapping for one column, built incrementally while loading."""
+
+    def __init__(self):
+        self.codes: Dict[Optional[str], int] = {}
+        self.values: List[Optional[str]] = []
+
+    def encode(self, column) -> np.ndarray:
+        uniques, inverse = np.unique(np.asarray(column, dtype=object).astype(str), return_inverse=True)
+        # np.unique turns None into "None"; map that back so NULLs stay NULL
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques.tolist()):
+            key = None if value == "None" else value
+            code = self.codes.get(key)
+            if code is None:
+                code = len(self.values)
+                self.codes[key] = code
+                self.values.append(key)
+            mapping[i] = code
+        return mapping[inverse]
+
+
+class ScoresSnapshot:
+    """Immutable columnar copy of model_scores; build with SnapshotBuilder."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List], account_names, product_names, user_offsets, version=None, load_seconds=0.0):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self._codes = {name: {value: code for code, value in enumerate(values)} for name, values in dictionaries.items()}
+        self.account_names = account_names
+        self.product_names = product_names
+        self.user_offsets = user_offsets
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    @property
+    def rows(self):
+        return len(self.columns["score"])
+
+    def _slice(self, user_id, opportunity_type, product_id=None, segment=None, territory=None, account_id=None):
+        """(lo, hi, mask) for a user's list of one opportunity type; None if no row can match."""
+        user_code = self._codes["user_id"].get(user_id)
+        type_code = self._codes["opportunity_type"].get(opportunity_type)
+        if user_code is None or type_code is None:
+            return None
+        start, end = int(self.user_offsets[user_code]), int(self.user_offsets[user_code + 1])
+        # Within a user's slice rows are sorted by opportunity type, then score descending
+        types = self.columns["opportunity_type"][start:end]
+        lo = start + int(np.searchsorted(types, type_code, side="left"))
+        hi = start + int(np.searchsorted(types, type_code, side="right"))
+
+        mask = None
+        for name, value in (("product_id", product_id), ("segment", segment), ("territory", territory), ("account_id", account_id)):
+            if not value:
+                continue
+            code = self._codes[name].get(value)
+            if code is None:
+                return None
+            column_mask = self.columns[name][lo:hi] == code
+            mask = column_mask if mask is None else mask & column_mask
+        return lo, hi, mask
+
+    def query(self, user_id, opportunity_type, top_n, product_id=None, segment=None, territory=None, account_id=None):
+        """Same rows, in the same order, as fetch_opportunities' ORDER BY score DESC LIMIT top_n query."""
+        found = self._slice(user_id, opportunity_type, product_id, segment, territory, account_id)
+        if found is None:
+            return []
+        lo, hi, mask = found
+        if mask is None:
+            index = np.arange(lo, min(hi, lo + top_n))
+        else:
+            index = lo + np.flatnonzero(mask)[:top_n]
+        return self._rows(index)
+
+    def page(self, user_id, opportunity_type, limit, after=None, product_id=None, segment=None, territory=None, account_id=None):
+        """
+        Up to limit rows in (score DESC, account_id, product_id) order that come after the
+        `after` (score, account_id, product_id) key, like the keyset query in fetch_opportunity_page.
+        The start is a binary search on the score column, so deep pages cost the same as the first.
+        """
+        found = self._slice(user_id, opportunity_type, product_id, segment, territory, account_id)
+        if found is None:
+            return []
+        lo, hi, mask = found
+        descending = -self.columns["score"][lo:hi]
+        start = 0 if after is None else int(np.searchsorted(descending, -np.float64(after[0]), side="left"))
+        positions = np.arange(start, hi - lo) if mask is None else start + np.flatnonzero(mask[start:])
+        # Rows tied on score are stored in load order, so take whole tie groups at both ends
+        # (the cursor's and the last row's) and order them by id here
+        leading = 0
+        if after is not None and len(positions):
+            leading = int(np.searchsorted(descending[positions], -np.float64(after[0]), side="right"))
+        take = positions[:leading + limit]
+        if len(positions) > len(take):
+            end = int(np.searchsorted(descending, descending[take[-1]], side="right"))
+            take = positions[positions < end]
+        rows = sorted(self._rows(lo + take), key=lambda row: (-row[4], row[0], row[2]))
+        if after is not None:
+            key = (-float(after[0]), after[1], after[2])
+            rows = [row for row in rows if (-row[4], row[0], row[2]) > key]
+        return rows[:limit]
+
+    def memory_report(self, projected_rows: int = 50_000_000):
+        """Bytes used by each column and dictionary, plus a projection for sizing worker RAM."""
+        column_bytes = {name: int(array.nbytes) for name, array in self.columns.items()}
+        column_bytes["user_offsets"] = int(self.user_offsets.nbytes)
+        dictionary_bytes = {
+            name: int(sum(len(v or "") + 49 for v in values))  # approx. CPython str object size
+            for name, values in self.dictionaries.items()
+        }
+        dictionary_bytes["account_names"] = int(sum(len(v or "") + 49 for v in self.account_names))
+        dictionary_bytes["product_names"] = int(sum(len(v or "") + 49 for v in self.product_names))
+        row_bytes = sum(array.itemsize for array in self.columns.values())
+        total = sum(column_bytes.values()) + sum(dictionary_bytes.values())
+        return {
+            "rows": self.rows,
+            "bytes_per_row": row_bytes,
+            "columns_bytes": column_bytes,
+            "dictionaries_bytes": dictionary_bytes,
+            "total_bytes": total,
+            "total_mb": round(total / 2**20, 1),
+            "projected_rows": projected_rows,
+            "projected_columns_mb": round(row_bytes * projected_rows / 2**20, 1),
+        }
+
+    def _rows(self, index):
+        columns = self.columns
+        dicts = self.dictionaries
+        accounts = columns["account_id"][index].tolist()
+        products = columns["product_id"][index].tolist()
+        segments = columns["segment"][index].tolist()
+        territories = columns["territory"][index].tolist()
+        types = columns["opportunity_type"][index].tolist()
+        scores = columns["score"][index].tolist()
+        return [
+            (dicts["account_id"][a], self.account_names[a], dicts["product_id"][p], self.product_names[p],
+             score, dicts["opportunity_type"][t], dicts["segment"][s], dicts["territory"][r])
+            for a, p, score, t, s, r in zip(accounts, products, scores, types, segments, territories)
+        ]
+
+
+class SnapshotBuilder:
+    """Accumulates model_scores batches (column lists or arrays) and builds a ScoresSnapshot."""
+
+    def __init__(self):
+        self._dicts = {name: _Dictionary() for name in ENCODED_COLUMNS}
+        self._chunks = {name: [] for name in ENCODED_COLUMNS}
+        self._scores = []
+        self._account_names = {}
+        self._product_names = {}
+
+    def add_batch(self, batch: Dict[str, list]):
+        for name in ENCODED_COLUMNS:
+            self._chunks[name].append(self._dicts[name].encode(batch[name]))
+        self._scores.append(np.asarray(batch["score"], dtype=np.float64))
+        # Names depend only on their id, so keep one per dictionary code
+        for codes, names, target in ((self._chunks["account_id"][-1], batch["account_name"], self._account_names),
+                                     (self._chunks["product_id"][-1], batch["product_name"], self._product_names)):
+            unique_codes, first = np.unique(codes, return_index=True)
+            names = list(names)
+            for code, i in zip(unique_codes.tolist(), first.tolist()):
+                target[code] = names[i]
+
+    def build(self, version=None, load_seconds=0.0) -> ScoresSnapshot:
+        columns = {}
+        for name in ENCODED_COLUMNS:
+            codes = np.concatenate(self._chunks[name]) if self._chunks[name] else np.empty(0, dtype=np.int64)
+            columns[name] = codes.astype(_code_dtype(len(self._dicts[name].values)))
+        scores = np.concatenate(self._scores) if self._scores else np.empty(0, dtype=np.float64)
+        order = np.lexsort((-scores, columns["opportunity_type"], columns["user_id"]))
+        columns = {name: array[order] for name, array in columns.items()}
+        columns["score"] = scores[order]
+
+        n_users = len(self._dicts["user_id"].values)
+        counts = np.bincount(columns["user_id"].astype(np.int64), minlength=n_users)
+        user_offsets = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=user_offsets[1:])
+
+        account_names = [self._account_names.get(code) for code in range(len(self._dicts["account_id"].values))]
+        product_names = [self._product_names.get(code) for code in range(len(self._dicts["product_id"].values))]
+        dictionaries = {name: list(d.values) for name, d in self._dicts.items()}
+        return ScoresSnapshot(columns, dictionaries, account_names, product_names, user_offsets, version, load_seconds)
+
+
+def load_snapshot(connection, version=None, batch_rows: int = 1_000_000) -> ScoresSnapshot:
+    """Read all of model_scores through a Snowflake connection in Arrow batches (or fetchmany without pyarrow)."""
+    started = time.monotonic()
+    builder = SnapshotBuilder()
+    names = ["user_id", "opportunity_type", "account_id", "account_name", "product_id", "product_name", "segment", "territory", "score"]
+    cur = connection.cursor()
+    try:
+        cur.execute(SNAPSHOT_QUERY)
+        try:
+            batches = cur.fetch_arrow_batches()
+            for table in batches:
+                builder.add_batch({name: table.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(names)})
+        except Exception as e:
+            if not arrow_unavailable(e):
+                raise
+            cur.execute(SNAPSHOT_QUERY)
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                builder.add_batch({name: [row[i] for row in rows] for i, name in enumerate(names)})
+    finally:
+        cur.close()
+    return builder.build(version=version, load_seconds=time.monotonic() - started)
+
+
+class SnapshotManager:
+    """
+    Owns the current snapshot and refreshes it in a background thread.
+
+    Every refresh_interval seconds the scores version is probed; when it has
+    changed a new snapshot is loaded and swapped in with a single assignment.
+    A loaded snapshot is kept while the version can't be read, since reloading
+    means a full scan of model_scores.
+    """
+
+    def __init__(self, loader: Callable[[object], ScoresSnapshot], version_probe: Callable[[], object], refresh_interval: float = 300.0):
+        self._loader = loader
+        self._version_probe = version_probe
+        self.refresh_interval = refresh_interval
+        self.snapshot: Optional[ScoresSnapshot] = None
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._refresh_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scores-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Load a new snapshot if the scores version changed; returns True if a new one was swapped in."""
+        with self._refresh_lock:
+            version = self._version_probe()
+            current = self.snapshot
+            if not force and current is not None:
+                if version is None:
+                    logger.warning("model_scores version is unknown; keeping snapshot version=%s", current.version)
+                    return False
+                if current.version == version:
+                    return False
+            snapshot = self._loader(version)
+            self.snapshot = snapshot
+            logger.info("Loaded model_scores snapshot version=%s rows=%d in %.1fs", version, snapshot.rows, snapshot.load_seconds)
+            return True
+
+    def stats(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False, "last_error": self.last_error}
+        return {
+            "loaded": True,
+            "version": None if snapshot.version is None else str(snapshot.version),
+            "loaded_at": snapshot.loaded_at,
+            "load_seconds": round(snapshot.load_seconds, 2),
+            "last_error": self.last_error,
+            "memory": snapshot.memory_report(),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("model_scores snapshot refresh failed")
+            self._stop.wait(self.refresh_interval)
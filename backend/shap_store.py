@@ -0,0 +1,428 @@
+"""
+Precomputed top-k SHAP features per (account, product) pair.
+
+fetch_shap_values asks Snowflake to sort every SHAP row of a pair by
+ABS(shap_value) just to keep three. When scores refresh, the precompute job
+writes the top k of every pair into one compact file instead:
+
+    header   magic, JSON metadata (k, version, feature names, section offsets)
+    index    open-addressing hash table: 64-bit pair fingerprints (uint64) and
+             row numbers (uint32), linear probing, load factor <= 0.7
+    rows     one packed record per pair: offset and length of its key, k interned
+             feature-name ids (int16, -1 = no feature), k SHAP values (float64,
+             so explanations format the same digits as from Snowflake)
+    keys     the pairs' "account_id\x1fproduct_id" keys, concatenated
+
+Fingerprints are run through a splitmix64 finalizer, whose low bits pick the
+slot; the checksums' own low bits cluster on similar IDs and made long probe
+chains. The fingerprint only narrows the search: a matching slot's key is compared
+with the requested one, so a pair that isn't stored can never be answered with
+another pair's features, and pairs whose fingerprints collide are all stored
+(the probe just continues past the mismatch).
+
+About 36 bytes per pair of rows for k=3, ~17 of index, plus the keys. The
+file is opened with mmap, so every worker on a host shares one copy through
+the page cache, and it is replaced atomically (os.replace) so readers never
+see a partial file. A lookup is two C checksums and a few integer operations,
+usually one probe, one struct unpack of the record and a key comparison: a few
+microseconds in CPython, against milliseconds for the Snowflake query it replaces.
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SHAPK005"
+ALIGNMENT = 64
+MAX_LOAD_FACTOR = 0.7
+TOP_K_QUERY = """
+    SELECT account_id, product_id, feature_name, shap_value
+    FROM shap_values
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY account_id, product_id ORDER BY ABS(shap_value) DESC) <= %s
+    ORDER BY account_id, product_id, ABS(shap_value) DESC
+"""
+
+
+_crc32, _adler32 = zlib.crc32, zlib.adler32
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def pair_key(account_id: str, product_id: str) -> bytes:
+    return f"{account_id}\x1f{product_id}".encode("utf-8")
+
+
+def _fingerprint(key: bytes) -> int:
+    # Adler-32 and CRC32 (both in C) mixed by the splitmix64 finalizer, a bijection that keeps 0 for 0
+    z = (_adler32(key) << 32 | _crc32(key)) or 1
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def pair_fingerprint(account_id: str, product_id: str) -> int:
+    """
+    Stable (process-independent), never-zero 64-bit hash of a pair; 0 is reserved for empty
+    slots. It only has to spread pairs over the table: hits are confirmed by comparing the stored key.
+    """
+    return _fingerprint(pair_key(account_id, product_id))
+
+
+class ShapStoreBuilder:
+    """Collects each pair's top-k features (in order) and writes the store file."""
+
+    def __init__(self, k: int = 3):
+        self.k = k
+        self._feature_ids: Dict[str, int] = {}
+        self._features: List[str] = []
+        self._fingerprints = array("Q")
+        self._key_offsets = array("Q")
+        self._keys = bytearray()
+        self._ids = array("i")
+        self._values = array("d")
+
+    @property
+    def pairs(self):
+        return len(self._fingerprints)
+
+    def add(self, account_id: str, product_id: str, features: Sequence[Tuple[str, float]]):
+        key = pair_key(account_id, product_id)
+        self._fingerprints.append(_fingerprint(key))
+        self._key_offsets.append(len(self._keys))
+        self._keys += key
+        features = list(features)[:self.k]
+        for name, value in features:
+            feature_id = self._feature_ids.get(name)
+            if feature_id is None:
+                feature_id = self._feature_ids[name] = len(self._features)
+                self._features.append(name)
+            self._ids.append(feature_id)
+            self._values.append(value)
+        for _ in range(self.k - len(features)):
+            self._ids.append(-1)
+            self._values.append(0.0)
+
+    def add_rows(self, rows: Iterable[Tuple[str, str, str, float]]):
+        """Add (account_id, product_id, feature_name, shap_value) rows sorted by pair, then by rank."""
+        current, features = None, []
+        for account_id, product_id, feature_name, shap_value in rows:
+            if (account_id, product_id) != current:
+                if current is not None:
+                    self.add(*current, features)
+                current, features = (account_id, product_id), []
+            features.append((feature_name, shap_value))
+        if current is not None:
+            self.add(*current, features)
+
+    def _index(self):
+        """Linear-probing table built in vectorized rounds: each round, every unplaced pair claims its
+        current slot if free (first claimant wins) or moves on to the next slot."""
+        fingerprints = np.frombuffer(self._fingerprints, dtype=np.uint64) if self.pairs else np.empty(0, np.uint64)
+        capacity = 8
+        while capacity * MAX_LOAD_FACTOR < len(fingerprints):
+            capacity *= 2
+        mask = np.uint64(capacity - 1)
+        table = np.zeros(capacity, dtype=np.uint64)
+        offsets = np.zeros(capacity, dtype=np.uint32)
+        # Colliding fingerprints are fine (lookups compare keys), but a pair added twice is stored once
+        pending = np.arange(len(fingerprints))
+        unique, counts = np.unique(fingerprints, return_counts=True)
+        shared = np.flatnonzero(np.isin(fingerprints, unique[counts > 1]))
+        if len(shared):
+            seen, duplicates = set(), []
+            for index in shared.tolist():
+                key = (int(fingerprints[index]), self._key(index))
+                if key in seen:
+                    duplicates.append(index)
+                seen.add(key)
+            if duplicates:
+                logger.warning("%d SHAP store pairs were added more than once; keeping the first", len(duplicates))
+                pending = np.setdiff1d(pending, duplicates)
+        slots = fingerprints & mask
+        max_probe = 0
+        while len(pending):
+            free = table[slots[pending]] == 0
+            candidates = pending[free]
+            _, first = np.unique(slots[candidates], return_index=True)
+            winners = candidates[first]
+            table[slots[winners]] = fingerprints[winners]
+            offsets[slots[winners]] = winners
+            placed = np.zeros(len(fingerprints), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed[pending]]
+            slots[pending] = (slots[pending] + np.uint64(1)) & mask
+            max_probe += 1 if len(pending) else 0
+        return table, offsets, max_probe, len(fingerprints) - int(np.count_nonzero(table))
+
+    def _key(self, index):
+        start = self._key_offsets[index]
+        end = self._key_offsets[index + 1] if index + 1 < self.pairs else len(self._keys)
+        return bytes(self._keys[start:end])
+
+    def write(self, path: str, version=None) -> dict:
+        """Write the store to path atomically; returns its header."""
+        table, offsets, max_probe, skipped = self._index()
+        id_code = "h" if len(self._features) < np.iinfo(np.int16).max else "i"
+        key_offset_code = "I" if len(self._keys) <= np.iinfo(np.uint32).max else "Q"
+        rows = np.zeros(self.pairs, dtype=np.dtype([
+            ("key_offset", "<u4" if key_offset_code == "I" else "<u8"),
+            ("key_length", "<u2"),
+            ("ids", f"<{id_code}", (self.k,)),
+            ("values", "<f8", (self.k,)),
+        ]))
+        if self.pairs:
+            key_offsets = np.frombuffer(self._key_offsets, dtype=np.uint64)
+            key_lengths = np.diff(np.append(key_offsets, len(self._keys)))
+            if key_lengths.max() > np.iinfo(np.uint16).max:
+                raise ValueError("SHAP store keys are limited to 65535 bytes")
+            rows["key_offset"] = key_offsets
+            rows["key_length"] = key_lengths
+            rows["ids"] = np.frombuffer(self._ids, dtype=np.int32).reshape(-1, self.k)
+            rows["values"] = np.frombuffer(self._values, dtype=np.float64).reshape(-1, self.k)
+        keys = np.frombuffer(self._keys, dtype=np.uint8) if self._keys else np.empty(0, np.uint8)
+        sections = [("fingerprints", table), ("offsets", offsets), ("rows", rows), ("keys", keys)]
+        header = {
+            "k": self.k,
+            "row_format": f"<{key_offset_code}H{self.k}{id_code}{self.k}d",
+            "pairs": self.pairs - skipped,
+            "capacity": len(table),
+            "max_probe": max_probe,
+            "version": None if version is None else str(version),
+            "built_at": time.time(),
+            "features": self._features,
+            "sections": {},
+        }
+        # Section offsets depend on the header size, which depends on the offsets; reserve room for them
+        header_bytes = b""
+        for _ in range(2):
+            position = _align(len(MAGIC) + 8 + len(header_bytes) + 64)
+            for name, data in sections:
+                # Records are stored as opaque bytes ("|V36" for k=3); readers unpack them with row_format
+                header["sections"][name] = [position, data.dtype.str, len(data)]
+                position = _align(position + data.nbytes)
+            header_bytes = json.dumps(header).encode("utf-8")
+        assert len(MAGIC) + 8 + len(header_bytes) <= min(offset for offset, _, _ in header["sections"].values())
+
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name, data in sections:
+                f.seek(header["sections"][name][0])
+                f.write(data.tobytes())
+            f.truncate(max(f.tell(), len(MAGIC) + 8 + len(header_bytes)))
+        os.replace(temp_path, path)
+        return header
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class ShapStore:
+    """Read-only, memory-mapped view of a store file written by ShapStoreBuilder."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a SHAP store")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length])
+        self.k = self.header["k"]
+        self.version = self.header["version"]
+        self.features = self.header["features"]
+        self._mask = self.header["capacity"] - 1
+        self.arrays = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count, offset=offset)
+            for name, (offset, dtype, count) in self.header["sections"].items()
+        }
+        # memoryviews index several times faster than NumPy arrays for single elements
+        self._fingerprints = memoryview(self.arrays["fingerprints"]).cast("B").cast("Q")
+        self._offsets = memoryview(self.arrays["offsets"]).cast("B").cast("I")
+        row = struct.Struct(self.header["row_format"])
+        self._unpack_row = row.unpack_from
+        self._row_size = row.size
+        self._rows_start = self.header["sections"]["rows"][0]
+        self._keys_start = self.header["sections"]["keys"][0]
+        self._decode = _decode_top3 if self.k == 3 else _decode_row
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def pairs(self):
+        return self.header["pairs"]
+
+    def get(self, account_id: str, product_id: str) -> Optional[List[Tuple[str, float]]]:
+        """Top-k (feature_name, shap_value) for a pair, largest |value| first; None if the pair isn't stored."""
+        # pair_key and _fingerprint, inlined: this is the hot path
+        key = f"{account_id}\x1f{product_id}".encode("utf-8")
+        z = (_adler32(key) << 32 | _crc32(key)) or 1
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        fingerprint = z ^ (z >> 31)
+        fingerprints, mask = self._fingerprints, self._mask
+        slot = fingerprint & mask
+        stored = fingerprints[slot]
+        while stored:
+            if stored == fingerprint:
+                row = self._unpack_row(self._mmap, self._rows_start + self._offsets[slot] * self._row_size)
+                start = self._keys_start + row[0]
+                # Same fingerprint, different pair: keep probing
+                if self._mmap[start:start + row[1]] == key:
+                    return self._decode(self.features, row)
+            slot = (slot + 1) & mask
+            stored = fingerprints[slot]
+        return None
+
+    def get_many(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[List[Tuple[str, float]]]]:
+        result = {pair: self.get(*pair) for pair in pairs}
+        missing = sum(1 for features in result.values() if features is None)
+        with self._stats_lock:
+            self.hits += len(result) - missing
+            self.misses += missing
+        return result
+
+    def footprint(self) -> dict:
+        """Bytes per section and per pair, with the index's load factor."""
+        section_bytes = {name: int(array.nbytes) for name, array in self.arrays.items()}
+        pairs = self.pairs
+        return {
+            "pairs": pairs,
+            "k": self.k,
+            "features": len(self.features),
+            "version": self.version,
+            "built_at": self.header["built_at"],
+            "file_bytes": len(self._mmap),
+            "file_mb": round(len(self._mmap) / 2**20, 1),
+            "sections_bytes": section_bytes,
+            "bytes_per_pair": round(len(self._mmap) / pairs, 1) if pairs else None,
+            "load_factor": round(pairs / self.header["capacity"], 3),
+            "max_probe": self.header["max_probe"],
+        }
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self.footprint(), "hits": self.hits, "misses": self.misses}
+
+
+def _decode_row(features, row):
+    # row is (key offset, key length, k feature ids, k values)
+    k = (len(row) - 2) // 2
+    return [(features[feature_id], value) for feature_id, value in zip(row[2:2 + k], row[2 + k:]) if feature_id >= 0]
+
+
+def _decode_top3(features, row):
+    """_decode_row unrolled for the default k=3, which skips building a comprehension per lookup."""
+    _, _, id1, id2, id3, value1, value2, value3 = row
+    if id3 < 0:
+        return _decode_row(features, row)
+    return [(features[id1], value1), (features[id2], value2), (features[id3], value3)]
+
+
+class ShapStoreFile:
+    """
+    The store at a path, reopened when the file is replaced. Checks the file at most
+    every check_interval seconds, so lookups don't pay for a stat() each time.
+    """
+
+    def __init__(self, path: str, check_interval: float = 30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._store: Optional[ShapStore] = None
+        self._identity = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[ShapStore]:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._store
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return self._store
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._store, self._identity = None, None
+                return None
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if identity != self._identity:
+                try:
+                    self._store = ShapStore(self.path)
+                    self._identity = identity
+                    logger.info("Opened SHAP store %s: %d pairs, version %s", self.path, self._store.pairs, self._store.version)
+                except Exception:
+                    logger.exception("Could not open SHAP store %s", self.path)
+            return self._store
+
+
+def build_shap_store(connection, path: str, version=None, k: int = 3, batch_rows: int = 100_000) -> dict:
+    """Read the top-k SHAP rows of every pair from Snowflake and write the store; returns its header."""
+    started = time.monotonic()
+    builder = ShapStoreBuilder(k)
+    cur = connection.cursor()
+    try:
+        cur.execute(TOP_K_QUERY, (k,))
+
+        def rows():
+            while True:
+                batch = cur.fetchmany(batch_rows)
+                if not batch:
+                    return
+                yield from batch
+
+        builder.add_rows(rows())
+    finally:
+        cur.close()
+    header = builder.write(path, version)
+    logger.info("Wrote SHAP store %s: %d pairs, %d features in %.1fs", path, header["pairs"], len(header["features"]), time.monotonic() - started)
+    return header
+
+
+def measure_lookup_ns(store: ShapStore, pairs: Sequence[Tuple[str, str]], repeat: int = 5) -> float:
+    """Mean nanoseconds per get() over the given pairs (best of `repeat` passes)."""
+    if not pairs:
+        return 0.0
+    get = store.get
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for account_id, product_id in pairs:
+            get(account_id, product_id)
+        best = min(best, (time.perf_counter_ns() - started) / len(pairs))
+    return best
+
+
+def main_cli():
+    from backend import main
+
+    parser = argparse.ArgumentParser(description="Build the precomputed top-k SHAP feature store from Snowflake.")
+    parser.add_argument("--output", default=main.SHAP_STORE_PATH)
+    parser.add_argument("--k", type=int, default=main.SHAP_STORE_TOP_K)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    with main.get_db_pool().connection() as conn:
+        build_shap_store(conn, args.output, main.fetch_scores_version(), k=args.k)
+    print(json.dumps(ShapStore(args.output).footprint(), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
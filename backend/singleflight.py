@@ -0,0 +1,124 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+When several callers ask for the same thing at the same time (the 9am rush of
+identical /api/summary requests), only the first one runs it; the others wait
+for that in-flight computation and receive the same result or exception.
+Nothing is cached: once the computation finishes, the next caller starts a
+new one.
+
+SingleFlight is for blocking code running on threads (the generate_*
+helpers); AsyncSingleFlight is for coroutines on the event loop (endpoints).
+Callers build the keys: the shared call runs in the leader's context, so
+anything callers must not share, like the LLM priority class, goes in the key.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+def freeze(value) -> Hashable:
+    """Hashable form of nested call arguments (lists/dicts become tuples)."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return tuple(sorted(freeze(item) for item in value))
+    return value
+
+
+class _FlightStats:
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]]):
+        self._stats_lock = threading.Lock()
+        self._on_coalesced = on_coalesced
+        self.executions = 0
+        self.coalesced = 0
+
+    def _record(self, name, leader):
+        with self._stats_lock:
+            if leader:
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader and self._on_coalesced is not None:
+            self._on_coalesced(name)
+
+    def stats(self):
+        with self._stats_lock:
+            calls = self.executions + self.coalesced
+            return {
+                "calls": calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_rate": self.coalesced / calls if calls else 0.0,
+                "in_flight": self._in_flight_count(),
+            }
+
+    def _in_flight_count(self):
+        raise NotImplementedError
+
+
+class SingleFlight(_FlightStats):
+    """
+    Thread-safe single-flight group for blocking calls.
+    on_coalesced(name) is called for every caller that joined an in-flight call.
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]] = None):
+        super().__init__(on_coalesced)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], name: str = "") -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        self._record(name, leader)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _in_flight_count(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+class AsyncSingleFlight(_FlightStats):
+    """
+    Single-flight group for coroutines. The shared computation runs as its own task,
+    so a caller that disconnects (and is cancelled) doesn't cancel it for the others.
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]] = None):
+        super().__init__(on_coalesced)
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], name: str = "") -> Any:
+        # Tasks belong to one event loop, so in-flight work is only shared within the same loop
+        key = (id(asyncio.get_running_loop()), key)
+        task = self._in_flight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None)
+        self._record(name, leader)
+        return await asyncio.shield(task)
+
+    def _in_flight_count(self):
+        return len(self._in_flight)
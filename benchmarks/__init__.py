@@ -0,0 +1 @@
+"""Load and latency benchmarks for the API, run against local Snowflake and OpenAI stand-ins."""
@@ -0,0 +1,270 @@
+"""
+End-to-end load and latency benchmark for the API.
+
+Starts backend.main:app under uvicorn with local stand-ins for Snowflake
+(benchmarks/snowflake_stub.py) and OpenAI (the stub LLM provider), then drives
+each endpoint at a fixed concurrency and reports throughput, latency
+percentiles and database/LLM calls per request. Results are written as JSON
+so runs can be compared:
+
+    python -m benchmarks.run --concurrency 16 --requests 200
+    python -m benchmarks.run --baseline benchmarks/results/previous.json --max-regression 0.2
+
+With --baseline the run exits non-zero if any scenario's p95 latency or
+throughput regressed by more than --max-regression.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+SCENARIOS = ("opportunities", "churn_risk", "summary", "pitch", "chat")
+CHAT_MESSAGES = (
+    "Show me my top 5 cross-sell opportunities",
+    "Which accounts are at risk of churn?",
+    "Give me a summary of my book",
+    "Write a pitch for Account A1 about Product P1",
+    "top 3 upsell opps in the west territory",
+    "hmm, what about the ones you mentioned before?",
+)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_requests(scenario, users):
+    """Endless (method, path, params/json) generator for a scenario, cycling through users."""
+    for i in itertools.count():
+        user_id = f"u{i % users}"
+        if scenario == "opportunities":
+            yield "GET", "/api/opportunities", {"params": {"user_id": user_id, "opportunity_type": "cross_sell", "top_n": 5}}
+        elif scenario == "churn_risk":
+            yield "GET", "/api/churn_risk", {"params": {"user_id": user_id, "top_n": 5}}
+        elif scenario == "summary":
+            yield "GET", "/api/summary", {"params": {"user_id": user_id}}
+        elif scenario == "pitch":
+            yield "GET", "/api/pitch", {"params": {"account_id": f"A{i % 500}", "product_id": f"P{i % 20}"}}
+        elif scenario == "chat":
+            message = CHAT_MESSAGES[i % len(CHAT_MESSAGES)]
+            yield "POST", "/api/chat", {"json": {"message": message, "user_id": user_id, "history": []}}
+        else:
+            raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def run_scenario(base_url, scenario, total, concurrency, users, db, provider, timeout):
+    requests_iter = make_requests(scenario, users)
+    lock = threading.Lock()
+    latencies, errors = [], []
+    local = threading.local()
+
+    def next_request():
+        with lock:
+            if len(latencies) + len(errors) + next_request.in_flight >= total:
+                return None
+            next_request.in_flight += 1
+            return next(requests_iter)
+    next_request.in_flight = 0
+
+    def worker():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        while True:
+            item = next_request()
+            if item is None:
+                return
+            method, path, kwargs = item
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=timeout, **kwargs)
+                ok, status = response.status_code < 400, response.status_code
+            except requests.RequestException as e:
+                ok, status = False, type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                next_request.in_flight -= 1
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(status)
+
+    db.reset_counters()
+    llm_calls_before = provider.calls
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    duration = time.perf_counter() - started
+    completed = len(latencies) + len(errors)
+
+    return {
+        "requests": completed,
+        "errors": len(errors),
+        "error_statuses": sorted({str(status) for status in errors}),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(completed / duration, 2) if duration else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": _round(percentile(latencies, 0.50)),
+            "p95": _round(percentile(latencies, 0.95)),
+            "p99": _round(percentile(latencies, 0.99)),
+            "max": _round(max(latencies) if latencies else None),
+        },
+        "db_calls_per_request": round(db.queries / completed, 2) if completed else None,
+        "llm_calls_per_request": round((provider.calls - llm_calls_before) / completed, 2) if completed else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def compare(results, baseline, max_regression):
+    """List of regression messages for scenarios slower (p95) or lower-throughput than the baseline."""
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        old_p95, new_p95 = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{scenario}: p95 {old_p95:.1f}ms -> {new_p95:.1f}ms")
+        old_rps, new_rps = previous["throughput_rps"], current["throughput_rps"]
+        if old_rps and new_rps and new_rps < old_rps * (1 - max_regression):
+            regressions.append(f"{scenario}: throughput {old_rps:.1f} -> {new_rps:.1f} req/s")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def configure_environment(args):
+    """Env-based backend settings; must run before backend.main is imported."""
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["STUB_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["STUB_LLM_LATENCY_DISTRIBUTION"] = args.llm_latency_distribution
+    os.environ["STUB_LLM_LATENCY_SIGMA"] = str(args.llm_latency_sigma)
+    os.environ["STUB_LLM_TOKENS_PER_SECOND"] = str(args.llm_tokens_per_second)
+    os.environ["STUB_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["STUB_LLM_SEED"] = str(args.seed)
+    # Measure the live generation path unless caches are asked for; the stub is deterministic,
+    # so with caching every repeated prompt would be a hit
+    os.environ.setdefault("LLM_CACHE_ENABLED", "1" if args.caches else "0")
+    os.environ.setdefault("INTENT_CACHE_ENABLED", "1" if args.caches else "0")
+    os.environ.setdefault("PRECOMPUTE_SERVING_ENABLED", "0")
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(args.workdir, "bench_llm_cache.sqlite3"))
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the API against local Snowflake/OpenAI stand-ins.")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario before measuring")
+    parser.add_argument("--users", type=int, default=100, help="distinct user ids in the fake dataset")
+    parser.add_argument("--db-latency-ms", type=float, default=20.0, help="simulated Snowflake round trip")
+    parser.add_argument("--db-jitter", type=float, default=0.25, help="uniform +/- fraction applied to the DB latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="stub LLM time to first token")
+    parser.add_argument("--llm-latency-distribution", default="lognormal", choices=("fixed", "uniform", "normal", "lognormal"))
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--caches", action="store_true", help="keep the LLM and intent caches enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request, seconds")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95/throughput regression vs the baseline")
+    parser.add_argument("--workdir", default=os.path.join("benchmarks", "results"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    os.makedirs(args.workdir, exist_ok=True)
+    configure_environment(args)
+
+    from backend import main
+    from benchmarks.snowflake_stub import FakeSnowflake
+
+    db = FakeSnowflake(users=args.users, latency_ms=args.db_latency_ms, jitter=args.db_jitter, seed=args.seed)
+    main.get_snowflake_connection = db.connect
+    provider = main.get_llm_provider()
+
+    server, thread = start_server(main.app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "workdir")},
+        "scenarios": {},
+    }
+    try:
+        for scenario in args.scenarios:
+            if args.warmup:
+                run_scenario(base_url, scenario, args.warmup, min(args.concurrency, args.warmup), args.users, db, provider, args.timeout)
+            stats = run_scenario(base_url, scenario, args.requests, args.concurrency, args.users, db, provider, args.timeout)
+            results["scenarios"][scenario] = stats
+            latency = stats["latency_ms"]
+            print(
+                f"{scenario:<14} {stats['throughput_rps']:>8} req/s  p50 {latency['p50']}ms  p95 {latency['p95']}ms  "
+                f"p99 {latency['p99']}ms  db/req {stats['db_calls_per_request']}  llm/req {stats['llm_calls_per_request']}  "
+                f"errors {stats['errors']}"
+            )
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    output = args.output or os.path.join(args.workdir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,236 @@
+"""
+In-memory stand-in for the Snowflake connector, used by the benchmark suite.
+
+Serves deterministic model_scores, shap_values and business_context data for
+the queries backend/main.py issues, with a simulated round-trip latency on
+every execute(). Queries are counted (connection health-check pings
+separately) so the benchmark can report database calls per request.
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Tuple
+
+OPPORTUNITY_TYPES = ("cross_sell", "upsell", "prospect", "churn_risk")
+SEGMENTS = ("healthcare", "finance", "retail", "manufacturing", "technology")
+TERRITORIES = ("west", "east", "central", "emea", "apac")
+FEATURES = ("usage_growth", "seat_utilization", "support_tickets", "nps", "contract_age", "feature_adoption", "spend_trend")
+SCORES_VERSION = "2024-01-01 00:00:00"
+
+_WHERE_COLUMN_PATTERN = re.compile(r"\b(user_id|opportunity_type|product_id|segment|territory|account_id)\s*=\s*%s")
+
+
+class FakeSnowflake:
+    """
+    Deterministic dataset plus query router.
+
+    - users x rows_per_list rows per opportunity type in model_scores
+    - every scored pair has SHAP values for all FEATURES and one business context
+    - latency_ms (+/- jitter fraction) is slept on every execute()
+    """
+
+    def __init__(self, users: int = 100, rows_per_list: int = 50, accounts: int = 500, products: int = 20,
+                 latency_ms: float = 20.0, jitter: float = 0.25, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self.queries = 0
+        self.pings = 0
+        self.connections = 0
+
+        # model_scores rows: (account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory)
+        self.lists: Dict[Tuple[str, str], List[tuple]] = {}
+        rng = random.Random(seed)
+        for u in range(users):
+            user_id = f"u{u}"
+            for opportunity_type in OPPORTUNITY_TYPES:
+                rows = []
+                for _ in range(rows_per_list):
+                    a, p = rng.randrange(accounts), rng.randrange(products)
+                    rows.append((f"A{a}", f"Account {a}", f"P{p}", f"Product {p}", round(rng.random(), 4),
+                                 opportunity_type, SEGMENTS[a % len(SEGMENTS)], TERRITORIES[a % len(TERRITORIES)]))
+                rows.sort(key=lambda row: (-row[4], row[0], row[2]))
+                self.lists[(user_id, opportunity_type)] = rows
+
+    def connect(self):
+        with self._counter_lock:
+            self.connections += 1
+        return FakeConnection(self)
+
+    def reset_counters(self):
+        with self._counter_lock:
+            self.queries = 0
+            self.pings = 0
+
+    def _sleep(self):
+        with self._rng_lock:
+            delay = self.latency_ms * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        time.sleep(max(0.0, delay) / 1000.0)
+
+    @staticmethod
+    def shap(account_id, product_id):
+        rng = random.Random(f"{account_id}|{product_id}")
+        values = [(feature, round(rng.uniform(-1, 1), 3)) for feature in FEATURES]
+        values.sort(key=lambda item: -abs(item[1]))
+        return values[:3]
+
+    @staticmethod
+    def context(account_id, product_id):
+        return f"{account_id} is expanding its team and evaluating tooling for {product_id} this quarter."
+
+    def execute(self, query: str, params: tuple) -> List[tuple]:
+        text = " ".join(query.split())
+        lowered = text.lower()
+        if lowered == "select 1":
+            with self._counter_lock:
+                self.pings += 1
+            return [(1,)]
+        with self._counter_lock:
+            self.queries += 1
+        self._sleep()
+
+        if lowered.startswith("with ranked"):
+            return self._summary(params)
+        if lowered.startswith("with scores") or "from model_scores s" in lowered:
+            return self._export(lowered, params)
+        if "from information_schema.tables" in lowered:
+            return [(SCORES_VERSION,)]
+        if "select distinct user_id, opportunity_type" in lowered:
+            types = set(params)
+            return sorted(key for key in self.lists if key[1] in types)
+        if "from shap_values" in lowered:
+            if "where" not in lowered:
+                pairs = sorted({(row[0], row[2]) for rows in self.lists.values() for row in rows})
+                return [(a, p, name, value) for a, p in pairs for name, value in self.shap(a, p)[:params[0]]]
+            if "in (" in lowered:
+                return [(a, p, name, value) for a, p in _pairs(params) for name, value in self.shap(a, p)]
+            return self.shap(*params)
+        if "from business_context" in lowered:
+            if "in (" in lowered:
+                return [(a, p, self.context(a, p)) for a, p in _pairs(params)]
+            return [(self.context(*params),)]
+        if lowered.startswith("select account_name, product_name"):
+            account_id, product_id = params
+            return [(f"Account {account_id.lstrip('A')}", f"Product {product_id.lstrip('P')}")]
+        if "from model_scores" in lowered and "where" not in lowered:
+            return [(user_id,) + (row[5], row[0], row[1], row[2], row[3], row[6], row[7], row[4])
+                    for (user_id, _), rows in self.lists.items() for row in rows]
+        if "partition by user_id" in lowered:
+            return self._scores_by_user(lowered, params)
+        if "from model_scores" in lowered:
+            return self._scores(lowered, params)
+        raise NotImplementedError(f"Benchmark Snowflake stub does not handle: {text[:120]}")
+
+    def _scores(self, lowered, params):
+        # The keyset condition of a browse page follows the equality filters
+        filters_part, keyset, _ = lowered.partition(" and (score < %s")
+        columns = _WHERE_COLUMN_PATTERN.findall(filters_part)
+        filters = dict(zip(columns, params))
+        rest = list(params[len(columns):])
+        after = None
+        if keyset:
+            score, _, account_id, _, product_id = rest[:5]
+            after, rest = (-score, account_id, product_id), rest[5:]
+        limit = rest[0] if "limit %s" in lowered else None
+        rows = self.lists.get((filters.pop("user_id", None), filters.pop("opportunity_type", None)), [])
+        index = {"account_id": 0, "product_id": 2, "segment": 6, "territory": 7}
+        rows = [row for row in rows if all(row[index[name]] == value for name, value in filters.items())]
+        if after is not None:
+            rows = [row for row in rows if (-row[4], row[0], row[2]) > after]
+        return rows[:limit] if limit is not None else rows
+
+    def _scores_by_user(self, lowered, params):
+        user_count = lowered.split("user_id in (", 1)[1].split(")", 1)[0].count("%s")
+        user_ids, rest = params[:user_count], params[user_count:]
+        columns = _WHERE_COLUMN_PATTERN.findall(lowered)
+        filters, top_n = dict(zip(columns, rest)), rest[len(columns)]
+        opportunity_type = filters.pop("opportunity_type")
+        index = {"account_id": 0, "product_id": 2, "segment": 6, "territory": 7}
+        out = []
+        for user_id in sorted(set(user_ids)):
+            rows = [row for row in self.lists.get((user_id, opportunity_type), [])
+                    if all(row[index[name]] == value for name, value in filters.items())]
+            out.extend((user_id,) + row for row in rows[:top_n])
+        return out
+
+    def _export(self, lowered, params):
+        filters = dict(zip(_WHERE_COLUMN_PATTERN.findall(lowered), params))
+        index = {"account_id": 0, "product_id": 2, "opportunity_type": 5, "segment": 6, "territory": 7}
+        out = []
+        for (user_id, _), rows in sorted(self.lists.items()):
+            if filters.get("user_id", user_id) != user_id:
+                continue
+            for row in rows:
+                if any(row[index[name]] != value for name, value in filters.items() if name != "user_id"):
+                    continue
+                record = (user_id, row[0], row[1], row[2], row[3], row[5], row[6], row[7], row[4])
+                if "top_shap" in lowered:
+                    record += tuple(value for feature in self.shap(row[0], row[2]) for value in feature)
+                out.append(record)
+        return out
+
+    def _summary(self, params):
+        out = []
+        for section in range(len(params) // 3):
+            user_id, opportunity_type, top_n = params[section * 3:section * 3 + 3]
+            for position, row in enumerate(self.lists.get((user_id, opportunity_type), [])[:top_n], 1):
+                context = self.context(row[0], row[2])
+                for name, value in self.shap(row[0], row[2]):
+                    out.append((section, position) + row + (context, name, value))
+        return out
+
+
+def _pairs(params):
+    return list(zip(params[0::2], params[1::2]))
+
+
+class FakeCursor:
+    def __init__(self, db: FakeSnowflake):
+        self._db = db
+        self._rows: List[tuple] = []
+
+    def execute(self, query, params=()):
+        self._rows = self._db.execute(query, tuple(params or ()))
+        return self
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetch_arrow_batches(self, batch_rows=10_000):
+        # Like the connector: Arrow tables with upper-case column names (requires pyarrow)
+        import pyarrow as pa
+
+        rows, self._rows = self._rows, []
+        for start in range(0, len(rows), batch_rows):
+            chunk = rows[start:start + batch_rows]
+            yield pa.Table.from_arrays([pa.array(list(column)) for column in zip(*chunk)], names=[f"C{i}" for i in range(len(chunk[0]))])
+
+    def close(self):
+        self._rows = []
+
+
+class FakeConnection:
+    def __init__(self, db: FakeSnowflake):
+        self._db = db
+        self._closed = False
+
+    def cursor(self):
+        return FakeCursor(self._db)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
@@ -0,0 +1,92 @@
+"""
+Concurrency test for /api/chat: requests must overlap on the event loop instead of serializing.
+
+Snowflake is replaced with a fake that sleeps, and the openai clients get an HTTP transport that
+sleeps and answers locally, so the test runs offline.
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.llm_provider import OpenAIProvider
+
+STEP_SECONDS = 0.3
+CONCURRENT_REQUESTS = 5
+
+
+def _completion(text):
+    return httpx.Response(200, json={
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    })
+
+
+async def _fake_async_api(request):
+    # The intent classifier is the only async caller
+    await asyncio.sleep(STEP_SECONDS)
+    return _completion(json.dumps({"intent": "summary"}))
+
+
+def _fake_api(request):
+    time.sleep(STEP_SECONDS)
+    return _completion("Strong product fit.")
+
+
+def _fake_summary_inputs(user_id):
+    time.sleep(STEP_SECONDS)
+    row = ("A1", "Account 1", "P1", "Product 1", 0.9, "cross_sell", "healthcare", "west")
+    sections = {"top_opportunities": [row], "top_risks": [row[:5] + ("churn_risk",) + row[6:]]}
+    return sections, {("A1", "P1"): [("usage_growth", 0.4)]}, {("A1", "P1"): "Expanding team."}
+
+
+def _raise_no_snowflake():
+    raise RuntimeError("Snowflake is not available in tests")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    real_sync, real_async = openai.OpenAI, openai.AsyncOpenAI
+    monkeypatch.setattr(openai, "OpenAI", lambda **kwargs: real_sync(http_client=httpx.Client(transport=httpx.MockTransport(_fake_api)), **kwargs))
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda **kwargs: real_async(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(_fake_async_api)), **kwargs
+    ))
+    monkeypatch.setattr(main, "llm_provider", OpenAIProvider(api_key="test-key"))
+    monkeypatch.setattr(main, "get_snowflake_connection", _raise_no_snowflake)
+    monkeypatch.setattr(main, "fetch_summary_inputs", _fake_summary_inputs)
+    monkeypatch.setattr(main, "fetch_precomputed", lambda *args: None)
+    monkeypatch.setattr(main, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(main, "get_intent_cache", lambda: None)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def _chat(client):
+    response = client.post("/api/chat", json={"message": "how am I doing this quarter?", "user_id": "u1", "history": []})
+    assert response.status_code == 200
+    assert "Top Opportunities:" in response.json()["response"]
+
+
+def test_concurrent_chat_requests_overlap(client):
+    # One request is three sequential steps: LLM intent classification, the Snowflake load, then the explanations
+    started = time.monotonic()
+    _chat(client)
+    single = time.monotonic() - started
+    assert single >= 3 * STEP_SECONDS
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as pool:
+        for future in [pool.submit(_chat, client) for _ in range(CONCURRENT_REQUESTS)]:
+            future.result()
+    elapsed = time.monotonic() - started
+
+    # Serialized requests would take CONCURRENT_REQUESTS * single; overlapping ones about one request's time
+    assert elapsed < 2 * single, f"{CONCURRENT_REQUESTS} concurrent chats took {elapsed:.2f}s vs {single:.2f}s for one"
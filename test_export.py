@@ -0,0 +1,77 @@
+"""
+/api/export/opportunities streams every matching model_scores row. The connector's Arrow batches
+are used when available, otherwise fetchmany(); both must produce the same NDJSON and CSV.
+
+Snowflake is the in-memory stand-in from the benchmark suite.
+"""
+
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import export, main
+from benchmarks.snowflake_stub import FakeConnection, FakeCursor, FakeSnowflake
+
+
+class NoArrowCursor(FakeCursor):
+    def fetch_arrow_batches(self):
+        # What the connector raises without its pandas/pyarrow extras
+        raise NotImplementedError("fetch_arrow_batches requires the pyarrow extra")
+
+
+class NoArrowConnection(FakeConnection):
+    def cursor(self):
+        return NoArrowCursor(self._db)
+
+
+@pytest.fixture(params=["arrow", "fetchmany"])
+def db(request, monkeypatch):
+    db = FakeSnowflake(users=3, rows_per_list=4, latency_ms=0)
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+        monkeypatch.setattr(main, "get_snowflake_connection", db.connect)
+    else:
+        monkeypatch.setattr(main, "get_snowflake_connection", lambda: NoArrowConnection(db))
+    return db
+
+
+def _expected(db, user_id=None, include_shap=False):
+    rows = []
+    for (row_user, _), scored in sorted(db.lists.items()):
+        if user_id not in (None, row_user):
+            continue
+        for account_id, account_name, product_id, product_name, score, opportunity_type, segment, territory in scored:
+            row = [row_user, account_id, account_name, product_id, product_name, opportunity_type, segment, territory, score]
+            if include_shap:
+                row += [value for feature in db.shap(account_id, product_id) for value in feature]
+            rows.append(row)
+    return rows
+
+
+@pytest.mark.parametrize("include_shap", [False, True])
+def test_ndjson_export(db, include_shap):
+    client = TestClient(main.app)
+    response = client.get("/api/export/opportunities", params={"format": "ndjson", "include_shap": include_shap})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    columns = export.export_columns(include_shap)
+    assert [list(record) for record in records[:1]] == [columns]
+    assert [[record[column] for column in columns] for record in records] == _expected(db, include_shap=include_shap)
+
+
+def test_csv_export(db, monkeypatch):
+    # Several batches, so the header must only be written once
+    monkeypatch.setattr(main, "EXPORT_BATCH_ROWS", 5)
+    client = TestClient(main.app)
+    response = client.get("/api/export/opportunities", params={"format": "csv", "user_id": "u1"})
+    assert response.status_code == 200
+    assert 'filename="opportunities_u1.csv"' in response.headers["content-disposition"]
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert header == export.SCORE_COLUMNS
+    expected = _expected(db, user_id="u1")
+    assert len(rows) == len(expected) == 16
+    assert rows == [[str(value) for value in row] for row in expected]
@@ -0,0 +1,86 @@
+"""
+Per-row fallback when a model call fails: the other rows keep their generated text and the
+failed row gets a placeholder, instead of the whole endpoint returning 500. An unparseable
+combined explanation/next-action response falls back to separate calls on the same digest.
+
+Snowflake is the in-memory stand-in from the benchmark suite; the model is a provider that
+rejects prompts about one account with a non-retryable 400.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.context_digest import ContextDigester
+from backend.llm_provider import Completion, LLMProvider, LLMProviderError
+from backend.metrics import LLM_FALLBACKS
+from benchmarks.snowflake_stub import FakeSnowflake
+
+
+class RejectingProvider(LLMProvider):
+    name = "test"
+
+    def __init__(self, rejected_account):
+        self.rejected_account = rejected_account
+
+    def complete(self, messages, model, max_tokens, temperature):
+        prompt = messages[-1]["content"]
+        if f"Account: {self.rejected_account}\n" in prompt:
+            raise LLMProviderError("This model's maximum context length was exceeded", 400)
+        return Completion("Strong product fit.", 10, 4)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSnowflake(users=2, rows_per_list=5, latency_ms=0)
+    rejected_account = db.lists[("u0", "churn_risk")][1][1]
+    monkeypatch.setattr(main, "get_snowflake_connection", db.connect)
+    monkeypatch.setattr(main, "db_pool", None)
+    monkeypatch.setattr(main, "opportunity_cache", None)
+    monkeypatch.setattr(main, "llm_provider", RejectingProvider(rejected_account))
+    monkeypatch.setattr(main, "fetch_precomputed", lambda *args: None)
+    monkeypatch.setattr(main, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(main, "get_shap_store", lambda: None)
+    return db
+
+
+def test_failed_row_gets_placeholder(db):
+    failures_before = LLM_FALLBACKS.value(reason="error")
+    with TestClient(main.app) as client:
+        response = client.get("/api/churn_risk", params={"user_id": "u0", "top_n": 3})
+    assert response.status_code == 200
+    explanations = [item["explanation"] for item in response.json()]
+    assert explanations == ["Strong product fit.", main.LLM_ERROR_MESSAGE, "Strong product fit."]
+    assert LLM_FALLBACKS.value(reason="error") == failures_before + 1
+
+
+class PlainTextProvider(LLMProvider):
+    """Answers every prompt, including the combined JSON one, with plain text."""
+
+    name = "test"
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, messages, model, max_tokens, temperature):
+        self.prompts.append(messages[-1]["content"])
+        return Completion("Strong product fit.", 10, 4)
+
+
+def test_invalid_combined_response_reuses_the_digest(monkeypatch):
+    provider = PlainTextProvider()
+    digester = ContextDigester(max_tokens=20)
+    monkeypatch.setattr(main, "llm_provider", provider)
+    monkeypatch.setattr(main, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(main, "get_context_digester", lambda: digester)
+    context = " ".join(f"Acme renewed {n} seats in Q{n % 4 + 1} and plans to expand its analytics team." for n in range(20))
+
+    insight = main.generate_explanation_and_next_action("Acme", "Analytics", "upsell", [("usage_growth", 0.4)], context, "A1", "P1")
+
+    assert insight == {"explanation": "Strong product fit.", "next_action": "Strong product fit."}
+    # One combined prompt plus the two fallback prompts, all with the same digest, digested once
+    assert len(provider.prompts) == 3
+    assert digester.stats()["prompts"] == 1
+    digest, report = digester.digest(context, key=("A1", "P1"))
+    assert report["tokens_saved"] > 0
+    assert all(f"- Business context: {digest}\n" in prompt for prompt in provider.prompts)
@@ -0,0 +1,88 @@
+"""
+OpenAIProvider against the openai 1.x client: real OpenAI/AsyncOpenAI objects whose HTTP
+transport is an httpx.MockTransport, so requests and response parsing go through the SDK.
+"""
+
+import asyncio
+import json
+
+import httpx
+import openai
+import pytest
+
+from backend.llm_provider import LLMProviderError, OpenAIProvider
+
+MESSAGES = [{"role": "user", "content": "Why is Acme a good fit?"}]
+
+
+def _completion_body(text):
+    return {
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 11, "completion_tokens": 3, "total_tokens": 14},
+    }
+
+
+def _stream_body(tokens):
+    events = []
+    for token in tokens:
+        chunk = {
+            "id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4",
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def _handler(request):
+    body = json.loads(request.content)
+    assert request.url.path.endswith("/chat/completions")
+    assert body["messages"] == MESSAGES
+    if body.get("stream"):
+        return httpx.Response(200, content=_stream_body(["Strong", " usage", " growth."]), headers={"content-type": "text/event-stream"})
+    return httpx.Response(200, json=_completion_body("Strong usage growth."))
+
+
+async def _async_handler(request):
+    return _handler(request)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    real_sync, real_async = openai.OpenAI, openai.AsyncOpenAI
+    monkeypatch.setattr(openai, "OpenAI", lambda **kwargs: real_sync(http_client=httpx.Client(transport=httpx.MockTransport(_handler)), **kwargs))
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda **kwargs: real_async(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(_async_handler)), **kwargs
+    ))
+    return OpenAIProvider(api_key="test-key")
+
+
+def test_complete(provider):
+    completion = provider.complete(MESSAGES, model="gpt-4", max_tokens=50, temperature=0.7)
+    assert completion.text == "Strong usage growth."
+    assert (completion.prompt_tokens, completion.completion_tokens) == (11, 3)
+
+
+def test_acomplete(provider):
+    completion = asyncio.run(provider.acomplete(MESSAGES, model="gpt-4", max_tokens=50, temperature=0.7))
+    assert completion.text == "Strong usage growth."
+    assert completion.prompt_tokens == 11
+
+
+def test_stream(provider):
+    assert list(provider.stream(MESSAGES, model="gpt-4", max_tokens=50, temperature=0.7)) == ["Strong", " usage", " growth."]
+
+
+def test_http_errors_keep_their_status(monkeypatch):
+    real_async = openai.AsyncOpenAI
+
+    async def rate_limited(request):
+        return httpx.Response(429, json={"error": {"message": "Rate limit reached", "type": "requests"}})
+
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda **kwargs: real_async(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(rate_limited)), **kwargs
+    ))
+    with pytest.raises(LLMProviderError) as error:
+        asyncio.run(OpenAIProvider(api_key="test-key").acomplete(MESSAGES, model="gpt-4", max_tokens=50, temperature=0.7))
+    assert error.value.status == 429
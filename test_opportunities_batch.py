@@ -0,0 +1,62 @@
+"""
+/api/opportunities/batch answers several users with one windowed query; each user's group must be
+what a single-user call returns, truncated to top_n.
+
+Snowflake is the in-memory stand-in from the benchmark suite; the model is the local stub provider,
+whose text depends only on the prompt.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.llm_provider import StubProvider
+from benchmarks.snowflake_stub import FakeSnowflake
+
+USERS = ["u2", "u0", "u9", "u1", "u0"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = FakeSnowflake(users=3, rows_per_list=8, latency_ms=0)
+    monkeypatch.setattr(main, "get_snowflake_connection", db.connect)
+    monkeypatch.setattr(main, "db_pool", None)
+    monkeypatch.setattr(main, "opportunity_cache", None)
+    monkeypatch.setattr(main, "OPPORTUNITY_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "scores_snapshot", None)
+    monkeypatch.setattr(main, "SCORES_SNAPSHOT_ENABLED", False)
+    monkeypatch.setattr(main, "llm_provider", StubProvider(latency_ms=0, tokens_per_second=0))
+    monkeypatch.setattr(main, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(main, "fetch_precomputed", lambda *args: None)
+    monkeypatch.setattr(main, "get_shap_store", lambda: None)
+    client = TestClient(main.app)
+    client.db = db
+    return client
+
+
+def _single(client, user_id, **params):
+    response = client.get("/api/opportunities", params={"user_id": user_id, "opportunity_type": "upsell", **params})
+    return [] if response.status_code == 404 else response.json()
+
+
+@pytest.mark.parametrize("filters", [{}, {"segment": "finance"}])
+def test_batch_matches_single_user_calls(client, filters):
+    client.db.reset_counters()
+    response = client.get("/api/opportunities/batch", params={"user_ids": USERS, "opportunity_type": "upsell", "top_n": 3, "explain": True, **filters})
+    assert response.status_code == 200
+    # One windowed query for the rows, then SHAP and context lookups for the explanations
+    assert client.db.queries == 3
+    users = response.json()["users"]
+    assert list(users) == list(dict.fromkeys(USERS))
+    assert users["u9"] == []
+    for user_id in ("u0", "u1", "u2"):
+        assert users[user_id] == _single(client, user_id, top_n=3, **filters)
+        assert len(users[user_id]) == min(3, sum(1 for row in client.db.lists[(user_id, "upsell")] if row[6] == filters.get("segment", row[6])))
+
+
+def test_batch_without_explanations(client):
+    response = client.get("/api/opportunities/batch", params={"user_ids": ["u0", "u1"], "opportunity_type": "upsell", "top_n": 5})
+    for user_id, items in response.json()["users"].items():
+        expected = client.db.lists[(user_id, "upsell")][:5]
+        assert [(item["account"], item["product"], item["score"]) for item in items] == [(row[1], row[3], row[4]) for row in expected]
+        assert all("explanation" not in item for item in items)
@@ -0,0 +1,30 @@
+"""
+SnapshotManager reloads model_scores only when the scores version changes (or on force),
+never just because the version probe can't be read.
+"""
+
+from backend.scores_snapshot import SnapshotBuilder, SnapshotManager
+
+
+def _loader(loads):
+    def load(version):
+        loads.append(version)
+        builder = SnapshotBuilder()
+        builder.add_batch({
+            "user_id": ["u0"], "opportunity_type": ["cross_sell"], "account_id": ["A1"], "account_name": ["Account 1"],
+            "product_id": ["P1"], "product_name": ["Product 1"], "segment": ["retail"], "territory": ["west"], "score": [0.5],
+        })
+        return builder.build(version=version, load_seconds=0.0)
+    return load
+
+
+def test_refresh_reloads_only_on_a_new_version():
+    loads, versions = [], iter(["v1", "v1", None, None, "v2"])
+    manager = SnapshotManager(_loader(loads), lambda: next(versions))
+    assert manager.refresh()
+    assert not manager.refresh()
+    assert not manager.refresh()
+    assert manager.snapshot.version == "v1"
+    assert manager.refresh(force=True)
+    assert manager.refresh()
+    assert loads == ["v1", None, "v2"]
@@ -0,0 +1,47 @@
+"""
+The default SCORES_VERSION_QUERY works against the stock model_scores schema, so the opportunity
+cache and the precompute job are usable without configuring a version query.
+
+Snowflake is the in-memory stand-in from the benchmark suite; the model is the local stub provider.
+"""
+
+import pytest
+
+from backend import main, precompute
+from backend.llm_provider import StubProvider
+from backend.precompute import InsightStore
+from benchmarks.snowflake_stub import SCORES_VERSION, FakeSnowflake
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    db = FakeSnowflake(users=2, rows_per_list=5, latency_ms=0)
+    monkeypatch.setattr(main, "get_snowflake_connection", db.connect)
+    monkeypatch.setattr(main, "db_pool", None)
+    monkeypatch.setattr(main, "opportunity_cache", None)
+    monkeypatch.setattr(main, "scores_snapshot", None)
+    monkeypatch.setattr(main, "llm_provider", StubProvider(latency_ms=0, tokens_per_second=0))
+    monkeypatch.setattr(main, "get_llm_cache", lambda: None)
+    monkeypatch.setattr(main, "SHAP_STORE_ENABLED", False)
+    monkeypatch.setattr(main, "SCORES_SNAPSHOT_ENABLED", False)
+    return db
+
+
+def test_default_version_query_enables_the_opportunity_cache(db):
+    assert main.current_scores_version() == SCORES_VERSION
+    first = main.fetch_opportunities("u0", "cross_sell", 3)
+    queries = db.queries
+    assert main.fetch_opportunities("u0", "cross_sell", 3) == first
+    assert db.queries == queries
+    assert main.get_opportunity_cache().stats()["hits"] == 1
+
+
+def test_precompute_runs_with_the_default_version_query(db, tmp_path):
+    store_path = str(tmp_path / "insights.sqlite3")
+    failed = precompute.run(store_path, str(tmp_path / "checkpoint.json"), top_n=3, workers=2, opportunity_types=("cross_sell", "churn_risk"))
+    assert failed == 0
+    store = InsightStore(store_path)
+    items = store.get("u1", "cross_sell", 3, main.current_scores_version())
+    assert [item["account_id"] for item in items] == [row[0] for row in db.lists[("u1", "cross_sell")][:3]]
+    assert all(item["explanation"] and item["next_action"] for item in items)
+    assert all(item["next_action"] is None for item in store.get("u1", "churn_risk", 3, SCORES_VERSION))
@@ -0,0 +1,69 @@
+"""
+SHAP store lookups: stored pairs come back exactly, colliding fingerprints are told apart by the
+stored key, and pairs the store doesn't have fall through to Snowflake.
+"""
+
+import pytest
+
+from backend import main, shap_store
+from backend.shap_store import ShapStore, ShapStoreBuilder
+from benchmarks.snowflake_stub import SCORES_VERSION, FakeSnowflake
+
+PAIRS = [(f"A{a}", f"P{p}") for a in range(40) for p in range(5)]
+
+
+def _build(path, pairs, version=None):
+    builder = ShapStoreBuilder(k=3)
+    for account_id, product_id in pairs:
+        builder.add(account_id, product_id, FakeSnowflake.shap(account_id, product_id))
+    builder.write(str(path), version)
+    return ShapStore(str(path))
+
+
+def test_lookups_round_trip(tmp_path):
+    store = _build(tmp_path / "shap.bin", PAIRS)
+    assert store.pairs == len(PAIRS)
+    for pair in PAIRS:
+        # Values keep full float64 precision, as Snowflake returns them
+        assert store.get(*pair) == FakeSnowflake.shap(*pair)
+    assert store.get("A1", "P99") is None
+    assert store.get("A99", "P1") is None
+
+
+def test_colliding_fingerprints_are_verified_by_key(tmp_path, monkeypatch):
+    # Every key gets the same fingerprint, so every lookup walks one probe chain
+    monkeypatch.setattr(shap_store, "_crc32", lambda key: 7)
+    monkeypatch.setattr(shap_store, "_adler32", lambda key: 7)
+    stored = PAIRS[:50]
+    store = _build(tmp_path / "shap.bin", stored + stored[:5])
+    assert store.pairs == len(stored)
+    for pair in stored:
+        assert store.get(*pair) == FakeSnowflake.shap(*pair)
+    for pair in PAIRS[50:60]:
+        assert store.get(*pair) is None
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    db = FakeSnowflake(users=2, rows_per_list=5, latency_ms=0)
+    monkeypatch.setattr(main, "get_snowflake_connection", db.connect)
+    monkeypatch.setattr(main, "db_pool", None)
+    monkeypatch.setattr(main, "opportunity_cache", None)
+    monkeypatch.setattr(main, "shap_store_file", None)
+    monkeypatch.setattr(main, "SHAP_STORE_ENABLED", True)
+    monkeypatch.setattr(main, "SHAP_STORE_PATH", str(tmp_path / "shap.bin"))
+    return db
+
+
+def test_store_misses_fall_back_to_snowflake(db):
+    stored, missing = PAIRS[:10], PAIRS[10:13]
+    _build(main.SHAP_STORE_PATH, stored, version=SCORES_VERSION)
+    assert main.get_shap_store() is not None
+
+    db.reset_counters()
+    assert main.fetch_shap_values_batch(stored) == {pair: FakeSnowflake.shap(*pair) for pair in stored}
+    assert db.queries == 0
+    assert main.fetch_shap_values_batch(stored + missing) == {pair: FakeSnowflake.shap(*pair) for pair in stored + missing}
+    assert db.queries == 1
+    assert [tuple(row) for row in main.fetch_shap_values(*missing[0])] == FakeSnowflake.shap(*missing[0])
+    assert db.queries == 2